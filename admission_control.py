@@ -0,0 +1,131 @@
+"""
+Admission Control for the ML API
+
+Per-endpoint limits that protect the server from overload:
+
+- max_in_flight: requests computed at the same time
+- max_queued: requests allowed to wait for a free slot; further requests are rejected
+  immediately with 429 and a Retry-After header
+- queue_timeout_ms: how long a queued request waits before giving up with 503
+- max_items: largest accepted request (413 above it)
+
+Admitted requests never share the CPU with more than max_in_flight others, so their
+latency stays predictable while excess load is turned away quickly.
+
+Usage:
+    admission = AdmissionController.from_env('lifespan', max_in_flight=4)
+    admission.check_items(len(items))
+    with admission.slot():
+        ...
+"""
+
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from api_metrics import metrics
+
+
+class AdmissionRejected(Exception):
+    """A request was turned away; carries the HTTP status and Retry-After seconds."""
+
+    def __init__(self, message, status, retry_after=None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Bounded concurrency with a bounded, time-limited wait queue for one endpoint.
+
+    Args:
+        name: Endpoint name used in environment variables and metric names
+        max_in_flight: Requests processed concurrently
+        max_queued: Requests allowed to wait for a slot (0 = reject when all slots are busy)
+        queue_timeout_ms: Longest time a request waits for a slot
+        max_items: Largest number of items per request (0 = no limit)
+    """
+
+    def __init__(self, name, max_in_flight=4, max_queued=16, queue_timeout_ms=2000, max_items=0):
+        self.name = name
+        self.max_in_flight = max_in_flight
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout_ms / 1000.0
+        self.max_items = max_items
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._lock = threading.Lock()
+        self._queued = 0
+
+    @classmethod
+    def from_env(cls, name, **defaults):
+        """
+        Build a controller whose limits can be overridden with ML_API_<NAME>_MAX_IN_FLIGHT,
+        _MAX_QUEUED, _QUEUE_TIMEOUT_MS and _MAX_ITEMS.
+        """
+        prefix = f'ML_API_{name.upper()}_'
+        settings = {}
+        for key in ('max_in_flight', 'max_queued', 'queue_timeout_ms', 'max_items'):
+            value = os.getenv(prefix + key.upper())
+            if value is not None:
+                settings[key] = int(value)
+            elif key in defaults:
+                settings[key] = defaults[key]
+        return cls(name, **settings)
+
+    def check_items(self, count):
+        """Reject requests with more than max_items items (413)."""
+        if self.max_items and count > self.max_items:
+            metrics.inc(f'{self.name}.admission.rejected.too_large')
+            raise AdmissionRejected(
+                f'Too many items in one request ({count}); the limit is {self.max_items}. Split the request into batches.',
+                status=413
+            )
+
+    @contextmanager
+    def slot(self):
+        """
+        Hold one of the max_in_flight slots for the duration of the block, queueing for
+        at most queue_timeout. Raises AdmissionRejected (429 when the queue is full,
+        503 when the wait times out).
+        """
+        if not self._slots.acquire(blocking=False):
+            self._wait_for_slot()
+        metrics.add_gauge(f'{self.name}.admission.in_flight', 1)
+        metrics.inc(f'{self.name}.admission.admitted')
+        try:
+            yield
+        finally:
+            metrics.add_gauge(f'{self.name}.admission.in_flight', -1)
+            self._slots.release()
+
+    def _wait_for_slot(self):
+        with self._lock:
+            if self._queued >= self.max_queued:
+                metrics.inc(f'{self.name}.admission.rejected.queue_full')
+                raise AdmissionRejected(
+                    f'{self.name} endpoint is at capacity, retry later', status=429, retry_after=self._retry_after()
+                )
+            self._queued += 1
+            metrics.set_gauge(f'{self.name}.admission.queue_depth', self._queued)
+
+        started = time.perf_counter()
+        try:
+            acquired = self._slots.acquire(timeout=self.queue_timeout)
+        finally:
+            with self._lock:
+                self._queued -= 1
+                metrics.set_gauge(f'{self.name}.admission.queue_depth', self._queued)
+        metrics.observe(f'{self.name}.admission.queue_wait_ms', (time.perf_counter() - started) * 1000)
+
+        if not acquired:
+            metrics.inc(f'{self.name}.admission.rejected.timeout')
+            raise AdmissionRejected(
+                f'{self.name} endpoint is overloaded, retry later', status=503, retry_after=self._retry_after()
+            )
+
+    def _retry_after(self):
+        """Seconds a rejected client should wait: roughly one queue timeout, at least 1."""
+        return max(1, math.ceil(self.queue_timeout))
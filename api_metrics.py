@@ -0,0 +1,94 @@
+"""
+In-process Metrics for the ML API
+
+A small thread-safe registry of counters, gauges and histograms. Components record
+into the shared `metrics` instance and ml_api_server.py exposes a snapshot at
+GET /metrics, so operational signals are available without extra dependencies.
+"""
+
+import bisect
+import threading
+
+# Default histogram bucket upper bounds (works for item counts and milliseconds)
+DEFAULT_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class Histogram:
+    """Fixed-bucket histogram with count/sum/min/max."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.bucket_counts = [0] * (len(self.buckets) + 1)  # last bucket is +Inf
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        self.bucket_counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def snapshot(self):
+        labels = [f"le_{b}" for b in self.buckets] + ['le_inf']
+        cumulative = 0
+        buckets = {}
+        for label, count in zip(labels, self.bucket_counts):
+            cumulative += count
+            buckets[label] = cumulative
+        return {
+            'count': self.count,
+            'sum': round(self.total, 3),
+            'mean': round(self.total / self.count, 3) if self.count else None,
+            'min': self.min,
+            'max': self.max,
+            'buckets': buckets,
+        }
+
+
+class MetricsRegistry:
+    """Thread-safe collection of named counters, gauges and histograms."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+
+    def inc(self, name, value=1):
+        """Increment a counter."""
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def set_gauge(self, name, value):
+        """Set a gauge to its current value."""
+        with self._lock:
+            self._gauges[name] = value
+
+    def add_gauge(self, name, delta):
+        """Adjust a gauge by delta (e.g. +1/-1 for in-flight counts)."""
+        with self._lock:
+            self._gauges[name] = self._gauges.get(name, 0) + delta
+
+    def observe(self, name, value, buckets=DEFAULT_BUCKETS):
+        """Record a value in a histogram (buckets are fixed on first use)."""
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram(buckets)
+            histogram.observe(value)
+
+    def snapshot(self):
+        """Return all metrics as a JSON-serializable dict."""
+        with self._lock:
+            return {
+                'counters': dict(self._counters),
+                'gauges': dict(self._gauges),
+                'histograms': {name: h.snapshot() for name, h in self._histograms.items()},
+            }
+
+
+# Shared registry used by the API server and its components
+metrics = MetricsRegistry()
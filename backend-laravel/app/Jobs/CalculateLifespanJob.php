@@ -121,9 +121,13 @@ public function handle(): void
                 ];
             }
             
+            // Delta mode only returns predictions that changed since the last run
+            $deltaMode = filter_var(env('PY_API_LIFESPAN_DELTA', false), FILTER_VALIDATE_BOOLEAN);
+            $endpoint = $deltaMode ? '/predict/items/lifespan/delta' : '/predict/items/lifespan';
+            
             // Call Python API
-            Log::info("Calling Python API at {$pythonApiUrl}/predict/items/lifespan");
-            $response = Http::timeout(30)->post("{$pythonApiUrl}/predict/items/lifespan", $payload);
+            Log::info("Calling Python API at {$pythonApiUrl}{$endpoint}");
+            $response = Http::timeout(30)->post("{$pythonApiUrl}{$endpoint}", $payload);
             
             if (!$response->successful()) {
                 throw new Exception("Python API request failed: " . $response->body());
@@ -136,10 +140,18 @@ public function handle(): void
             }
             
             if (!isset($result['predictions']) || empty($result['predictions'])) {
-                Log::warning('Python API returned no predictions.');
+                if ($deltaMode) {
+                    Log::info('No lifespan predictions changed since the last run.');
+                } else {
+                    Log::warning('Python API returned no predictions.');
+                }
                 return;
             }
             
+            if ($deltaMode) {
+                Log::info("Delta rescoring: {$result['rescored']} rescored, {$result['changed']} changed, {$result['unchanged_inputs']} unchanged.");
+            }
+            
             // Update items with predictions
             $updated = 0;
             $errors = [];
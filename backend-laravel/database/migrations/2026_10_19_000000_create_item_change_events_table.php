@@ -0,0 +1,71 @@
+<?php
+
+use Illuminate\Database\Migrations\Migration;
+use Illuminate\Database\Schema\Blueprint;
+use Illuminate\Support\Facades\DB;
+use Illuminate\Support\Facades\Schema;
+
+return new class extends Migration
+{
+    /**
+     * Run the migrations.
+     */
+    public function up(): void
+    {
+        // Queue of items whose lifespan prediction needs refreshing (consumed by lifespan_rescoring_worker.py)
+        Schema::create('item_change_events', function (Blueprint $table) {
+            $table->id();
+            $table->unsignedBigInteger('item_id')->index();
+            $table->string('reason', 50)->nullable();
+            $table->timestamp('created_at')->useCurrent();
+        });
+
+        if (DB::getDriverName() !== 'pgsql') {
+            return;
+        }
+
+        // Queue an event whenever a field the lifespan model reads changes.
+        // remaining_years / lifespan_estimate are not watched, so the worker's write-back queues nothing.
+        DB::statement("
+            CREATE OR REPLACE FUNCTION queue_item_change_event() RETURNS trigger AS $$
+            BEGIN
+                IF TG_TABLE_NAME = 'items' THEN
+                    INSERT INTO item_change_events (item_id, reason) VALUES (NEW.id, TG_TABLE_NAME);
+                ELSIF TG_OP = 'DELETE' THEN
+                    INSERT INTO item_change_events (item_id, reason) VALUES (OLD.item_id, TG_TABLE_NAME);
+                ELSE
+                    INSERT INTO item_change_events (item_id, reason) VALUES (NEW.item_id, TG_TABLE_NAME);
+                END IF;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql
+        ");
+
+        DB::statement("
+            CREATE TRIGGER items_queue_rescore
+            AFTER INSERT OR UPDATE OF category_id, condition_id, condition_number_id, date_acquired, maintenance_count, deleted_at
+            ON items
+            FOR EACH ROW EXECUTE PROCEDURE queue_item_change_event()
+        ");
+
+        DB::statement("
+            CREATE TRIGGER maintenance_records_queue_rescore
+            AFTER INSERT OR UPDATE OR DELETE ON maintenance_records
+            FOR EACH ROW EXECUTE PROCEDURE queue_item_change_event()
+        ");
+    }
+
+    /**
+     * Reverse the migrations.
+     */
+    public function down(): void
+    {
+        if (DB::getDriverName() === 'pgsql') {
+            DB::statement("DROP TRIGGER IF EXISTS items_queue_rescore ON items");
+            DB::statement("DROP TRIGGER IF EXISTS maintenance_records_queue_rescore ON maintenance_records");
+            DB::statement("DROP FUNCTION IF EXISTS queue_item_change_event()");
+        }
+
+        Schema::dropIfExists('item_change_events');
+    }
+};
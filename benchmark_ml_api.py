@@ -0,0 +1,315 @@
+"""
+Microbenchmarks for the ML API hot paths
+
+Times featurization, model inference and forecasting on synthetic payloads shaped
+like the real /predict requests, at batch sizes from 1 to 1,000,000 items. Each case
+records throughput, p50/p99 latency and peak traced memory; results are written to a
+JSON file that can be saved as a baseline and compared against later runs.
+
+Usage:
+    python benchmark_ml_api.py --output benchmark_baseline.json             # record a baseline
+    python benchmark_ml_api.py --compare benchmark_baseline.json            # flag regressions (exit 1)
+    python benchmark_ml_api.py --only manual_fallback,model_predict --max-size 100000
+
+Benchmarks:
+    prepare_features          lifespan_predictor.prepare_features_for_prediction
+    align_features            lifespan_predictor.align_features_with_model
+    model_predict             model.predict on aligned features (active model, or --model)
+    manual_fallback           lifespan_predictor.predict_manual
+    consumables_ols           consumables_forecaster.forecast_consumables (per-item OLS loop)
+    consumables_holt_winters  consumables_forecaster.forecast_consumables(method='holt_winters')
+    consumables_holt_short    the same on 1-3 quarter histories (batches narrower than one season)
+    simple_linear_regression  ml_api_server_simple.linear_regression, once per item
+
+The per-item forecasting loops are capped (see BENCHMARKS) so a default run finishes
+in minutes; pass --no-caps to run them at every size.
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from consumables_forecaster import forecast_consumables
+from lifespan_predictor import (align_features_with_model, load_lifespan_model, load_model_file,
+                                predict_manual, prepare_features_for_prediction)
+
+DEFAULT_SIZES = [1, 10, 100, 1000, 10000, 100000, 1000000]
+
+# Field values seen in real lifespan payloads (CalculateLifespanJob / the dashboards)
+CATEGORIES = ['Desktop', 'ICT', 'Laptop', 'Vehicle']
+LAST_REASONS = ['Wear', 'Overheat', 'Electrical', 'Physical Damage', 'Software Issue', 'Cleaning', 'Inspection', 'Other', '']
+CONDITION_STATUSES = ['Good', 'Less Reliable', 'Un-operational', 'Disposal']
+CONDITIONS = ['Serviceable', 'On Maintenance', 'Non-Serviceable']
+
+
+def make_lifespan_items(n, seed=0):
+    """Synthetic /predict/items/lifespan items."""
+    rng = np.random.default_rng(seed)
+    condition_numbers = rng.integers(1, 6, n).astype(object)
+    condition_numbers[rng.random(n) < 0.03] = 'R'
+    columns = {
+        'item_id': np.arange(1, n + 1).tolist(),
+        'category': rng.choice(CATEGORIES, n).tolist(),
+        'years_in_use': np.round(rng.gamma(2.0, 1.5, n), 2).tolist(),
+        'maintenance_count': rng.poisson(1.2, n).tolist(),
+        'condition_number': condition_numbers.tolist(),
+        'condition_status': rng.choice(CONDITION_STATUSES, n, p=[0.6, 0.25, 0.1, 0.05]).tolist(),
+        'condition': rng.choice(CONDITIONS, n, p=[0.8, 0.12, 0.08]).tolist(),
+        'last_reason': rng.choice(LAST_REASONS, n).tolist(),
+    }
+    names = list(columns)
+    return [dict(zip(names, row)) for row in zip(*columns.values())]
+
+
+def make_consumable_items(n, seed=0, max_quarters=12):
+    """Synthetic /predict/consumables/linear items with 1-max_quarters quarters of history."""
+    rng = np.random.default_rng(seed)
+    items = []
+    for item_id in range(1, n + 1):
+        quarters = int(rng.integers(1, max_quarters + 1))
+        base = rng.uniform(5, 200)
+        trend = rng.normal(0, base * 0.05)
+        usage = np.maximum(0, np.round(base + trend * np.arange(quarters) + rng.normal(0, base * 0.2, quarters)))
+        usage[rng.random(quarters) < 0.1] = 0
+        history = [
+            {'period': f"Q{q % 4 + 1} {2022 + q // 4}", 'timestamp': f"{2022 + q // 4}-{(q % 4) * 3 + 1:02d}-01", 'usage': int(u)}
+            for q, u in enumerate(usage)
+        ]
+        items.append({
+            'item_id': item_id,
+            'name': f'Consumable {item_id}',
+            'historical_data': history,
+            'forecast_features': {'avg_usage_per_quarter': float(usage.mean())},
+            'current_stock': int(rng.integers(0, 500)),
+        })
+    return items
+
+
+def setup_simple_linear_regression(n, model):
+    series = []
+    for item in make_consumable_items(n):
+        usage = [point['usage'] for point in item['historical_data'] if point['usage'] > 0]
+        series.append((list(range(len(usage))), usage))
+    return series
+
+
+def run_simple_linear_regression(series):
+    from ml_api_server_simple import linear_regression
+    return [linear_regression(X, y) for X, y in series]
+
+
+def setup_aligned_features(n, model):
+    df, _ = prepare_features_for_prediction(make_lifespan_items(n))
+    return align_features_with_model(df, model)
+
+
+# name -> (setup(n, model) -> argument, run(argument, model), needs model, default max size)
+BENCHMARKS = {
+    'prepare_features': (
+        lambda n, model: make_lifespan_items(n),
+        lambda items, model: prepare_features_for_prediction(items),
+        False, None,
+    ),
+    'align_features': (
+        lambda n, model: prepare_features_for_prediction(make_lifespan_items(n))[0],
+        lambda df, model: align_features_with_model(df, model),
+        True, None,
+    ),
+    'model_predict': (
+        setup_aligned_features,
+        lambda aligned, model: model.predict(aligned),
+        True, None,
+    ),
+    'manual_fallback': (
+        lambda n, model: make_lifespan_items(n),
+        lambda items, model: predict_manual(items),
+        False, None,
+    ),
+    'consumables_ols': (
+        lambda n, model: make_consumable_items(n),
+        lambda items, model: forecast_consumables(items),
+        False, 1000,
+    ),
+    'consumables_holt_winters': (
+        lambda n, model: make_consumable_items(n),
+        lambda items, model: forecast_consumables(items, method='holt_winters'),
+        False, 100000,
+    ),
+    'consumables_holt_short': (
+        lambda n, model: make_consumable_items(n, max_quarters=3),
+        lambda items, model: forecast_consumables(items, method='holt_winters'),
+        False, 100000,
+    ),
+    'simple_linear_regression': (
+        setup_simple_linear_regression,
+        lambda series, model: run_simple_linear_regression(series),
+        False, 100000,
+    ),
+}
+
+
+def measure(run, argument, model, n, repeats, max_seconds, track_memory):
+    """
+    Time one benchmark case. The first run is a warm-up unless it alone uses half the
+    time budget, in which case it is kept as the only sample.
+    """
+    start = time.perf_counter()
+    run(argument, model)
+    first = time.perf_counter() - start
+
+    timings = [first] if first > max_seconds / 2 else []
+    budget_end = time.perf_counter() + max_seconds
+    while len(timings) < repeats and (not timings or time.perf_counter() < budget_end):
+        start = time.perf_counter()
+        run(argument, model)
+        timings.append(time.perf_counter() - start)
+
+    peak_kb = None
+    if track_memory:
+        tracemalloc.start()
+        run(argument, model)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        peak_kb = round(peak / 1024, 1)
+
+    timings_ms = np.array(timings) * 1000
+    p50 = float(np.percentile(timings_ms, 50))
+    return {
+        'runs': len(timings),
+        'p50_ms': round(p50, 4),
+        'p99_ms': round(float(np.percentile(timings_ms, 99)), 4),
+        'throughput_items_per_s': round(n / (p50 / 1000), 1) if p50 > 0 else None,
+        'peak_memory_kb': peak_kb,
+    }
+
+
+def compare(results, baseline, args):
+    """
+    Compare this run with a baseline. Returns a list of regression messages.
+    """
+    failures = []
+    for name, cases in results.items():
+        for size, current in cases.items():
+            previous = baseline.get('results', {}).get(name, {}).get(size)
+            if previous is None:
+                continue
+            latency_limit = max(previous['p50_ms'] * (1 + args.max_latency_regression), args.latency_floor_ms)
+            if current['p50_ms'] > latency_limit:
+                failures.append(
+                    f"{name} @ {size}: p50 {current['p50_ms']:.3f} ms vs {previous['p50_ms']:.3f} ms "
+                    f"(limit {latency_limit:.3f} ms)"
+                )
+            if current['peak_memory_kb'] is not None and previous.get('peak_memory_kb') is not None:
+                memory_limit = max(previous['peak_memory_kb'] * (1 + args.max_memory_regression), args.memory_floor_kb)
+                if current['peak_memory_kb'] > memory_limit:
+                    failures.append(
+                        f"{name} @ {size}: peak memory {current['peak_memory_kb']:.0f} KB vs "
+                        f"{previous['peak_memory_kb']:.0f} KB (limit {memory_limit:.0f} KB)"
+                    )
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark ML API featurization, inference and forecasting')
+    parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)),
+                        type=lambda s: [int(x) for x in s.split(',')], help='Comma-separated batch sizes')
+    parser.add_argument('--max-size', type=int, default=None, help='Skip batch sizes above this')
+    parser.add_argument('--only', default=None, help='Comma-separated benchmark names to run')
+    parser.add_argument('--no-caps', action='store_true', help='Run the per-item forecasting loops at every size')
+    parser.add_argument('--model', default=None, help='Model file (.cbm or .npz); default: the API\'s active model')
+    parser.add_argument('--repeats', type=int, default=20, help='Timed runs per case (fewer if the time budget runs out)')
+    parser.add_argument('--max-seconds', type=float, default=5.0, help='Time budget per case')
+    parser.add_argument('--memory-max-size', type=int, default=100000,
+                        help='Measure peak memory only up to this batch size (tracemalloc is slow)')
+    parser.add_argument('--output', default=None, help='Write results as JSON (use as a baseline later)')
+    parser.add_argument('--compare', default=None, help='Baseline JSON to compare against')
+    parser.add_argument('--max-latency-regression', type=float, default=0.20, help='Allowed p50 increase (fraction)')
+    parser.add_argument('--max-memory-regression', type=float, default=0.20, help='Allowed peak memory increase (fraction)')
+    parser.add_argument('--latency-floor-ms', type=float, default=1.0,
+                        help='p50 latencies below this are never treated as regressions (timer noise)')
+    parser.add_argument('--memory-floor-kb', type=float, default=256,
+                        help='Peak memory below this is never treated as a regression')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    print("=" * 60)
+    print("ML API Microbenchmarks")
+    print("=" * 60)
+
+    names = args.only.split(',') if args.only else list(BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"Unknown benchmark(s): {', '.join(unknown)}. Choose from: {', '.join(BENCHMARKS)}")
+    sizes = [s for s in args.sizes if args.max_size is None or s <= args.max_size]
+
+    model = load_model_file(args.model) if args.model else load_lifespan_model()
+    model_label = args.model or (type(model).__name__ if model is not None else None)
+    print(f"Model: {model_label or 'not available (model benchmarks skipped)'}")
+    print()
+
+    results = {}
+    for name in names:
+        setup, run, needs_model, default_cap = BENCHMARKS[name]
+        if needs_model and model is None:
+            print(f"⏭️  {name}: skipped (no model)")
+            continue
+        cap = None if args.no_caps else default_cap
+        results[name] = {}
+        print(f"📊 {name}")
+        for n in sizes:
+            if cap is not None and n > cap:
+                print(f"   {n:>8}: skipped (above default cap {cap}, use --no-caps)")
+                continue
+            argument = setup(n, model)
+            result = measure(run, argument, model, n, args.repeats, args.max_seconds, n <= args.memory_max_size)
+            results[name][str(n)] = result
+            memory = f"{result['peak_memory_kb']:10.0f} KB" if result['peak_memory_kb'] is not None else '         - KB'
+            print(f"   {n:>8}: p50 {result['p50_ms']:10.3f} ms  p99 {result['p99_ms']:10.3f} ms  "
+                  f"{result['throughput_items_per_s'] or 0:12.0f} items/s  peak {memory}  ({result['runs']} runs)")
+            del argument
+
+    report = {
+        'meta': {
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'model': model_label,
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"\n💾 Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        failures = compare(results, baseline, args)
+        print()
+        print("=" * 60)
+        if failures:
+            print(f"REGRESSIONS against {args.compare}:")
+            for failure in failures:
+                print(f"   ❌ {failure}")
+            print("=" * 60)
+            sys.exit(1)
+        print(f"No regressions against {args.compare}")
+        print("=" * 60)
+
+
+if __name__ == '__main__':
+    main()
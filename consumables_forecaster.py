@@ -0,0 +1,296 @@
+"""
+Consumables Usage Forecasting
+
+Next-quarter usage forecasts for consumable items from their quarterly usage
+history. Shared by the API server (ml_api_server.py) and other callers so every
+path produces identical forecasts.
+"""
+
+from sklearn.linear_model import LinearRegression
+import numpy as np
+from datetime import datetime, timedelta
+import logging
+
+logger = logging.getLogger(__name__)
+
+FORECAST_METHODS = ('linear', 'holt_winters')
+
+# Quarters per seasonal cycle, and the smoothing parameter grid searched per item
+SEASON_LENGTH = 4
+SMOOTHING_ALPHAS = (0.1, 0.3, 0.5, 0.7, 0.9)
+SMOOTHING_BETAS = (0.05, 0.15, 0.3)
+SMOOTHING_GAMMAS = (0.05, 0.2, 0.4)
+
+def estimate_shortage_date(predicted_usage, current_stock):
+    """
+    Month ('%B %Y') the stock runs out at the predicted quarterly usage, or None when
+    that is more than 6 months away (or there is no usage or stock).
+    """
+    if predicted_usage > 0 and current_stock > 0:
+        # Estimate days until stock runs out
+        # Assumes usage is distributed evenly over 90 days (1 quarter)
+        daily_usage_rate = predicted_usage / 90
+        if daily_usage_rate > 0:
+            days_until_shortage = current_stock / daily_usage_rate
+            if days_until_shortage < 180:  # Only show if within 6 months
+                shortage_date_obj = datetime.now() + timedelta(days=int(days_until_shortage))
+                return shortage_date_obj.strftime('%B %Y')
+    return None
+
+def forecast_consumables(items, method='linear'):
+    """
+    Predict next quarter usage for each item using Linear Regression over its
+    non-zero historical quarters, falling back to averages when there is not
+    enough data.
+    
+    Args:
+        items: List of item dictionaries (item_id, name, historical_data,
+            forecast_features, current_stock) as sent to /predict/consumables/linear
+        method: 'linear' (default) or 'holt_winters' (see forecast_consumables_smoothing)
+    
+    Returns:
+        List of per-item forecast dicts
+    """
+    if method == 'holt_winters':
+        return forecast_consumables_smoothing(items)
+    if method != 'linear':
+        raise ValueError(f"Unknown forecast method: {method} (expected one of: {', '.join(FORECAST_METHODS)})")
+    
+    forecasts = []
+
+    for item in items:
+        item_id = item.get('item_id')
+        name = item.get('name', f'Item {item_id}')
+        historical_data = item.get('historical_data', [])
+        forecast_features = item.get('forecast_features', {})
+        current_stock = item.get('current_stock', 0)
+
+        if not historical_data:
+            avg_usage = forecast_features.get('avg_usage_per_quarter', 0)
+            logger.debug("No historical data for item %s (%s). Using average fallback: %s units. "
+                         "💡 To enable Linear Regression predictions: Add usage records (ItemUsage entries) for this item across multiple quarters",
+                         item_id, name, avg_usage)
+            forecasts.append({
+                'item_id': item_id,
+                'name': name,
+                'predicted_usage': round(avg_usage) if avg_usage else 0,
+                'confidence': 0.3,
+                'method': 'average_fallback',
+                'note': 'No historical usage data available - using average fallback method'
+            })
+            continue
+
+        # Extract usage values from historical data
+        usage_values = []
+        periods = []
+
+        for idx, data_point in enumerate(historical_data):
+            usage = data_point.get('usage', 0)
+            if usage > 0:  # Only include non-zero usage
+                usage_values.append(usage)
+                periods.append(idx)
+
+        # Need at least 2 data points for linear regression
+        if len(usage_values) < 2:
+            avg_usage = np.mean(usage_values) if usage_values else forecast_features.get('avg_usage_per_quarter', 0)
+            logger.debug("Insufficient data points (%d) for item %s (%s). Need at least 2 quarters of usage data for Linear Regression. "
+                         "Using average method: %.0f units. 💡 To get better predictions: Add usage records for at least 2 quarters (Q1-Q4)",
+                         len(usage_values), item_id, name, avg_usage)
+            forecasts.append({
+                'item_id': item_id,
+                'name': name,
+                'predicted_usage': round(avg_usage),
+                'confidence': 0.3,
+                'method': 'average',
+                'note': f'Using average method (only {len(usage_values)} data point(s) available, need 2+ for Linear Regression)'
+            })
+            continue
+
+        # Prepare data for Linear Regression
+        X = np.array(periods).reshape(-1, 1)  # Time periods (independent variable)
+        y = np.array(usage_values)  # Usage values (dependent variable)
+
+        # Train Linear Regression model
+        model = LinearRegression()
+        model.fit(X, y)
+
+        # Predict next quarter (next period)
+        next_period = len(periods)
+        predicted_usage = model.predict([[next_period]])[0]
+        predicted_usage = max(0, round(predicted_usage))  # Ensure non-negative
+
+        # Calculate R-squared (coefficient of determination) for confidence
+        y_pred = model.predict(X)
+        ss_residual = np.sum((y - y_pred) ** 2)
+        ss_total = np.sum((y - np.mean(y)) ** 2)
+
+        if ss_total > 0:
+            r_squared = 1 - (ss_residual / ss_total)
+        else:
+            r_squared = 0
+
+        # Convert R-squared to confidence (clamp between 0.3 and 0.95)
+        confidence = max(0.3, min(0.95, abs(r_squared)))
+
+        # Calculate potential shortage date (optional)
+        shortage_date = estimate_shortage_date(predicted_usage, current_stock)
+
+        # Get model parameters
+        slope = model.coef_[0] if len(model.coef_) > 0 else 0
+        intercept = model.intercept_ if hasattr(model, 'intercept_') else 0
+
+        forecasts.append({
+            'item_id': item_id,
+            'name': name,
+            'predicted_usage': int(predicted_usage),
+            'shortage_date': shortage_date,
+            'confidence': round(confidence, 2),
+            'r_squared': round(r_squared, 4),
+            'slope': round(slope, 2),
+            'intercept': round(intercept, 2),
+            'data_points': len(usage_values),
+            'method': 'linear_regression'
+        })
+
+        # Enhanced logging for consumables predictions
+        logger.debug("Forecast for item %s (%s): %s units (confidence: %.1f%%, R²: %.3f, data points: %d, potential shortage: %s)",
+                     item_id, name, predicted_usage, confidence * 100, r_squared, len(usage_values), shortage_date)
+
+    return forecasts
+
+def usage_series(items):
+    """
+    Quarterly usage of every item as a left-aligned padded array.
+    
+    Returns:
+        Tuple of (usage array (items, max quarters), quarters per item, non-zero quarters per item)
+    """
+    series = [[point.get('usage', 0) or 0 for point in item.get('historical_data') or []] for item in items]
+    lengths = np.array([len(values) for values in series], dtype=np.int64)
+    usage = np.zeros((len(items), max(1, int(lengths.max()) if len(items) else 1)))
+    mask = np.arange(usage.shape[1])[None, :] < lengths[:, None]
+    usage[mask] = [value for values in series for value in values]
+    return usage, lengths, ((usage > 0) & mask).sum(axis=1)
+
+def fit_smoothing(usage, lengths, season_length=SEASON_LENGTH):
+    """
+    Holt-Winters (additive seasonality) for items with two full seasons of history
+    and Holt (level + trend) for the rest, fitted to every item at once.
+    
+    Every (alpha, beta, gamma) combination of the grid runs as one more row of the
+    state arrays, so the recurrences are (combinations, items) array updates, one
+    per quarter. Each item keeps the combination with the smallest one-step-ahead
+    squared error.
+    
+    Returns:
+        Dict of per-item arrays: 'forecast' (next quarter), 'alpha', 'beta', 'gamma',
+        'seasonal' (bool) and 'r_squared' (of the one-step-ahead fits)
+    """
+    m = season_length
+    n, width = usage.shape
+    alphas, betas, gammas = (g.reshape(-1, 1) for g in np.meshgrid(
+        SMOOTHING_ALPHAS, SMOOTHING_BETAS, SMOOTHING_GAMMAS, indexing='ij'))
+    seasonal = lengths >= 2 * m
+    
+    # Initial states: Holt-Winters from the first two seasons, Holt from the first two quarters
+    first_season = usage[:, :m].mean(axis=1)
+    second_season = usage[:, m:2 * m].mean(axis=1) if width >= 2 * m else first_season
+    level = np.where(seasonal, first_season, usage[:, 0])
+    trend = np.where(seasonal, (second_season - first_season) / m, usage[:, min(1, width - 1)] - usage[:, 0])
+    season = np.zeros((n, m))
+    if seasonal.any():
+        # Only seasonal items' first season is read: shorter batches may be under m quarters wide
+        season[seasonal] = usage[seasonal, :m] - first_season[seasonal, None]
+    start = np.where(seasonal, m, 1)
+    
+    shape = (len(alphas), n)
+    level = np.broadcast_to(level, shape).copy()
+    trend = np.broadcast_to(trend, shape).copy()
+    season = np.broadcast_to(season, shape + (m,)).copy()
+    gamma = np.where(seasonal, gammas, 0.0)  # Holt items keep a zero seasonal term
+    sse = np.zeros(shape)
+    scored_values = np.zeros(n)
+    scored_squares = np.zeros(n)
+    scored_counts = np.zeros(n)
+    
+    for t in range(1, width):
+        active = (t >= start) & (t < lengths)
+        if not active.any():
+            continue
+        y = usage[:, t]
+        season_t = season[:, :, t % m]
+        error = y - (level + trend + season_t)
+        # The first Holt step reproduces its own initialization, so it is not scored
+        scored = active & ((t > start) | seasonal)
+        sse += np.where(scored, error * error, 0.0)
+        scored_values += np.where(scored, y, 0.0)
+        scored_squares += np.where(scored, y * y, 0.0)
+        scored_counts += scored
+        
+        new_level = alphas * (y - season_t) + (1 - alphas) * (level + trend)
+        new_trend = betas * (new_level - level) + (1 - betas) * trend
+        new_season = gamma * (y - new_level) + (1 - gamma) * season_t
+        level = np.where(active, new_level, level)
+        trend = np.where(active, new_trend, trend)
+        season[:, :, t % m] = np.where(active, new_season, season_t)
+    
+    best = sse.argmin(axis=0)
+    items = np.arange(n)
+    forecast = (level[best, items] + trend[best, items]
+                + season[best, items, lengths % m])
+    ss_total = scored_squares - scored_values ** 2 / np.maximum(scored_counts, 1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        r_squared = np.where(ss_total > 0, 1 - sse[best, items] / ss_total, 0.0)
+    return {
+        'forecast': forecast,
+        'alpha': alphas[best, 0],
+        'beta': betas[best, 0],
+        'gamma': np.where(seasonal, gammas[best, 0], np.nan),
+        'seasonal': seasonal,
+        'r_squared': r_squared,
+    }
+
+def forecast_consumables_smoothing(items):
+    """
+    Predict next quarter usage with exponential smoothing over each item's full
+    quarterly history (zero quarters included): recent quarters weigh more than old
+    ones, and items with at least two years of history get a seasonal term.
+    Items with fewer than 3 quarters or fewer than 2 non-zero quarters use the
+    linear method's rules instead.
+    
+    Returns:
+        List of per-item forecast dicts (same fields as forecast_consumables, with
+        smoothing parameters instead of slope and intercept)
+    """
+    usage, lengths, non_zero = usage_series(items)
+    eligible = np.flatnonzero((lengths >= 3) & (non_zero >= 2))
+    forecasts = [None] * len(items)
+    
+    fallback = np.setdiff1d(np.arange(len(items)), eligible)
+    for i, forecast in zip(fallback.tolist(), forecast_consumables([items[i] for i in fallback])):
+        forecasts[i] = forecast
+    if not len(eligible):
+        return forecasts
+    
+    fit = fit_smoothing(usage[eligible], lengths[eligible])
+    predicted = np.maximum(0, np.round(fit['forecast'])).astype(np.int64).tolist()
+    confidence = np.clip(fit['r_squared'], 0.3, 0.95).round(2).tolist()
+    r_squared = fit['r_squared'].round(4).tolist()
+    for j, i in enumerate(eligible.tolist()):
+        item = items[i]
+        item_id = item.get('item_id')
+        seasonal = bool(fit['seasonal'][j])
+        forecasts[i] = {
+            'item_id': item_id,
+            'name': item.get('name', f'Item {item_id}'),
+            'predicted_usage': predicted[j],
+            'shortage_date': estimate_shortage_date(predicted[j], item.get('current_stock', 0)),
+            'confidence': confidence[j],
+            'r_squared': r_squared[j],
+            'alpha': float(fit['alpha'][j]),
+            'beta': float(fit['beta'][j]),
+            'gamma': float(fit['gamma'][j]) if seasonal else None,
+            'data_points': int(lengths[eligible[j]]),
+            'method': 'holt_winters' if seasonal else 'holt'
+        }
+    return forecasts
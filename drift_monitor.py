@@ -0,0 +1,285 @@
+"""
+Feature Drift Monitor for Lifespan Predictions
+
+Compares the inputs and predictions the API sees with the training data the model
+was built from, so a stale model shows up in /metrics before users notice it.
+
+- train_lifespan_model.py saves a reference profile next to the model
+  (catboost_lifespan_model.drift.json): a histogram per numeric field
+  (years_in_use, maintenance_count, condition_number and the predicted
+  remaining_years) on quantile bin edges, and value counts per categorical field
+  (category, last_reason, condition_status, condition).
+- Every lifespan request adds its batch to live histograms on the same bins. No raw
+  requests are kept: memory is two windows of bin counts (the current window and
+  the one before it), so scores follow recent traffic.
+- PSI (population stability index) per field, and a binned KS statistic for the
+  numeric fields, are served at GET /drift/lifespan and published as gauges.
+
+PSI below 0.1 is usually read as stable, 0.1-0.25 as moderate drift and above 0.25
+as significant drift.
+
+Usage:
+    python drift_monitor.py --seed-from db_new.sql     # build a reference for the current model from a dump
+
+Environment:
+    ML_API_DRIFT_WINDOW_ITEMS   Items per live window (default 50000)
+"""
+
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from api_metrics import metrics
+from lifespan_predictor import item_column, map_unique
+
+logger = logging.getLogger(__name__)
+
+WINDOW_ITEMS = int(os.getenv('ML_API_DRIFT_WINDOW_ITEMS', '50000'))
+
+NUMERIC_FIELDS = ('years_in_use', 'maintenance_count', 'condition_number')
+CATEGORICAL_FIELDS = ('category', 'last_reason', 'condition_status', 'condition')
+PREDICTION_FIELD = 'remaining_years'
+
+# Live values not seen in training
+OTHER = '__other__'
+REFERENCE_BINS = 10
+PSI_EPSILON = 1e-4
+GAUGE_INTERVAL_S = 1.0
+
+
+def reference_path(model_path):
+    """Reference profile file that belongs to a model file."""
+    return os.path.splitext(model_path)[0] + '.drift.json'
+
+
+def numeric_values(column):
+    """Numeric field values as the featurization sees them (unparseable -> 0)."""
+    return pd.to_numeric(column, errors='coerce').fillna(0).to_numpy(dtype=np.float64)
+
+
+def categorical_normalizer(field):
+    """Normalize a categorical field the way prepare_features_for_prediction does."""
+    if field == 'last_reason':
+        return lambda value: str(value).strip().lower() or 'other'
+    return lambda value: str(value).strip()
+
+
+def build_reference_profile(items, predictions, model_sha256=None):
+    """
+    Reference profile from training items (list of dicts or DataFrame of raw fields)
+    and the model's remaining_years predictions for them.
+    """
+    profile = {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'rows': len(items),
+        'model_sha256': model_sha256,
+        'numeric': {},
+        'categorical': {},
+    }
+    numeric = {field: numeric_values(column_or_default(items, field, 0)) for field in NUMERIC_FIELDS}
+    numeric[PREDICTION_FIELD] = np.asarray(predictions, dtype=np.float64)
+    for field, values in numeric.items():
+        edges = np.unique(np.quantile(values, np.linspace(0, 1, REFERENCE_BINS + 1)[1:-1]))
+        counts = np.bincount(np.searchsorted(edges, values, side='right'), minlength=len(edges) + 1)
+        profile['numeric'][field] = {'edges': edges.tolist(), 'counts': counts.tolist()}
+
+    for field in CATEGORICAL_FIELDS:
+        column = column_or_default(items, field, 'Unknown')
+        normalized = pd.Series(map_unique(column, categorical_normalizer(field), 'None'))
+        counts = normalized.value_counts()
+        profile['categorical'][field] = {str(k): int(v) for k, v in counts.items()}
+    return profile
+
+
+def column_or_default(items, field, default):
+    column = item_column(items, field)
+    return column if column is not None else pd.Series([default] * len(items), dtype=object)
+
+
+def psi(expected, actual):
+    """Population stability index between two count vectors over the same bins."""
+    e = np.asarray(expected, dtype=np.float64)
+    a = np.asarray(actual, dtype=np.float64)
+    e = np.maximum(e / max(e.sum(), 1), PSI_EPSILON)
+    a = np.maximum(a / max(a.sum(), 1), PSI_EPSILON)
+    return float(np.sum((a - e) * np.log(a / e)))
+
+
+def binned_ks(expected, actual):
+    """Largest CDF gap between two count vectors over the same ordered bins."""
+    e = np.cumsum(expected) / max(np.sum(expected), 1)
+    a = np.cumsum(actual) / max(np.sum(actual), 1)
+    return float(np.max(np.abs(e - a)))
+
+
+def drift_status(score):
+    if score < 0.1:
+        return 'stable'
+    if score < 0.25:
+        return 'moderate'
+    return 'significant'
+
+
+class DriftMonitor:
+    """
+    Live histograms of lifespan inputs and predictions on a reference profile's bins.
+
+    Args:
+        profile: Reference profile (see build_reference_profile)
+        window_items: Items per window; scores use the current and previous window
+    """
+
+    def __init__(self, profile, window_items=WINDOW_ITEMS):
+        self.profile = profile
+        self.window_items = window_items
+        self._lock = threading.Lock()
+        self._edges = {f: np.asarray(p['edges']) for f, p in profile['numeric'].items()}
+        self._reference = {f: np.asarray(p['counts'], dtype=np.int64) for f, p in profile['numeric'].items()}
+        self._categories = {}
+        for field, counts in profile['categorical'].items():
+            values = [v for v in counts if v != OTHER] + [OTHER]
+            self._categories[field] = {v: i for i, v in enumerate(values)}
+            self._reference[field] = np.array([counts.get(v, 0) for v in values], dtype=np.int64)
+        self._current = self._empty_counts()
+        self._previous = self._empty_counts()
+        self._current_items = 0
+        self._last_gauges = 0.0
+
+    def _empty_counts(self):
+        return {field: np.zeros_like(counts) for field, counts in self._reference.items()}
+
+    def observe(self, items, predictions=None):
+        """
+        Add one batch (list of item dicts or DataFrame) and, when the model ran, its
+        remaining_years predictions.
+        """
+        if len(items) == 0:
+            return
+        batch = {}
+        for field, edges in self._edges.items():
+            if field == PREDICTION_FIELD:
+                if predictions is None:
+                    continue
+                values = np.asarray(predictions, dtype=np.float64)
+            else:
+                values = numeric_values(column_or_default(items, field, 0))
+            batch[field] = np.bincount(np.searchsorted(edges, values, side='right'), minlength=len(edges) + 1)
+        for field, index in self._categories.items():
+            normalize = categorical_normalizer(field)
+            other = index[OTHER]
+            codes = map_unique(column_or_default(items, field, 'Unknown'),
+                               lambda v: index.get(normalize(v), other), index.get('None', other))
+            batch[field] = np.bincount(codes.astype(np.int64), minlength=len(index))
+
+        with self._lock:
+            if self._current_items >= self.window_items:
+                self._previous, self._current = self._current, self._empty_counts()
+                self._current_items = 0
+            for field, counts in batch.items():
+                self._current[field] += counts
+            self._current_items += len(items)
+            publish = time.monotonic() - self._last_gauges >= GAUGE_INTERVAL_S
+            if publish:
+                self._last_gauges = time.monotonic()
+
+        if publish:
+            for field, score in self.scores()['fields'].items():
+                if score['psi'] is not None:
+                    metrics.set_gauge(f'drift.psi.{field}', score['psi'])
+                if score.get('ks') is not None:
+                    metrics.set_gauge(f'drift.ks.{field}', score['ks'])
+
+    def scores(self):
+        """PSI (and KS for numeric fields) per field over the current and previous windows."""
+        with self._lock:
+            live = {field: self._current[field] + self._previous[field] for field in self._reference}
+        fields = {}
+        for field, reference in self._reference.items():
+            observed = int(live[field].sum())
+            score = {'live_items': observed}
+            if observed == 0:
+                score.update(psi=None, status='no_data')
+            else:
+                score['psi'] = round(psi(reference, live[field]), 4)
+                score['status'] = drift_status(score['psi'])
+            if field in self._edges:
+                score['ks'] = round(binned_ks(reference, live[field]), 4) if observed else None
+            fields[field] = score
+        statuses = [s['status'] for s in fields.values() if s['status'] != 'no_data']
+        overall = max(statuses, key=['stable', 'moderate', 'significant'].index) if statuses else 'no_data'
+        return {'status': overall, 'fields': fields}
+
+
+_monitor = None
+_monitor_source = None
+_monitor_lock = threading.Lock()
+
+
+def get_drift_monitor():
+    """
+    Drift monitor for the active lifespan model's reference profile, or None when
+    the model has no profile.
+    """
+    global _monitor, _monitor_source
+    import lifespan_predictor
+
+    model_path = lifespan_predictor.lifespan_model_path
+    if model_path is None:
+        return None
+    path = reference_path(model_path)
+    with _monitor_lock:
+        if _monitor_source != path:
+            _monitor_source = path
+            _monitor = None
+            if os.path.exists(path):
+                with open(path, encoding='utf-8') as f:
+                    _monitor = DriftMonitor(json.load(f))
+                logger.info(f"✅ Drift monitor using reference profile: {path}")
+            else:
+                logger.warning(f"⚠️ No drift reference profile at {path}. Retrain, or run: python drift_monitor.py")
+        return _monitor
+
+
+def save_reference_profile(profile, path):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(profile, f, indent=2)
+    return path
+
+
+def main():
+    """
+    Build a reference profile for an existing model from a database dump, using the
+    same feature query as batch scoring.
+    """
+    import sqlite3
+
+    from lifespan_predictor import load_model_file, predict_lifespan
+    from lifespan_tree_evaluator import file_sha256
+    from score_lifespan_items import read_items, seed_sqlite
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description='Build a drift reference profile for a lifespan model')
+    parser.add_argument('--seed-from', default='db_new.sql', help='pg_dump file with the reference items')
+    parser.add_argument('--model', default='catboost_lifespan_model.cbm', help='Model the profile belongs to')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(':memory:')
+    seed_sqlite(conn, args.seed_from)
+    items = read_items(conn, 'sqlite')
+    result = predict_lifespan(items, load_model_file(args.model))
+    sha = file_sha256(args.model) if args.model.endswith('.cbm') else None
+    path = save_reference_profile(build_reference_profile(items, result['remaining_years'], sha),
+                                  reference_path(args.model))
+    logger.info(f"✅ Reference profile for {len(items)} items written to {path}")
+
+
+if __name__ == '__main__':
+    main()
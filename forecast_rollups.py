@@ -0,0 +1,136 @@
+"""
+Grouped Rollups of Forecasts
+
+Chart-ready summaries of lifespan predictions and consumables forecasts, so the
+frontend receives a few rows per category, location or quarter instead of every
+item. Group keys are factorized to integer codes once; every total, mean and
+at-risk count is then a single np.bincount over those codes.
+
+Quarter grouping means "when does this become a problem":
+- lifespan: the quarter an item reaches the end of its life (today + remaining_years;
+  disposal items count in the current quarter)
+- consumables: the quarter stock is expected to run out at the forecast usage rate
+  ('none' when no usage is forecast)
+
+Environment:
+    ML_API_AT_RISK_YEARS   Items with at most this many remaining years are at risk (default 1.0)
+"""
+
+import os
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from lifespan_predictor import item_column
+
+GROUP_BY = ('category', 'location', 'quarter')
+AT_RISK_YEARS = float(os.getenv('ML_API_AT_RISK_YEARS', '1.0'))
+NO_QUARTER = 'none'
+
+
+def field_keys(items, field):
+    """Group keys from one request field (missing or empty -> 'Unknown')."""
+    column = item_column(items, field)
+    if column is None:
+        return np.full(len(items), 'Unknown', dtype=object)
+    keys = column.astype(object).where(column.notna(), 'Unknown').astype(str).str.strip()
+    return keys.where(keys != '', 'Unknown').to_numpy(dtype=object)
+
+
+def quarter_keys(days_ahead, today=None):
+    """
+    'YYYY-Qn' labels for today + days_ahead (NaN -> NO_QUARTER). Dates are coded as
+    integer quarter numbers and only the distinct ones are formatted.
+    """
+    days_ahead = np.asarray(days_ahead, dtype=np.float64)
+    known = np.isfinite(days_ahead)
+    start = np.datetime64(today or date.today(), 'D')
+    dates = start + np.where(known, days_ahead, 0).astype('timedelta64[D]')
+    months = dates.astype('datetime64[M]').astype(np.int64)
+    quarter_numbers = np.where(known, months // 3, -1)
+    codes, uniques = pd.factorize(quarter_numbers)
+    labels = np.array([f"{1970 + q // 4}-Q{q % 4 + 1}" if q >= 0 else NO_QUARTER for q in uniques], dtype=object)
+    return labels[codes]
+
+
+def grouped_rollup(keys, sums=None, means=None, flags=None):
+    """
+    Reduce per-item arrays by group.
+
+    Args:
+        keys: Group key per item
+        sums: Dict of output name -> per-item values to total
+        means: Dict of output name -> per-item values to average (NaN values are skipped)
+        flags: Dict of output name -> per-item booleans to count
+
+    Returns:
+        List of one dict per group (sorted by key) with 'key', 'items' and the
+        requested totals, means and counts
+    """
+    codes, labels = pd.factorize(pd.Series(keys, dtype=object), sort=True)
+    n = len(labels)
+    columns = {'items': np.bincount(codes, minlength=n)}
+    for name, values in (sums or {}).items():
+        columns[name] = np.bincount(codes, weights=np.asarray(values, dtype=np.float64), minlength=n).round(2)
+    for name, values in (means or {}).items():
+        values = np.asarray(values, dtype=np.float64)
+        present = ~np.isnan(values)
+        totals = np.bincount(codes[present], weights=values[present], minlength=n)
+        counts = np.bincount(codes[present], minlength=n)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means_by_group = np.where(counts > 0, totals / np.maximum(counts, 1), np.nan).round(2)
+        columns[name] = [None if np.isnan(v) else v for v in means_by_group.tolist()]
+    for name, mask in (flags or {}).items():
+        columns[name] = np.bincount(codes, weights=np.asarray(mask, dtype=np.float64), minlength=n).astype(np.int64)
+
+    lists = {name: values if isinstance(values, list) else values.tolist() for name, values in columns.items()}
+    return [
+        {'key': label, **{name: values[i] for name, values in lists.items()}}
+        for i, label in enumerate(labels.tolist())
+    ]
+
+
+def lifespan_rollup(items, result, group_by, at_risk_years=AT_RISK_YEARS):
+    """
+    Group predict_lifespan() output by category, location or end-of-life quarter.
+    """
+    remaining = np.asarray(result['remaining_years'], dtype=np.float64)
+    years_in_use = np.asarray(result['years_in_use'], dtype=np.float64)
+    disposal = np.asarray(result['disposal_flag'], dtype=bool)
+    if group_by == 'quarter':
+        keys = quarter_keys(remaining * 365.25)
+    else:
+        keys = field_keys(items, group_by)
+    return grouped_rollup(
+        keys,
+        sums={'total_remaining_years': remaining},
+        means={'mean_remaining_years': remaining, 'mean_lifespan_estimate': years_in_use + remaining},
+        flags={'at_risk_items': disposal | (remaining <= at_risk_years), 'disposal_items': disposal},
+    )
+
+
+def consumables_rollup(items, forecasts, group_by):
+    """
+    Group forecast_consumables() output by category, location or stock-out quarter.
+    Items are at risk when the forecast usage is at least the current stock.
+    """
+    predicted = np.array([f.get('predicted_usage') or 0 for f in forecasts], dtype=np.float64)
+    confidence = np.array([f.get('confidence', np.nan) for f in forecasts], dtype=np.float64)
+    stock_column = item_column(items, 'current_stock')
+    stock = (pd.to_numeric(stock_column, errors='coerce').fillna(0).to_numpy(dtype=np.float64)
+             if stock_column is not None else np.zeros(len(forecasts)))
+    linear = np.array([f.get('method') == 'linear_regression' for f in forecasts], dtype=bool)
+    if group_by == 'quarter':
+        # Days until stock runs out at the forecast quarterly rate (same rule as shortage_date)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            days = np.where(predicted > 0, stock / (predicted / 90), np.nan)
+        keys = quarter_keys(days)
+    else:
+        keys = field_keys(items, group_by)
+    return grouped_rollup(
+        keys,
+        sums={'total_predicted_usage': predicted, 'total_current_stock': stock},
+        means={'mean_confidence': confidence},
+        flags={'at_risk_items': (predicted > 0) & (predicted >= stock), 'linear_regression_items': linear},
+    )
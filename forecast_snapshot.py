@@ -0,0 +1,632 @@
+"""
+Materialized Forecast Snapshot
+
+Dashboards ask for the same consumables forecasts and lifespan predictions on every
+page view, while the data behind them changes a few times a day. The snapshot
+builder precomputes both for the whole catalog into one binary file; the API
+memory-maps it and answers items from it, computing live only what the snapshot
+cannot answer.
+
+File layout (all arrays little-endian, 64-byte aligned):
+
+    b'IRGSNAP1' | uint64 header length | JSON header | per section:
+        item_ids      int64[n]   sorted
+        fingerprints  uint64[n]  digest of the inputs the result depends on
+        offsets       int64[n+1] record boundaries in the blob
+        blob          JSON-encoded result record per item
+
+A snapshot record is used only when the item_id is present, the fingerprint of the
+request's inputs matches (so changed usage, stock or condition are computed live),
+the snapshot is younger than ML_API_SNAPSHOT_MAX_AGE_HOURS and, for lifespan, it
+was built with the active model. Fields that only echo the request (item_id, name)
+or are derived from it (years_in_use, lifespan_estimate) are taken from the request.
+
+Fingerprints cover what the result actually depends on, so the builder and the real
+callers agree even though they do not send identical values:
+
+- lifespan: the item's aligned feature vector as the model sees it, with every
+  numeric feature replaced by its position among the model's split borders (a
+  fractional years_in_use that moves a little every day keeps its fingerprint until
+  it crosses a border), plus the disposal rule's inputs
+- consumables: the per-quarter usage history, the fallback average and the stock
+
+The builder reads the catalog the way the Laravel callers build their requests
+(CalculateLifespanJob / the life-cycles report for lifespan, UsageController's
+forecast-data for consumables). --check replays a captured request body against a
+snapshot and reports its hit rate.
+
+Usage:
+    python forecast_snapshot.py                              # catalog from PostgreSQL (DB_* env vars)
+    python forecast_snapshot.py --seed-from db_new.sql       # catalog from a pg_dump file
+    python forecast_snapshot.py --out /srv/ml/forecast_snapshot.bin
+    python forecast_snapshot.py --check request.json --section lifespan
+                                                             # hit rate of a captured request body
+
+Environment (API side):
+    ML_API_SNAPSHOT_PATH            Snapshot file (default forecast_snapshot.bin next to this file)
+    ML_API_SNAPSHOT_MAX_AGE_HOURS   Older snapshots are ignored (default 24)
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import mmap
+import os
+import re
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+from dateutil.relativedelta import relativedelta
+
+from api_metrics import metrics
+from lifespan_db import ITEM_FEATURE_JOINS, NON_CONSUMABLE_ITEMS_FILTER
+from lifespan_predictor import align_features_with_model, disposal_mask, prepare_features_for_prediction
+from lifespan_tree_evaluator import split_borders_by_feature
+from wire_formats import dumps_json
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_PATH = os.getenv('ML_API_SNAPSHOT_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'forecast_snapshot.bin'))
+MAX_AGE_S = float(os.getenv('ML_API_SNAPSHOT_MAX_AGE_HOURS', '24')) * 3600
+
+MAGIC = b'IRGSNAP1'
+ALIGN = 64
+# How often the API checks whether the file was replaced
+RELOAD_CHECK_S = 10.0
+
+# Request fields each result depends on (besides the echoed item_id / name)
+LIFESPAN_INPUTS = ('category', 'years_in_use', 'maintenance_count', 'condition_number',
+                   'condition_status', 'condition', 'last_reason')
+ECHOED_FIELDS = ('item_id', 'name')
+# Lifespan fields computed from the request's years_in_use rather than stored
+DERIVED_FIELDS = ('years_in_use', 'lifespan_estimate')
+
+PERIOD_PATTERN = re.compile(r'Q([1-4])\s+(\d{4})')
+# Years of usage history UsageController::getForecastData sends (the dashboards ask for 3)
+DEFAULT_YEARS_BACK = 3
+
+
+def lifespan_fingerprint(item):
+    """Digest of an item's raw lifespan inputs (what the manual calculation reads)."""
+    return _digest([item.get(field) for field in LIFESPAN_INPUTS])
+
+
+def lifespan_fingerprints(items, model=None):
+    """
+    Fingerprints of what each item's lifespan prediction depends on (uint64 array).
+
+    With a model: the aligned feature vector, numeric values bucketed by the model's
+    split borders, plus the disposal flag - equal fingerprints mean equal predictions.
+    Without one the raw inputs are digested (the manual calculation is continuous).
+    """
+    if model is None or len(items) == 0:
+        rows = items.to_dict(orient='records') if hasattr(items, 'to_dict') else items
+        return np.array([lifespan_fingerprint(item) for item in rows], dtype=np.uint64)
+
+    df, _ = prepare_features_for_prediction(items)
+    aligned = align_features_with_model(df, model)
+    features = aligned.to_numpy(dtype=np.float32)
+    borders = model_split_borders(model)
+    if borders is None:
+        # Exact values when the split borders cannot be read
+        key = features.view(np.int32)
+    else:
+        key = np.zeros(features.shape, dtype=np.int32)
+        for j, name in enumerate(aligned.columns):
+            if name in borders:
+                # Number of borders the value is above, i.e. the splits it fires
+                key[:, j] = np.searchsorted(borders[name], features[:, j], side='left')
+    key = np.column_stack([key, disposal_mask(items).astype(np.int32)])
+    # Few distinct bucket patterns: hash each once
+    patterns, inverse = np.unique(key, axis=0, return_inverse=True)
+    digests = np.array([_digest_bytes(row.tobytes()) for row in patterns], dtype=np.uint64)
+    return digests[inverse.reshape(-1)]
+
+
+_borders_cache = {}
+_borders_lock = threading.Lock()
+
+
+def model_split_borders(model):
+    """split_borders_by_feature() for a model, computed once per model object (None if unreadable)."""
+    with _borders_lock:
+        cached = _borders_cache.get(id(model))
+        if cached is None or cached[0] is not model:
+            try:
+                borders = split_borders_by_feature(model)
+            except Exception as e:
+                logger.warning(f"⚠️ Could not read split borders, fingerprinting exact feature values: {e}")
+                borders = None
+            cached = _borders_cache[id(model)] = (model, borders)
+        return cached[1]
+
+
+def consumables_fingerprint(item):
+    history = item.get('historical_data') or []
+    return _digest([
+        [_number(point.get('usage', 0)) for point in history],
+        _number((item.get('forecast_features') or {}).get('avg_usage_per_quarter', 0)) if not history else None,
+        _number(item.get('current_stock', 0)),
+    ])
+
+
+def _number(value):
+    """Numbers as floats, so 5 and 5.0 (same forecast) fingerprint alike."""
+    return float(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else value
+
+
+def consumables_fingerprints(items, model=None):
+    return np.array([consumables_fingerprint(item) for item in items], dtype=np.uint64)
+
+
+FINGERPRINTS = {
+    'lifespan': lifespan_fingerprints,
+    'consumables': consumables_fingerprints,
+}
+
+
+def _digest(values):
+    return _digest_bytes(json.dumps(values, default=str, separators=(',', ':')).encode('utf-8'))
+
+
+def _digest_bytes(encoded):
+    return int.from_bytes(hashlib.blake2b(encoded, digest_size=8).digest(), 'little')
+
+
+def request_years_in_use(item):
+    """years_in_use as the featurizer reads it (non-numeric -> 0)."""
+    try:
+        years = float(item.get('years_in_use', 0))
+    except (TypeError, ValueError):
+        return 0.0
+    return 0.0 if np.isnan(years) else years
+
+
+def refresh_derived_fields(record, item):
+    """Set years_in_use / lifespan_estimate of a stored lifespan record from the request item."""
+    years = request_years_in_use(item)
+    # Rounded like prediction_records()
+    record['years_in_use'] = round(years, 1)
+    if record.get('method') == 'manual_calculation_fallback' and not record.get('disposal_flag'):
+        record['lifespan_estimate'] = float(np.round(years + record['remaining_years'], 1))
+    else:
+        record['lifespan_estimate'] = round(years + record['remaining_years'], 1)
+    return record
+
+
+def _pad(f):
+    f.write(b'\0' * (-f.tell() % ALIGN))
+
+
+def write_snapshot(path, sections, model_sha256=None, model=None):
+    """
+    Write a snapshot atomically (temp file + rename, so a serving API never sees a
+    partial file).
+
+    Args:
+        sections: Dict of section name -> list of (request item, result record)
+        model_sha256: Version of the lifespan model the predictions came from
+        model: That model (lifespan fingerprints depend on its split borders)
+    """
+    encoded = {}
+    for name, pairs in sections.items():
+        pairs = sorted(pairs, key=lambda pair: pair[0]['item_id'])
+        stored = ECHOED_FIELDS + (DERIVED_FIELDS if name == 'lifespan' else ())
+        records = [dumps_json({k: v for k, v in record.items() if k not in stored}) for _, record in pairs]
+        encoded[name] = (
+            np.array([item['item_id'] for item, _ in pairs], dtype='<i8'),
+            FINGERPRINTS[name]([item for item, _ in pairs], model).astype('<u8'),
+            np.concatenate([[0], np.cumsum([len(r) for r in records])]).astype('<i8'),
+            b''.join(records),
+        )
+
+    header = {
+        'created_at': time.time(),
+        'model_sha256': model_sha256,
+        'sections': {name: {'count': len(ids)} for name, (ids, _, _, _) in encoded.items()},
+    }
+    # Offsets depend on the header length, so lay the sections out after sizing it
+    header_bytes = json.dumps(header).encode('utf-8') + b' ' * 512
+    position = len(MAGIC) + 8 + len(header_bytes)
+    for name, (ids, fingerprints, offsets, blob) in encoded.items():
+        layout = header['sections'][name]
+        for key, size in (('ids', ids.nbytes), ('fingerprints', fingerprints.nbytes),
+                          ('offsets', offsets.nbytes), ('blob', len(blob))):
+            position += -position % ALIGN
+            layout[key] = position
+            position += size
+    body = json.dumps(header).encode('utf-8')
+    assert len(body) <= len(header_bytes), 'snapshot header outgrew its reserved space'
+    header_bytes = body + b' ' * (len(header_bytes) - len(body))
+
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(len(header_bytes).to_bytes(8, 'little'))
+        f.write(header_bytes)
+        for ids, fingerprints, offsets, blob in encoded.values():
+            for part in (ids.tobytes(), fingerprints.tobytes(), offsets.tobytes(), blob):
+                _pad(f)
+                f.write(part)
+    os.replace(tmp_path, path)
+    return header
+
+
+class ForecastSnapshot:
+    """Read-only view of a snapshot file."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            raise ValueError(f'{path} is not a forecast snapshot')
+        header_length = int.from_bytes(self._mmap[len(MAGIC):len(MAGIC) + 8], 'little')
+        start = len(MAGIC) + 8
+        self.header = json.loads(self._mmap[start:start + header_length])
+        self.created_at = self.header['created_at']
+        self.model_sha256 = self.header.get('model_sha256')
+        self._sections = {}
+        for name, layout in self.header['sections'].items():
+            n = layout['count']
+            self._sections[name] = (
+                np.frombuffer(self._mmap, dtype='<i8', count=n, offset=layout['ids']),
+                np.frombuffer(self._mmap, dtype='<u8', count=n, offset=layout['fingerprints']),
+                np.frombuffer(self._mmap, dtype='<i8', count=n + 1, offset=layout['offsets']),
+                layout['blob'],
+            )
+
+    def age_s(self):
+        return time.time() - self.created_at
+
+    def item_ids(self, section):
+        """item_ids a section has records for (sorted int64 array)."""
+        return self._sections[section][0] if section in self._sections else np.array([], dtype='<i8')
+
+    def lookup(self, section, items, model=None):
+        """
+        Snapshot results for a list of request items (model: the active lifespan
+        model, which the lifespan fingerprints depend on).
+
+        Returns:
+            List with the result record for every item the snapshot can answer and
+            None for the rest (unknown item_id or changed inputs)
+        """
+        results = [None] * len(items)
+        if section not in self._sections or not items:
+            return results
+        ids, fingerprints, offsets, blob_start = self._sections[section]
+        if len(ids) == 0:
+            return results
+
+        query = np.array([item.get('item_id') if isinstance(item.get('item_id'), int) else -1 for item in items],
+                         dtype=np.int64)
+        positions = np.minimum(np.searchsorted(ids, query), len(ids) - 1)
+        found = np.flatnonzero(ids[positions] == query).tolist()
+        if not found:
+            return results
+        requested = FINGERPRINTS[section]([items[i] for i in found], model)
+        for i, fingerprint in zip(found, requested.tolist()):
+            item = items[i]
+            position = positions[i]
+            if int(fingerprints[position]) != fingerprint:
+                continue
+            record = json.loads(self._mmap[blob_start + offsets[position]:blob_start + offsets[position + 1]])
+            record['item_id'] = item['item_id']
+            if section == 'consumables':
+                record['name'] = item.get('name', f"Item {item['item_id']}")
+            else:
+                refresh_derived_fields(record, item)
+            results[i] = record
+        return results
+
+
+_snapshot = None
+_snapshot_mtime = None
+_snapshot_checked = 0.0
+_snapshot_lock = threading.Lock()
+
+
+def get_snapshot(path=SNAPSHOT_PATH):
+    """
+    The current snapshot, reopened when the file is replaced; None when there is no
+    file or it is older than MAX_AGE_S.
+    """
+    global _snapshot, _snapshot_mtime, _snapshot_checked
+    with _snapshot_lock:
+        now = time.monotonic()
+        if now - _snapshot_checked >= RELOAD_CHECK_S:
+            _snapshot_checked = now
+            try:
+                mtime = os.stat(path).st_mtime
+            except OSError:
+                mtime = None
+            if mtime != _snapshot_mtime:
+                _snapshot_mtime = mtime
+                _snapshot = None
+                if mtime is not None:
+                    try:
+                        _snapshot = ForecastSnapshot(path)
+                        counts = ', '.join(f"{name}: {layout['count']}" for name, layout in _snapshot.header['sections'].items())
+                        logger.info(f"✅ Loaded forecast snapshot {path} ({counts})")
+                    except (OSError, ValueError) as e:
+                        logger.error(f"❌ Could not open forecast snapshot {path}: {e}")
+        snapshot = _snapshot
+    if snapshot is None or snapshot.age_s() > MAX_AGE_S:
+        return None
+    return snapshot
+
+
+def split_by_snapshot(section, items, model_sha256=None, model=None):
+    """
+    Answer what the snapshot can and leave the rest for live computation
+    (model_sha256 / model: the active lifespan model).
+
+    Returns:
+        Tuple of (snapshot records with None gaps, indices of items to compute live,
+        freshness info dict or None when no usable snapshot)
+    """
+    if not isinstance(items, list) or not items:
+        # Nothing to look up: the live path answers (and shapes empty responses) as usual
+        return None, list(range(len(items))), None
+    snapshot = get_snapshot()
+    if snapshot is None:
+        return None, list(range(len(items))), None
+    if section == 'lifespan' and snapshot.model_sha256 != model_sha256:
+        return None, list(range(len(items))), None
+
+    records = snapshot.lookup(section, items, model)
+    live = [i for i, record in enumerate(records) if record is None]
+    metrics.inc(f'{section}.snapshot.hits', len(items) - len(live))
+    metrics.inc(f'{section}.snapshot.misses', len(live))
+    freshness = {
+        'created_at': datetime.fromtimestamp(snapshot.created_at).isoformat(timespec='seconds'),
+        'age_s': round(snapshot.age_s(), 1),
+        'hits': len(items) - len(live),
+        'live': len(live),
+    }
+    return records, live, freshness
+
+
+def merge_live(records, live_indices, live_records):
+    """Fill the snapshot gaps with the live results (same order as live_indices)."""
+    for i, record in zip(live_indices, live_records):
+        records[i] = record
+    return records
+
+
+# Raw lifespan fields CalculateLifespanJob reads through its Eloquent relations
+CALLER_LIFESPAN_QUERY = f"""
+    SELECT
+        i.id as item_id,
+        c.category as category,
+        i.date_acquired,
+        i.maintenance_count,
+        (SELECT COUNT(*) FROM maintenance_records mr WHERE mr.item_id = i.id) as record_count,
+        cn.condition_number as raw_condition_number,
+        cn.condition_status,
+        cond.condition,
+        i.maintenance_reason,
+        (
+            SELECT COALESCE(mr.reason, mr.technician_notes, '')
+            FROM maintenance_records mr
+            WHERE mr.item_id = i.id
+            ORDER BY mr.maintenance_date DESC
+            LIMIT 1
+        ) as last_record_reason
+    {ITEM_FEATURE_JOINS}
+    WHERE {NON_CONSUMABLE_ITEMS_FILTER}
+    ORDER BY i.id
+"""
+CALLER_LIFESPAN_COLUMNS = ('item_id', 'category', 'date_acquired', 'maintenance_count', 'record_count',
+                           'raw_condition_number', 'condition_status', 'condition', 'maintenance_reason',
+                           'last_record_reason')
+
+
+def caller_years_in_use(date_acquired, now):
+    """years_in_use the way CalculateLifespanJob computes it: y + m/12 + d/365.25 of the date diff."""
+    if not date_acquired:
+        return 0.0
+    acquired = date_acquired if isinstance(date_acquired, datetime) else datetime.fromisoformat(str(date_acquired)[:10])
+    # DateTime::diff is unsigned
+    diff = relativedelta(max(now, acquired), min(now, acquired))
+    return diff.years + diff.months / 12 + diff.days / 365.25
+
+
+def caller_condition_number(raw):
+    """CalculateLifespanJob's condition number: A<n> -> n, R stays 'R', else the first number, else 0."""
+    value = str(raw or '').strip().upper()
+    if not value:
+        return 0
+    match = re.search(r'A(\d+)', value)
+    if match:
+        return int(match.group(1))
+    if value == 'R':
+        return 'R'
+    try:
+        return int(float(value))
+    except ValueError:
+        match = re.search(r'\d+', value)
+        return int(match.group(0)) if match else 0
+
+
+def lifespan_items_from_rows(rows, now=None):
+    """
+    Request items for /predict/lifespan shaped exactly like CalculateLifespanJob's
+    payload, from rows of CALLER_LIFESPAN_QUERY (dicts).
+    """
+    now = now or datetime.now()
+    items = []
+    for row in rows:
+        last_reason = row['maintenance_reason'] or ''
+        if not last_reason and row['record_count']:
+            last_reason = row['last_record_reason'] or ''
+        maintenance_count = row['maintenance_count']
+        items.append({
+            'item_id': int(row['item_id']),
+            'category': row['category'] if row['category'] is not None else 'Unknown',
+            'years_in_use': max(0.0, caller_years_in_use(row['date_acquired'], now)),
+            'maintenance_count': int(maintenance_count if maintenance_count is not None else row['record_count']),
+            'condition_number': caller_condition_number(row['raw_condition_number']),
+            'condition_status': row['condition_status'] or '',
+            'condition': row['condition'] or '',
+            'last_reason': last_reason,
+        })
+    return items
+
+
+def consumable_items_from_rows(usage_rows, item_rows, years_back=DEFAULT_YEARS_BACK, current_year=None):
+    """
+    Request items for /predict/consumables/linear shaped like UsageController's
+    forecast-data (what the dashboards forward), from supply_usages rows (dicts with
+    item_id, period like 'Q3 2025', usage) and items rows (id, description, quantity,
+    optionally deleted_at).
+
+    Only periods from Q1 of current_year - years_back to Q4 of current_year are read;
+    an item gets one point per period that has usage rows, with their usage summed.
+    """
+    current_year = current_year or datetime.now().year
+    items_by_id = {str(row['id']): row for row in item_rows if not row.get('deleted_at')}
+    by_item = {}
+    for row in usage_rows:
+        match = PERIOD_PATTERN.fullmatch(str(row['period'] or '').strip())
+        if not match:
+            continue
+        quarter, year = int(match.group(1)), int(match.group(2))
+        if not current_year - years_back <= year <= current_year:
+            continue
+        periods = by_item.setdefault(str(row['item_id']), {})
+        periods[(year, quarter)] = periods.get((year, quarter), 0) + float(row['usage'] or 0)
+
+    items = []
+    for item_id, periods in sorted(by_item.items(), key=lambda pair: int(pair[0])):
+        item = items_by_id.get(item_id)
+        if item is None:
+            # Item::find() skips deleted items
+            continue
+        history = [
+            {'period': f'Q{quarter} {year}', 'timestamp': f"{year}-{(quarter - 1) * 3 + 1:02d}-01", 'usage': int(total)}
+            for (year, quarter), total in sorted(periods.items())
+        ]
+        items.append({
+            'item_id': int(item_id),
+            'name': item.get('description') or f'Item {item_id}',
+            'historical_data': history,
+            'forecast_features': {'avg_usage_per_quarter': sum(point['usage'] for point in history) / len(history)},
+            'current_stock': int(item.get('quantity') or 0),
+        })
+    return items
+
+
+def read_catalog(dump_path=None, years_back=DEFAULT_YEARS_BACK):
+    """
+    Lifespan and consumables request items for the whole catalog, shaped like the
+    Laravel callers' payloads, from a pg_dump file or (without one) from PostgreSQL.
+    """
+    if dump_path is not None:
+        import sqlite3
+
+        from score_lifespan_items import seed_sqlite
+        from sql_dump_reader import read_dump_tables
+
+        conn = sqlite3.connect(':memory:')
+        seed_sqlite(conn, dump_path)
+        lifespan_rows = [dict(zip(CALLER_LIFESPAN_COLUMNS, row)) for row in conn.execute(CALLER_LIFESPAN_QUERY)]
+        conn.close()
+        tables = read_dump_tables(dump_path, ['supply_usages', 'items'])
+        rows = {name: [dict(zip(columns, row)) for row in data] for name, (columns, data) in tables.items()}
+        usage_rows, item_rows = rows.get('supply_usages', []), rows.get('items', [])
+    else:
+        from lifespan_db import connect_to_database
+
+        conn = connect_to_database()
+        try:
+            cur = conn.cursor()
+            cur.execute(CALLER_LIFESPAN_QUERY)
+            lifespan_rows = [dict(zip(CALLER_LIFESPAN_COLUMNS, row)) for row in cur.fetchall()]
+            cur.execute("SELECT item_id, period, usage FROM supply_usages")
+            usage_rows = [dict(zip(('item_id', 'period', 'usage'), row)) for row in cur.fetchall()]
+            cur.execute("SELECT id, description, quantity FROM items WHERE deleted_at IS NULL")
+            item_rows = [dict(zip(('id', 'description', 'quantity'), row)) for row in cur.fetchall()]
+        finally:
+            conn.close()
+    return lifespan_items_from_rows(lifespan_rows), consumable_items_from_rows(usage_rows, item_rows, years_back)
+
+
+def check_payload(snapshot_path, payload_path, section=None):
+    """
+    Replay a captured request body against a snapshot and log how many items it
+    would answer. The section is guessed from the items when not given.
+    """
+    import lifespan_predictor
+
+    with open(payload_path) as f:
+        payload = json.load(f)
+    items = payload.get('items', []) if isinstance(payload, dict) else payload
+    if section is None:
+        section = 'consumables' if items and 'historical_data' in items[0] else 'lifespan'
+    snapshot = ForecastSnapshot(snapshot_path)
+    model = None
+    if section == 'lifespan':
+        model = lifespan_predictor.load_lifespan_model()
+        active = lifespan_predictor.active_model_sha256() if model is not None else None
+        if snapshot.model_sha256 != active:
+            logger.warning("⚠️ Snapshot was built with a different lifespan model - the API would ignore it")
+    records = snapshot.lookup(section, items, model)
+    hits = sum(record is not None for record in records)
+    known = set(snapshot.item_ids(section).tolist())
+    unknown = sum(item.get('item_id') not in known for item in items)
+    logger.info(f"📊 {section}: {hits}/{len(items)} items answered by the snapshot "
+                f"({unknown} unknown item_ids, {len(items) - hits - unknown} with changed inputs), "
+                f"snapshot age {snapshot.age_s() / 3600:.1f} h")
+    return hits, len(items)
+
+
+def main():
+    """
+    Build the snapshot for the whole catalog with the API's own prediction code.
+    """
+    from consumables_forecaster import forecast_consumables
+    import lifespan_predictor
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description='Precompute forecasts and lifespan predictions into a snapshot file')
+    parser.add_argument('--seed-from', default=None, help='Read the catalog from this pg_dump file instead of PostgreSQL')
+    parser.add_argument('--out', default=SNAPSHOT_PATH, help='Snapshot file to write (or, with --check, to read)')
+    parser.add_argument('--years-back', type=int, default=DEFAULT_YEARS_BACK,
+                        help='Years of usage history in the consumables requests (forecast-data years_back)')
+    parser.add_argument('--check', default=None, metavar='REQUEST_JSON',
+                        help='Report how much of a captured request body the snapshot answers, then exit')
+    parser.add_argument('--section', choices=sorted(FINGERPRINTS), default=None, help='Section of the --check request')
+    args = parser.parse_args()
+
+    if args.check:
+        check_payload(args.out, args.check, args.section)
+        return
+
+    started = time.perf_counter()
+    lifespan_items, consumable_items = read_catalog(args.seed_from, args.years_back)
+
+    model = lifespan_predictor.load_lifespan_model()
+    result = lifespan_predictor.predict_lifespan(lifespan_items, model)
+    lifespan_records = lifespan_predictor.prediction_records(result)
+    model_sha256 = lifespan_predictor.active_model_sha256() if model is not None else None
+
+    forecasts = forecast_consumables(consumable_items)
+
+    header = write_snapshot(args.out, {
+        'lifespan': list(zip(lifespan_items, lifespan_records)),
+        'consumables': list(zip(consumable_items, forecasts)),
+    }, model_sha256, model)
+    logger.info(f"✅ Snapshot written to {args.out} in {time.perf_counter() - started:.1f}s: "
+                f"{header['sections']['lifespan']['count']} lifespan predictions ({result['method']}), "
+                f"{header['sections']['consumables']['count']} consumables forecasts, "
+                f"{os.path.getsize(args.out) / 1024:.1f} KB")
+
+
+if __name__ == '__main__':
+    main()
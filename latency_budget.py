@@ -0,0 +1,105 @@
+"""
+Latency Budgets for Lifespan Predictions
+
+Callers can tell the lifespan endpoint how long they are willing to wait:
+
+- X-Latency-Budget-Ms: milliseconds available for this request, or
+- X-Request-Deadline: absolute deadline as a Unix timestamp in seconds
+
+The server keeps a running estimate of model inference cost (fixed overhead plus a
+per-item cost, fitted to recent timings with exponential forgetting) and answers
+with the deterministic rules when the model would not finish within the budget.
+"""
+
+import threading
+import time
+
+from api_metrics import metrics
+
+LATENCY_BUDGET_HEADER = 'X-Latency-Budget-Ms'
+DEADLINE_HEADER = 'X-Request-Deadline'
+
+
+def latency_budget_ms(headers, received_at=None):
+    """
+    Remaining latency budget in milliseconds from the request headers, or None
+    when the caller did not send one (or sent an unparseable value).
+
+    Args:
+        headers: Request headers
+        received_at: time.perf_counter() when the request arrived; time spent since
+            then is subtracted from an X-Latency-Budget-Ms budget
+    """
+    budget = headers.get(LATENCY_BUDGET_HEADER)
+    if budget is not None:
+        try:
+            budget_ms = float(budget)
+        except ValueError:
+            return None
+        if received_at is not None:
+            budget_ms -= (time.perf_counter() - received_at) * 1000
+        return budget_ms
+
+    deadline = headers.get(DEADLINE_HEADER)
+    if deadline is not None:
+        try:
+            return (float(deadline) - time.time()) * 1000
+        except ValueError:
+            return None
+    return None
+
+
+class InferenceCostEstimator:
+    """
+    Online estimate of inference time as overhead_ms + per_item_ms * items.
+
+    Each observation decays the earlier ones by (1 - alpha), so the estimate follows
+    changes in load and model size. estimate_ms() returns None until min_samples
+    timings have been seen.
+    """
+
+    def __init__(self, name, alpha=0.1, min_samples=3):
+        self.name = name
+        self.alpha = alpha
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+        self._samples = 0
+        # Decayed sums for a weighted least-squares fit of ms against items
+        self._w = self._n = self._nn = self._y = self._ny = 0.0
+
+    def observe(self, items, elapsed_ms):
+        """Record how long one inference call over `items` items took."""
+        if items <= 0:
+            return
+        keep = 1.0 - self.alpha
+        with self._lock:
+            self._w = self._w * keep + 1.0
+            self._n = self._n * keep + items
+            self._nn = self._nn * keep + items * items
+            self._y = self._y * keep + elapsed_ms
+            self._ny = self._ny * keep + items * elapsed_ms
+            self._samples += 1
+            overhead, per_item = self._fit()
+        metrics.set_gauge(f'{self.name}.cost.overhead_ms', round(overhead, 3))
+        metrics.set_gauge(f'{self.name}.cost.per_item_us', round(per_item * 1000, 3))
+
+    def _fit(self):
+        det = self._w * self._nn - self._n * self._n
+        if det <= 1e-9 * self._w * self._nn:
+            # All recent calls had (nearly) the same size: attribute everything to items
+            return 0.0, self._y / self._n
+        per_item = max(0.0, (self._w * self._ny - self._n * self._y) / det)
+        overhead = max(0.0, (self._y - per_item * self._n) / self._w)
+        return overhead, per_item
+
+    def estimate_ms(self, items):
+        """Predicted inference time for `items` items, or None while uncalibrated."""
+        with self._lock:
+            if self._samples < self.min_samples:
+                return None
+            overhead, per_item = self._fit()
+        return overhead + per_item * items
+
+
+# Shared estimate of CatBoost/NumPy model inference cost for lifespan predictions
+lifespan_model_cost = InferenceCostEstimator('lifespan.model')
@@ -0,0 +1,105 @@
+"""
+Database Access for Lifespan Training and Scoring
+
+Connection settings and the item feature query shared by train_lifespan_model.py
+(training rows) and score_lifespan_items.py (batch scoring), so both read exactly
+the same features. The query is written for PostgreSQL; item_feature_columns()
+also has a SQLite variant for local dry runs.
+"""
+
+import os
+import logging
+import sys
+
+logger = logging.getLogger(__name__)
+
+# Tables joined by the item feature query
+ITEM_FEATURE_JOINS = """
+    FROM items i
+    LEFT JOIN categories c ON i.category_id = c.id
+    LEFT JOIN condition_numbers cn ON i.condition_number_id = cn.id
+    LEFT JOIN conditions cond ON i.condition_id = cond.id
+"""
+
+# Active, non-consumable items (consumables are forecast, not lifespan-predicted)
+NON_CONSUMABLE_ITEMS_FILTER = """i.deleted_at IS NULL
+        AND (c.category IS NULL OR (LOWER(c.category) NOT LIKE '%supply%' AND LOWER(c.category) NOT LIKE '%consumable%'))"""
+
+def item_feature_columns(dialect='postgresql'):
+    """
+    SELECT-list for the model's raw input fields, one row per item.
+    
+    Args:
+        dialect: 'postgresql' (production) or 'sqlite' (local stand-in used for dry runs)
+    """
+    if dialect == 'sqlite':
+        years_in_use = "CAST((julianday('now') - julianday(i.date_acquired)) / 365.25 AS INTEGER)"
+        condition_number = """CASE 
+            WHEN cn.condition_number GLOB 'A[0-9]*' 
+            THEN CAST(SUBSTR(cn.condition_number, 2) AS INTEGER)
+            ELSE 0
+        END"""
+    else:
+        years_in_use = "EXTRACT(YEAR FROM AGE(CURRENT_DATE, i.date_acquired))"
+        condition_number = """CASE 
+            WHEN cn.condition_number ~ '^A([0-9]+)$' 
+            THEN CAST(SUBSTRING(cn.condition_number FROM 'A([0-9]+)') AS INTEGER)
+            ELSE 0
+        END"""
+    
+    return f"""i.id as item_id,
+        COALESCE(c.category, 'Unknown') as category,
+        {years_in_use} as years_in_use,
+        COALESCE(i.maintenance_count, 0) as maintenance_count,
+        {condition_number} as condition_number,
+        COALESCE(cn.condition_status, 'Unknown') as condition_status,
+        COALESCE(cond.condition, 'Unknown') as condition,
+        COALESCE((
+            SELECT reason 
+            FROM maintenance_records 
+            WHERE item_id = i.id 
+            ORDER BY maintenance_date DESC 
+            LIMIT 1
+        ), '') as last_reason"""
+
+def connect_to_database():
+    """
+    Open a connection to the PostgreSQL database using the DB_* environment variables.
+    Exits the script if psycopg2 is missing or the connection fails.
+    """
+    try:
+        import psycopg2
+    except ImportError:
+        logger.error("❌ psycopg2-binary not installed. Install with: pip install psycopg2-binary")
+        sys.exit(1)
+    
+    # Database connection settings
+    # Update these if your database credentials are different
+    DB_HOST = os.getenv('DB_HOST', '127.0.0.1')
+    DB_PORT = os.getenv('DB_PORT', '5432')
+    DB_NAME = os.getenv('DB_DATABASE', 'nia_db')
+    DB_USER = os.getenv('DB_USERNAME', 'postgres')
+    DB_PASSWORD = os.getenv('DB_PASSWORD', '100676')
+    
+    logger.info("=" * 60)
+    logger.info("Connecting to database...")
+    logger.info(f"Host: {DB_HOST}, Database: {DB_NAME}")
+    
+    try:
+        conn = psycopg2.connect(
+            host=DB_HOST,
+            port=DB_PORT,
+            database=DB_NAME,
+            user=DB_USER,
+            password=DB_PASSWORD
+        )
+    except Exception as e:
+        logger.error(f"❌ Failed to connect to database: {e}")
+        logger.info("\n💡 Check your database connection settings:")
+        logger.info(f"   DB_HOST={DB_HOST}")
+        logger.info(f"   DB_PORT={DB_PORT}")
+        logger.info(f"   DB_NAME={DB_NAME}")
+        logger.info(f"   DB_USER={DB_USER}")
+        sys.exit(1)
+    
+    return conn
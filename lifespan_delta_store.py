@@ -0,0 +1,244 @@
+"""
+Delta Rescoring State for Lifespan Predictions
+
+CalculateLifespanJob sends every item every night and writes every returned
+prediction back, although most items have not changed. In delta mode
+(POST /predict/items/lifespan/delta) the server remembers, per model version and
+item, the fingerprint of the inputs it last scored and the prediction it last
+returned:
+
+- items whose fingerprint matches are not scored again. Their lifespan_estimate
+  (years_in_use + remaining_years) is recomputed from the request and they are
+  returned only if it changed
+- the rest are scored, and only predictions whose written fields (remaining_years,
+  lifespan_estimate and any quantile bands, as rounded in the response) differ from
+  the remembered ones are returned
+
+The fingerprint is the snapshot's lifespan fingerprint (forecast_snapshot.py): the
+featurized inputs, bucketed by the model's split borders. The job's fractional
+years_in_use moves every night but only changes the fingerprint when it crosses a
+border, i.e. when the model's answer can change.
+
+A new model version starts from an empty state, so the first run after a model
+change returns everything. Callers may send their own fingerprint per item (any
+string, e.g. a hash of the row or its updated_at) instead of the feature fields;
+items whose fingerprint is unknown or changed are then listed back as
+needs_features.
+
+The state lives in a small SQLite file so every worker on the host shares it and it
+survives restarts; losing it only means the next run returns everything. The server
+assumes the caller writes back what it returns; after a failed write-back, send
+"force": true to rescore and return everything.
+
+Environment:
+    ML_API_DELTA_STORE_PATH   SQLite file (default irrigtrack-ml-api/lifespan_delta_store.sqlite
+                              in the system temp directory)
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+from contextlib import nullcontext
+
+from forecast_snapshot import LIFESPAN_INPUTS, lifespan_fingerprints, refresh_derived_fields
+from lifespan_predictor import active_model_sha256, predict_lifespan, prediction_records
+
+logger = logging.getLogger(__name__)
+
+STORE_PATH = os.getenv('ML_API_DELTA_STORE_PATH',
+                       os.path.join(tempfile.gettempdir(), 'irrigtrack-ml-api', 'lifespan_delta_store.sqlite'))
+
+# Prediction fields the nightly job writes back (quantile bands are added when present)
+WRITTEN_FIELDS = ('remaining_years', 'lifespan_estimate')
+# Item ids per lookup query
+LOOKUP_CHUNK = 50000
+
+
+def has_features(item):
+    return any(field in item for field in LIFESPAN_INPUTS)
+
+
+def item_fingerprints(items, model):
+    """
+    Fingerprint per item: the caller's 'fingerprint' field, else the snapshot's
+    lifespan fingerprint of its inputs (None for items with neither).
+    """
+    fingerprints = [str(item['fingerprint']) if item.get('fingerprint') is not None else None for item in items]
+    computed = [i for i, item in enumerate(items) if fingerprints[i] is None and has_features(item)]
+    if computed:
+        digests = lifespan_fingerprints([items[i] for i in computed], model)
+        for i, digest in zip(computed, digests.tolist()):
+            fingerprints[i] = format(digest, '016x')
+    return fingerprints
+
+
+def written_values(record):
+    """The fields of a prediction record the caller persists, as a comparable JSON string."""
+    fields = {k: v for k, v in record.items() if k in WRITTEN_FIELDS or k.startswith('remaining_years_p')}
+    return json.dumps(fields, sort_keys=True, separators=(',', ':'))
+
+
+class LifespanDeltaStore:
+    """
+    Last scored fingerprint and returned prediction record per (model version, item_id).
+
+    Args:
+        path: SQLite database file (':memory:' keeps the state in this process only)
+    """
+
+    def __init__(self, path=STORE_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._memory_conn = None
+        self._memory_lock = threading.Lock()
+        self._saved_version = None
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._lock():
+            conn = self._conn()
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS lifespan_delta_state ("
+                "model_version TEXT NOT NULL, item_id INTEGER NOT NULL, fingerprint TEXT NOT NULL, "
+                "prediction TEXT NOT NULL, PRIMARY KEY (model_version, item_id))"
+            )
+            conn.commit()
+
+    def _conn(self):
+        """One connection per thread (a single shared one for ':memory:')."""
+        if self.path == ':memory:':
+            if self._memory_conn is None:
+                self._memory_conn = sqlite3.connect(':memory:', check_same_thread=False)
+            return self._memory_conn
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _lock(self):
+        # File databases are serialized by SQLite itself; the in-memory one shares a connection
+        return self._memory_lock if self.path == ':memory:' else nullcontext()
+
+    def lookup(self, model_version, item_ids):
+        """Dict of item_id -> (fingerprint, prediction record JSON) for the known items."""
+        state = {}
+        with self._lock():
+            conn = self._conn()
+            for start in range(0, len(item_ids), LOOKUP_CHUNK):
+                chunk = json.dumps(item_ids[start:start + LOOKUP_CHUNK])
+                rows = conn.execute(
+                    "SELECT item_id, fingerprint, prediction FROM lifespan_delta_state "
+                    "WHERE model_version = ? AND item_id IN (SELECT value FROM json_each(?))",
+                    (model_version, chunk)
+                )
+                state.update((item_id, (fingerprint, prediction)) for item_id, fingerprint, prediction in rows)
+        return state
+
+    def save(self, model_version, rows):
+        """
+        Remember returned predictions: rows of (item_id, fingerprint, prediction record JSON).
+        State kept for other model versions is dropped, since it can no longer match.
+        """
+        if not rows:
+            return
+        with self._lock():
+            conn = self._conn()
+            with conn:
+                if model_version != self._saved_version:
+                    conn.execute("DELETE FROM lifespan_delta_state WHERE model_version != ?", (model_version,))
+                    self._saved_version = model_version
+                conn.executemany(
+                    "INSERT OR REPLACE INTO lifespan_delta_state (model_version, item_id, fingerprint, prediction) "
+                    "VALUES (?, ?, ?, ?)", [(model_version, *row) for row in rows]
+                )
+
+
+def model_version(model):
+    """Version the delta state is kept under: the model file's SHA-256, or 'manual' without a model."""
+    if model is None:
+        return 'manual'
+    return active_model_sha256() or getattr(model, 'source_sha256', None) or 'unversioned'
+
+
+def delta_rescore(items, model, store, force=False):
+    """
+    Score only the items whose inputs changed and keep only predictions that changed.
+
+    Args:
+        items: Request items: lifespan feature fields, or just item_id and fingerprint
+        model: Active lifespan model (or None for the manual calculation)
+        store: LifespanDeltaStore
+        force: Ignore the remembered state (rescore and return every item)
+
+    Returns:
+        Dict with 'predictions' (changed items, full records), 'method', 'model_version',
+        'unchanged_inputs', 'rescored', 'changed' and 'needs_features' (item_ids sent
+        with a fingerprint only, whose fingerprint is unknown or changed)
+    """
+    version = model_version(model)
+    item_ids = [item.get('item_id') for item in items]
+    fingerprints = item_fingerprints(items, model)
+    known = {} if force else store.lookup(version, [i for i in item_ids if isinstance(i, int)])
+
+    to_score, needs_features, predictions, saved = [], [], [], []
+    for index, (item, item_id, fingerprint) in enumerate(zip(items, item_ids, fingerprints)):
+        prior = known.get(item_id)
+        if prior is not None and fingerprint is not None and prior[0] == fingerprint:
+            stored = json.loads(prior[1])
+            if has_features(item) and 'years_in_use' in stored:
+                # Same prediction, but lifespan_estimate follows the request's years_in_use
+                record = refresh_derived_fields({**stored, 'item_id': item_id}, item)
+                if written_values(record) != written_values(stored):
+                    predictions.append(record)
+                    saved.append((item_id, fingerprint, json.dumps(record)))
+            continue
+        if not has_features(item):
+            needs_features.append(item_id)
+            continue
+        to_score.append(index)
+
+    method = None
+    if to_score:
+        result = predict_lifespan([items[i] for i in to_score], model)
+        method = result['method']
+        # A fallback answer is not what this model version would say, so it is not remembered
+        remember = model is None or method != 'manual_calculation_fallback'
+        for index, record in zip(to_score, prediction_records(result)):
+            item_id = item_ids[index]
+            prior = known.get(item_id)
+            if prior is None or written_values(json.loads(prior[1])) != written_values(record):
+                predictions.append(record)
+            if remember and isinstance(item_id, int):
+                saved.append((item_id, fingerprints[index], json.dumps(record)))
+    store.save(version, saved)
+    # Refreshed items only carry the stored method
+    method = method or next((record.get('method') for record in predictions), None)
+
+    return {
+        'predictions': predictions,
+        'method': method,
+        'model_version': version,
+        'unchanged_inputs': len(items) - len(to_score) - len(needs_features),
+        'rescored': len(to_score),
+        'changed': len(predictions),
+        'needs_features': needs_features,
+    }
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_delta_store():
+    """Delta state store at ML_API_DELTA_STORE_PATH, opened on first use."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = LifespanDeltaStore(STORE_PATH)
+            logger.info(f"✅ Lifespan delta state at {STORE_PATH}")
+        return _store
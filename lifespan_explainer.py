@@ -0,0 +1,226 @@
+"""
+SHAP Explanations for Lifespan Predictions
+
+Explains why the model gave an item its remaining_years: CatBoost SHAP values for
+the whole batch are computed in one call, the one-hot feature columns are folded
+back into the fields the caller sent (category, last_reason, condition_status,
+condition), and only the top-k fields per item are returned.
+
+Inventories are highly repetitive (many items share category, age, condition and
+last reason), so identical feature rows are explained once per batch, and every
+explained row is kept in an LRU cache keyed by model version (SHA-256 of the .cbm)
+and row contents. Explaining the whole inventory table after the first time is
+mostly cache hits.
+
+SHAP values need the CatBoost model file; the NumPy evaluator does not carry the
+leaf weights they are computed from. When the server runs on the NumPy export, the
+explainer loads the .cbm next to it.
+
+Environment:
+    ML_API_EXPLAIN_CACHE_ROWS   Explained feature rows kept in memory (default 100000)
+"""
+
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from api_metrics import metrics
+from lifespan_predictor import (align_features_with_model, disposal_mask, item_column, model_quantiles,
+                                prepare_features_for_prediction)
+from lifespan_tree_evaluator import file_sha256
+from thread_budget import inference_thread_count
+
+logger = logging.getLogger(__name__)
+
+CACHE_ROWS = int(os.getenv('ML_API_EXPLAIN_CACHE_ROWS', '100000'))
+
+# One-hot prefixes -> original field (condition_status_ before condition_)
+ONE_HOT_FIELDS = ('category', 'last_reason', 'condition_status', 'condition')
+
+
+class ExplainerUnavailable(RuntimeError):
+    """No CatBoost model file (or no catboost library) to compute SHAP values with."""
+
+
+def feature_field(feature):
+    """Original request field for a model feature column (one-hot columns map to their field)."""
+    for field in ONE_HOT_FIELDS:
+        if feature.startswith(field + '_') and feature != 'condition_number':
+            return field
+    return feature
+
+
+class LifespanExplainer:
+    """
+    Batched SHAP explanations for one CatBoost model file, with a row-level LRU cache.
+
+    Args:
+        model_path: Path to the .cbm model
+        model: Already loaded CatBoostRegressor for that file (loaded from model_path if None)
+        cache_rows: Explained rows to keep
+    """
+
+    def __init__(self, model_path, model=None, cache_rows=CACHE_ROWS):
+        if model is None:
+            from catboost import CatBoostRegressor
+            model = CatBoostRegressor()
+            model.load_model(model_path)
+        self.model = model
+        self.model_version = file_sha256(model_path)
+        self.cache_rows = cache_rows
+        self.feature_names = list(model.feature_names_)
+        self.fields = list(dict.fromkeys(feature_field(f) for f in self.feature_names))
+        # Sums SHAP columns into per-field contributions: (features,) -> field index
+        field_index = {field: i for i, field in enumerate(self.fields)}
+        self._feature_to_field = np.array([field_index[feature_field(f)] for f in self.feature_names])
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        # Expected model output (SHAP's last column), the same for every row
+        self.base_value = float(self._shap(np.zeros((1, len(self.feature_names))))[0, -1])
+
+    def _row_keys(self, rows):
+        """Cache keys: model version plus a digest of the row's feature values."""
+        version = self.model_version.encode()
+        return [hashlib.blake2b(row.tobytes(), digest_size=16, key=version[:64]).digest() for row in rows]
+
+    def field_contributions(self, items):
+        """
+        Per-field SHAP contributions for every item.
+
+        Returns:
+            Tuple of (contributions array (items, fields), item_id Series or None)
+        """
+        df, item_ids = prepare_features_for_prediction(items)
+        aligned = align_features_with_model(df, self.model)
+        X = aligned.to_numpy(dtype=np.float64)
+
+        # Explain each distinct row once
+        unique_rows, inverse = np.unique(X, axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        keys = self._row_keys(unique_rows)
+        unique_contrib = np.empty((len(unique_rows), len(self.fields)), dtype=np.float64)
+
+        missing = []
+        with self._lock:
+            for i, key in enumerate(keys):
+                cached = self._cache.get(key)
+                if cached is None:
+                    missing.append(i)
+                else:
+                    self._cache.move_to_end(key)
+                    unique_contrib[i] = cached
+        metrics.inc('explain.cache.hits', len(keys) - len(missing))
+        metrics.inc('explain.cache.misses', len(missing))
+
+        if missing:
+            contrib = self._shap_by_field(unique_rows[missing])
+            unique_contrib[missing] = contrib
+            with self._lock:
+                for i, row in zip(missing, contrib):
+                    self._cache[keys[i]] = row
+                while len(self._cache) > self.cache_rows:
+                    self._cache.popitem(last=False)
+            metrics.set_gauge('explain.cache.rows', len(self._cache))
+
+        return unique_contrib[inverse], item_ids
+
+    def _shap(self, rows):
+        """SHAP values for aligned feature rows in one CatBoost call: (rows, features + 1)."""
+        from catboost import Pool
+
+        shap = self.model.get_feature_importance(
+            data=Pool(pd.DataFrame(rows, columns=self.feature_names)),
+            type='ShapValues',
+            thread_count=inference_thread_count(len(rows)),
+        )
+        if shap.ndim == 3:
+            # Quantile models: (rows, quantiles, features + 1); explain the median, which is remaining_years
+            quantiles = np.asarray(model_quantiles(self.model))
+            shap = shap[:, int(np.argmin(np.abs(quantiles - 0.5))), :]
+        return shap
+
+    def _shap_by_field(self, rows):
+        """SHAP values for rows summed per original field: (rows, fields)."""
+        shap = self._shap(rows)
+        by_field = np.zeros((len(rows), len(self.fields)), dtype=np.float64)
+        np.add.at(by_field.T, self._feature_to_field, shap[:, :-1].T)
+        return by_field
+
+    def explain(self, items, top_k=3):
+        """
+        Top-k contributing fields per item, largest absolute contribution first.
+
+        Returns:
+            Dict with 'base_value' (model output before any feature is known) and
+            'explanations': one dict per item with item_id, top_features and
+            (for disposal items) a note that the model output is overridden
+        """
+        contributions, item_ids = self.field_contributions(items)
+        top_k = max(1, min(int(top_k), len(self.fields)))
+        order = np.argsort(-np.abs(contributions), axis=1, kind='stable')[:, :top_k]
+        top_values = np.take_along_axis(contributions, order, axis=1).round(3).tolist()
+        raw_values = {}
+        for field in self.fields:
+            column = item_column(items, field)
+            raw_values[field] = column.tolist() if column is not None else [None] * len(contributions)
+        disposal = disposal_mask(items)
+        ids = item_ids.tolist() if item_ids is not None else [None] * len(contributions)
+
+        explanations = []
+        for row, (fields, values) in enumerate(zip(order.tolist(), top_values)):
+            top_features = []
+            for field_idx, value in zip(fields, values):
+                field = self.fields[field_idx]
+                raw = raw_values[field][row]
+                top_features.append({
+                    'field': field,
+                    'value': raw.item() if isinstance(raw, np.generic) else raw,
+                    'contribution': value,
+                })
+            explanation = {'item_id': ids[row], 'top_features': top_features}
+            if disposal[row]:
+                explanation['note'] = 'Disposal item: remaining_years is set to 0 regardless of the model'
+            explanations.append(explanation)
+
+        return {
+            'base_value': round(self.base_value, 3),
+            'explanations': explanations,
+        }
+
+
+_explainer = None
+_explainer_source = None
+_explainer_lock = threading.Lock()
+
+
+def get_explainer():
+    """
+    Explainer for the server's active lifespan model, created on first use.
+
+    Raises:
+        ExplainerUnavailable: no .cbm model file or catboost is not installed
+    """
+    global _explainer, _explainer_source
+    import lifespan_predictor
+
+    with _explainer_lock:
+        model = lifespan_predictor.load_lifespan_model()
+        model_path = lifespan_predictor.lifespan_model_path
+        if model is None or model_path is None or not os.path.exists(model_path):
+            raise ExplainerUnavailable('Explanations need the CatBoost model file (catboost_lifespan_model.cbm)')
+        # Rebuilt only when the active model changes
+        if _explainer is None or _explainer_source != (model_path, id(model)):
+            try:
+                from catboost import CatBoostRegressor
+            except ImportError:
+                raise ExplainerUnavailable('Explanations need the catboost library (pip install catboost)')
+            loaded = model if isinstance(model, CatBoostRegressor) else None
+            _explainer = LifespanExplainer(model_path, loaded)
+            _explainer_source = (model_path, id(model))
+            logger.info(f"✅ SHAP explainer ready for model {_explainer.model_version[:12]}")
+        return _explainer
@@ -0,0 +1,629 @@
+"""
+Lifespan Prediction Core
+
+Model loading, feature engineering and prediction logic for equipment lifespan.
+Shared by the API server (ml_api_server.py) and offline tools such as the batch
+scorer (score_lifespan_items.py) so every path produces identical predictions.
+"""
+
+import pandas as pd
+import numpy as np
+import logging
+import os
+import time
+from latency_budget import lifespan_model_cost
+from lifespan_tree_evaluator import ObliviousTreeEvaluator, file_sha256, quantile_levels
+from thread_budget import inference_thread_count
+
+logger = logging.getLogger(__name__)
+
+# Global variable to store the CatBoost model
+lifespan_model = None
+# Path of the .cbm the active model was loaded from (or exported from, for the NumPy backend)
+lifespan_model_path = None
+MODEL_PATH = os.getenv('LIFESPAN_MODEL_PATH', None)
+# Inference backend: 'auto' (NumPy export when it is up to date, else CatBoost),
+# 'numpy' (never import catboost) or 'catboost'
+MODEL_BACKEND = os.getenv('LIFESPAN_MODEL_BACKEND', 'auto').lower()
+
+def load_numpy_evaluator(model_path):
+    """
+    Load the NumPy export (.npz) that sits next to a .cbm model file.
+    
+    Returns None when the export is missing, or when the .cbm exists and the
+    export was generated from a different version of it.
+    """
+    npz_path = os.path.splitext(model_path)[0] + '.npz'
+    if not os.path.exists(npz_path):
+        return None
+    
+    evaluator = ObliviousTreeEvaluator.load(npz_path)
+    if MODEL_BACKEND != 'numpy' and os.path.exists(model_path) and evaluator.source_sha256 != file_sha256(model_path):
+        logger.warning(f"⚠️ NumPy export {npz_path} is stale (model file changed). Re-run: python lifespan_tree_evaluator.py")
+        return None
+    
+    logger.info(f"✅ Loaded NumPy tree evaluator from: {npz_path} ({evaluator.tree_count_} trees)")
+    return evaluator
+
+def load_lifespan_model():
+    """
+    Load the CatBoost lifespan prediction model.
+    Checks multiple locations for the model file.
+    """
+    global lifespan_model, lifespan_model_path
+    
+    if lifespan_model is not None:
+        return lifespan_model
+    
+    # Get current working directory and script directory
+    current_dir = os.getcwd()
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    parent_dir = os.path.dirname(script_dir)
+    
+    # Possible model file locations (check multiple locations)
+    # Priority: Same directory as script (most likely location)
+    possible_paths = [
+        os.path.join(script_dir, 'catboost_lifespan_model.cbm'),  # Same dir as script (HIGHEST PRIORITY)
+        MODEL_PATH,  # Environment variable path
+        os.path.join(current_dir, 'catboost_lifespan_model.cbm'),  # Current working directory
+        'catboost_lifespan_model.cbm',  # Relative to current dir
+        os.path.join(parent_dir, 'catboost_lifespan_model.cbm'),  # Parent directory
+        os.path.join(script_dir, 'models', 'catboost_lifespan_model.cbm'),
+        os.path.join(current_dir, 'models', 'catboost_lifespan_model.cbm'),
+        'models/catboost_lifespan_model.cbm',
+        'fastapi_lifespan_api/ml/models/catboost_lifespan_model.cbm',
+    ]
+    
+    # Remove None values and duplicates
+    possible_paths = [p for p in possible_paths if p]
+    possible_paths = list(dict.fromkeys(possible_paths))  # Remove duplicates
+    
+    logger.info(f"🔍 Searching for CatBoost model file...")
+    logger.info(f"   Current directory: {current_dir}")
+    logger.info(f"   Script directory: {script_dir}")
+    logger.info(f"   Parent directory: {parent_dir}")
+    
+    model_path = None
+    checked_paths = []
+    for path in possible_paths:
+        checked_paths.append(path)
+        # A NumPy export is enough on its own when the .cbm was not deployed
+        npz_exists = MODEL_BACKEND != 'catboost' and os.path.exists(os.path.splitext(path)[0] + '.npz')
+        if os.path.exists(path) or npz_exists:
+            model_path = os.path.abspath(path)  # Use absolute path
+            logger.info(f"✅ Found model file at: {model_path}")
+            lifespan_model_path = model_path
+            break
+    
+    if model_path is None:
+        logger.warning("⚠️ CatBoost model file not found. Falling back to manual calculation method.")
+        logger.info(f"   Checked {len(checked_paths)} paths:")
+        for i, path in enumerate(checked_paths, 1):
+            exists = "✅" if os.path.exists(path) else "❌"
+            logger.info(f"   {i}. {exists} {path}")
+        return None
+    
+    if MODEL_BACKEND in ('auto', 'numpy'):
+        try:
+            lifespan_model = load_numpy_evaluator(model_path)
+        except Exception as e:
+            logger.error(f"❌ Failed to load NumPy tree evaluator: {str(e)}")
+            lifespan_model = None
+        if lifespan_model is not None:
+            return lifespan_model
+        if MODEL_BACKEND == 'numpy':
+            logger.warning("⚠️ No usable NumPy export found. Falling back to manual calculation method.")
+            return None
+    
+    try:
+        logger.info(f"🐱 Loading CatBoost model from: {model_path}")
+        logger.info(f"   File exists: {os.path.exists(model_path)}")
+        logger.info(f"   File size: {os.path.getsize(model_path) / (1024*1024):.2f} MB")
+        
+        from catboost import CatBoostRegressor
+        lifespan_model = CatBoostRegressor()
+        lifespan_model.load_model(model_path)
+        logger.info("✅ CatBoost model loaded successfully!")
+        logger.info("✅ CatBoost IS RUNNING - Using ML predictions")
+        return lifespan_model
+    except ImportError as e:
+        logger.error(f"❌ CatBoost library not installed: {str(e)}")
+        logger.error("   Install with: pip install catboost")
+        logger.warning("⚠️ Falling back to manual calculation method")
+        return None
+    except Exception as e:
+        logger.error(f"❌ Failed to load CatBoost model: {str(e)}")
+        logger.error(f"   Error type: {type(e).__name__}")
+        import traceback
+        logger.error(f"   Traceback: {traceback.format_exc()}")
+        logger.warning("⚠️ Falling back to manual calculation method")
+        return None
+
+def active_model_sha256():
+    """SHA-256 of the active model's .cbm file (None without one), computed once per path."""
+    global _model_sha256
+    path = lifespan_model_path
+    if path is None or not os.path.exists(path):
+        return None
+    if _model_sha256 is None or _model_sha256[0] != path:
+        _model_sha256 = (path, file_sha256(path))
+    return _model_sha256[1]
+
+_model_sha256 = None
+
+def load_model_file(path):
+    """
+    Load a specific model file: .npz (NumPy evaluator) or .cbm (CatBoost).
+    Used by offline tools that are pointed at a model explicitly.
+    """
+    if path.endswith('.npz'):
+        return ObliviousTreeEvaluator.load(path)
+    
+    from catboost import CatBoostRegressor
+    model = CatBoostRegressor()
+    model.load_model(path)
+    return model
+
+# Response fields of quantile bands: remaining_years_p10, remaining_years_p50, ...
+QUANTILE_PREFIX = 'remaining_years_p'
+
+def model_quantiles(model):
+    """
+    Quantile levels of a MultiQuantile lifespan model (see train_lifespan_model.py
+    --quantiles), one per prediction column, or None for a point-estimate model.
+    """
+    if isinstance(model, ObliviousTreeEvaluator):
+        return model.quantiles_
+    get_params = getattr(model, 'get_params', None)
+    return quantile_levels(get_params().get('loss_function')) if get_params is not None else None
+
+def quantile_field(level):
+    """Response field for a quantile level: 0.1 -> remaining_years_p10."""
+    return f"{QUANTILE_PREFIX}{level * 100:g}"
+
+def quantile_fields(result):
+    """Quantile band fields present in a predict_lifespan() result, lowest first."""
+    return [key for key in result if key.startswith(QUANTILE_PREFIX)]
+
+# Load model on module import (lazy loading - will load on first prediction request)
+# Model will be loaded when first prediction is requested
+
+def prepare_features_for_prediction(items):
+    """
+    Convert JSON items to DataFrame with proper feature engineering.
+    One-hot encodes category and last_reason to match training data.
+    
+    Args:
+        items: List of item dictionaries, or a DataFrame with one column per field:
+            - item_id
+            - category
+            - years_in_use
+            - maintenance_count
+            - condition_number
+            - condition_status (optional): Good, Less Reliable, Un-operational, Disposal
+            - condition (optional): Serviceable, Non-Serviceable, On Maintenance
+            - last_reason
+    
+    Returns:
+        Tuple of (DataFrame with all features ready for model prediction, item_id Series or None)
+    """
+    if len(items) == 0:
+        return pd.DataFrame(), None
+    
+    # Create base DataFrame from items (columnar input is copied, not modified)
+    df = items.copy() if isinstance(items, pd.DataFrame) else pd.DataFrame(items)
+    
+    # Ensure required numeric columns exist and are properly typed
+    numeric_cols = ['years_in_use', 'maintenance_count', 'condition_number']
+    for col in numeric_cols:
+        if col not in df.columns:
+            df[col] = 0
+        df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
+    
+    # Handle category one-hot encoding
+    # Get unique categories from data and create one-hot encoded columns
+    if 'category' in df.columns:
+        # Normalize category values (strip whitespace, handle case)
+        df['category'] = df['category'].astype(str).str.strip()
+        df['category'] = df['category'].fillna('Unknown')
+        # Create one-hot encoded columns: category_Desktop, category_ICT, etc.
+        category_dummies = pd.get_dummies(df['category'], prefix='category')
+        # Drop original category column
+        df = pd.concat([df.drop('category', axis=1), category_dummies], axis=1)
+    else:
+        df['category'] = 'Unknown'
+        category_dummies = pd.get_dummies(df['category'], prefix='category')
+        df = pd.concat([df.drop('category', axis=1), category_dummies], axis=1)
+    
+    # Handle last_reason one-hot encoding
+    # Normalize last_reason values
+    if 'last_reason' in df.columns:
+        df['last_reason'] = df['last_reason'].astype(str).str.strip().str.lower()
+        df['last_reason'] = df['last_reason'].fillna('other')
+        # Replace empty strings with 'other'
+        df['last_reason'] = df['last_reason'].replace('', 'other')
+        # Create one-hot encoded columns: last_reason_Wet, last_reason_Electrical, etc.
+        reason_dummies = pd.get_dummies(df['last_reason'], prefix='last_reason')
+        # Drop original last_reason column
+        df = pd.concat([df.drop('last_reason', axis=1), reason_dummies], axis=1)
+    else:
+        df['last_reason'] = 'other'
+        reason_dummies = pd.get_dummies(df['last_reason'], prefix='last_reason')
+        df = pd.concat([df.drop('last_reason', axis=1), reason_dummies], axis=1)
+    
+    # Handle condition_status one-hot encoding
+    if 'condition_status' in df.columns:
+        df['condition_status'] = df['condition_status'].astype(str).str.strip()
+        df['condition_status'] = df['condition_status'].fillna('Unknown')
+        condition_status_dummies = pd.get_dummies(df['condition_status'], prefix='condition_status')
+        df = pd.concat([df.drop('condition_status', axis=1), condition_status_dummies], axis=1)
+    else:
+        df['condition_status'] = 'Unknown'
+        condition_status_dummies = pd.get_dummies(df['condition_status'], prefix='condition_status')
+        df = pd.concat([df.drop('condition_status', axis=1), condition_status_dummies], axis=1)
+    
+    # Handle condition one-hot encoding (Serviceable, Non-Serviceable, etc.)
+    if 'condition' in df.columns:
+        df['condition'] = df['condition'].astype(str).str.strip()
+        df['condition'] = df['condition'].fillna('Unknown')
+        condition_dummies = pd.get_dummies(df['condition'], prefix='condition')
+        df = pd.concat([df.drop('condition', axis=1), condition_dummies], axis=1)
+    else:
+        df['condition'] = 'Unknown'
+        condition_dummies = pd.get_dummies(df['condition'], prefix='condition')
+        df = pd.concat([df.drop('condition', axis=1), condition_dummies], axis=1)
+    
+    # Remove item_id if present (not a feature)
+    if 'item_id' in df.columns:
+        item_ids = df['item_id'].copy()
+        df = df.drop('item_id', axis=1)
+    else:
+        item_ids = None
+    
+    return df, item_ids
+
+def align_features_with_model(df, model):
+    """
+    Ensure DataFrame has all features expected by the model.
+    Fill missing columns with 0 and reorder columns to match model.
+    
+    Args:
+        df: DataFrame with features
+        model: CatBoost model
+    
+    Returns:
+        DataFrame with all model features in correct order
+    """
+    if model is None:
+        return df
+    
+    try:
+        # Get feature names from model
+        model_features = model.feature_names_
+        if model_features is None:
+            # Try to get from model attributes
+            model_features = getattr(model, 'feature_names_', None)
+    except:
+        # If we can't get feature names, return df as-is
+        logger.warning("Could not retrieve feature names from model")
+        return df
+    
+    if model_features is None:
+        logger.warning("Model feature names not available, using DataFrame as-is")
+        return df
+    
+    # Create a new DataFrame with all model features
+    aligned_df = pd.DataFrame(index=df.index)
+    
+    # Add all model features, filling with 0 if missing
+    for feature in model_features:
+        if feature in df.columns:
+            aligned_df[feature] = df[feature]
+        else:
+            aligned_df[feature] = 0
+            logger.debug("Missing feature '%s' in input data, filled with 0", feature)
+    
+    # Ensure columns are in the same order as model expects
+    aligned_df = aligned_df[model_features]
+    
+    return aligned_df
+
+def item_column(items, name):
+    """
+    One field of every item as a Series (None where an item lacks it), for either a
+    list of item dicts or a DataFrame. Returns None when no item has the field.
+    """
+    if isinstance(items, pd.DataFrame):
+        return items[name] if name in items.columns else None
+    values = [item.get(name) for item in items]
+    if all(value is None for value in values):
+        return None
+    return pd.Series(values, dtype=object)
+
+def map_unique(column, fn, missing):
+    """
+    Apply a scalar rule once per distinct value of a column and broadcast the results,
+    so text rules stay cheap on large batches. Nulls get `missing`.
+    """
+    codes, uniques = pd.factorize(column)
+    values = np.array([fn(value) for value in uniques] + [missing])
+    return values[codes]
+
+def disposal_mask(items):
+    """
+    Flag items that should be disposed (R condition number, Disposal status, or Non-Serviceable)
+    in a list of item dicts or a DataFrame of items.
+    Disposal items always get remaining_years = 0, whichever method is used.
+    """
+    n = len(items)
+    mask = np.zeros(n, dtype=bool)
+    condition_number = item_column(items, 'condition_number')
+    if condition_number is not None:
+        # R = Disposal
+        mask |= map_unique(condition_number, lambda v: bool(v) and str(v).upper() == 'R', False)
+    condition_status = item_column(items, 'condition_status')
+    if condition_status is not None:
+        mask |= map_unique(condition_status, lambda v: v == 'Disposal', False)
+    condition = item_column(items, 'condition')
+    if condition is not None:
+        mask |= map_unique(condition, lambda v: 'Non-Serviceable' in str(v) or 'Non - Serviceable' in str(v), False)
+    return mask
+
+def predict_with_model(items, model):
+    """
+    Predict remaining years for a batch of items with the CatBoost model.
+    
+    Returns:
+        Dict of per-item arrays (see predict_lifespan)
+    """
+    frame = items if isinstance(items, pd.DataFrame) else pd.DataFrame(items)
+    
+    # Prepare features from items
+    df, item_ids = prepare_features_for_prediction(frame)
+    
+    # Align features with model expectations
+    df_aligned = align_features_with_model(df, model)
+    
+    # Make predictions (single-threaded for small requests, see thread_budget.py)
+    remaining_years_predictions = model.predict(df_aligned, thread_count=inference_thread_count(len(df_aligned)))
+    
+    # Ensure predictions are in reasonable bounds (0.0 to 8 years)
+    # Allow values below 0.5 to show items ending soon (≤30 days = 0.082 years)
+    remaining_years_predictions = np.clip(remaining_years_predictions, 0.0, 8.0)
+    
+    # MultiQuantile models return one column per quantile from the same predict call.
+    # Sorting each row keeps the bands from crossing; the median is the point estimate.
+    bands = {}
+    quantiles = model_quantiles(model) if np.ndim(remaining_years_predictions) == 2 else None
+    if quantiles:
+        levels = sorted(quantiles)
+        sorted_predictions = np.sort(remaining_years_predictions, axis=1)
+        bands = {quantile_field(level): sorted_predictions[:, j] for j, level in enumerate(levels)}
+        remaining_years_predictions = sorted_predictions[:, int(np.argmin(np.abs(np.asarray(levels) - 0.5)))]
+    
+    if isinstance(items, pd.DataFrame):
+        item_ids = item_ids.tolist() if item_ids is not None else [None] * len(items)
+    else:
+        item_ids = [item.get('item_id') for item in items]
+    
+    disposal_flags = disposal_mask(frame)
+    if logger.isEnabledFor(logging.DEBUG):
+        for item_id in np.asarray(item_ids, dtype=object)[disposal_flags]:
+            logger.debug("🗑️ Item %s marked for DISPOSAL (R/Disposal/Non-Serviceable) - setting remaining_years to 0", item_id)
+    
+    result = {
+        'item_ids': item_ids,
+        'remaining_years': np.where(disposal_flags, 0.0, remaining_years_predictions),
+        'years_in_use': df['years_in_use'].to_numpy(dtype=np.float64),
+        'disposal_flag': disposal_flags,
+        'method': 'catboost_model',
+    }
+    # Disposal items get 0 in every band, like the point estimate
+    for field, values in bands.items():
+        result[field] = np.where(disposal_flags, 0.0, values)
+    return result
+
+def maintenance_reason_multiplier(last_reason):
+    """
+    Penalty multiplier for the (lower-cased) last maintenance reason.
+    """
+    if last_reason:
+        if 'wet' in last_reason or 'water' in last_reason:
+            return 1.5  # Water damage is severe
+        elif 'electrical' in last_reason or 'short' in last_reason or 'circuit' in last_reason:
+            return 1.4  # Electrical issues are serious
+        elif 'overheat' in last_reason or 'over heat' in last_reason or 'thermal' in last_reason:
+            return 1.3  # Thermal stress is significant
+        elif 'wear' in last_reason or 'worn' in last_reason:
+            return 1.1  # Normal wear is minor
+    return 1.0
+
+def predict_manual(items):
+    """
+    Deterministic fallback: base lifespan calculation with penalties based on maintenance and condition.
+    Evaluated on whole columns, so it stays fast for large batches.
+    
+    Returns:
+        Dict of per-item arrays (see predict_lifespan)
+    """
+    # Using previous prediction method: Manual calculation (deterministic)
+    logger.debug("Using previous prediction method: Manual calculation (deterministic)")
+    n = len(items)
+    item_id_column = item_column(items, 'item_id')
+    item_ids = item_id_column.tolist() if item_id_column is not None else [None] * n
+    
+    def numeric(name):
+        column = item_column(items, name)
+        if column is None:
+            return np.zeros(n)
+        return pd.to_numeric(column, errors='coerce').fillna(0).to_numpy(dtype=np.float64)
+    
+    years_in_use = numeric('years_in_use')
+    maintenance_count = np.trunc(numeric('maintenance_count'))
+    condition_number = numeric('condition_number')
+    disposal_flags = disposal_mask(items)
+    
+    # Calculate base remaining lifespan: 8 years max minus years in use
+    base_lifespan = np.maximum(0.0, 8.0 - years_in_use)
+    
+    # Base penalty: scales with maintenance count (more maintenance = higher penalty)
+    base_penalty = np.select([maintenance_count >= 4, maintenance_count >= 3], [1.5, 1.25], 1.0)
+    
+    # Scale based on condition number (higher condition number = worse condition)
+    condition_factor = np.where(condition_number >= 4, np.maximum(0.0, (condition_number - 3) * 0.25), 0.0)
+    
+    # Additional penalty multiplier based on maintenance reason severity
+    last_reason = item_column(items, 'last_reason')
+    if last_reason is not None:
+        reason_multiplier = map_unique(last_reason, lambda v: maintenance_reason_multiplier(str(v).lower()), 1.0)
+    else:
+        reason_multiplier = np.ones(n)
+    
+    # Additional cumulative penalties for multiple maintenance issues
+    history_penalty = np.select([maintenance_count >= 4, maintenance_count >= 3], [0.5, 0.3], 0.0)
+    
+    penalty = (base_penalty + condition_factor) * reason_multiplier + history_penalty
+    penalty = np.where((maintenance_count >= 2) | (condition_number >= 4), penalty, 0.0)
+    
+    # Allow values below 0.5 to show items ending soon (≤30 days = 0.082 years)
+    remaining = np.clip(base_lifespan - penalty, 0.0, 8.0)
+    # Disposal items always get remaining_years = 0
+    remaining = np.where(disposal_flags, 0.0, remaining)
+    
+    logger.debug("Manual calculation for %d items (%d marked for disposal)", n, disposal_flags.sum())
+    if logger.isEnabledFor(logging.DEBUG):
+        for i in range(n):
+            if disposal_flags[i]:
+                logger.debug("🗑️ Item %s marked for DISPOSAL (R/Disposal/Non-Serviceable) - setting remaining_years to 0", item_ids[i])
+                continue
+            status_indicator = ""
+            if remaining[i] <= 0.082:
+                status_indicator = " [URGENT]"
+            elif remaining[i] <= 0.164:
+                status_indicator = " [SOON]"
+            elif remaining[i] <= 0.5:
+                status_indicator = " [MONITOR]"
+            logger.debug(
+                "Lifespan prediction for item %s: %.1f years remaining (method: manual, years_in_use: %.1f, maintenance: %d, condition: %s)%s",
+                item_ids[i], remaining[i], years_in_use[i], maintenance_count[i], condition_number[i], status_indicator
+            )
+    
+    return {
+        'item_ids': item_ids,
+        'remaining_years': remaining,
+        'years_in_use': years_in_use,
+        'disposal_flag': disposal_flags,
+        'method': 'manual_calculation_fallback',
+    }
+
+def predict_lifespan(items, model):
+    """
+    Predict remaining lifespan for a batch of items.
+    Uses the CatBoost model when available and falls back to the manual calculation
+    if the model is missing or prediction fails.
+    
+    Args:
+        items: List of item dictionaries or a DataFrame of item columns
+            (same fields as prepare_features_for_prediction)
+        model: Loaded model from load_lifespan_model(), or None
+    
+    Returns:
+        Dict with 'item_ids', 'remaining_years' (clipped, 0 for disposal items),
+        'years_in_use', 'disposal_flag' arrays and the 'method' used. Quantile models
+        add one array per band (remaining_years_p10, ...), clipped the same way.
+    """
+    if model is not None and len(items):
+        try:
+            started = time.perf_counter()
+            result = predict_with_model(items, model)
+            lifespan_model_cost.observe(len(items), (time.perf_counter() - started) * 1000)
+            return result
+        except Exception as model_error:
+            logger.error(f"CatBoost model prediction failed: {str(model_error)}", exc_info=True)
+            logger.warning("Falling back to manual calculation method")
+    
+    return predict_manual(items)
+
+def slice_prediction_result(result, start, stop):
+    """
+    Return the predict_lifespan() result for items[start:stop] of the batch.
+    """
+    sliced = {key: value[start:stop] for key, value in result.items() if key != 'method'}
+    sliced['method'] = result['method']
+    return sliced
+
+def prediction_records(result, compact=False):
+    """
+    Build the per-item prediction dicts returned by the API from predict_lifespan() output.
+    Rounding is done on whole arrays (see prediction_columns).
+    
+    Args:
+        result: predict_lifespan() output
+        compact: Leave out the per-item method (reported once per response) and null fields
+    """
+    columns = prediction_columns(result)
+    item_ids = columns['item_id']
+    item_ids = item_ids.tolist() if isinstance(item_ids, np.ndarray) else item_ids
+    fields = ['item_id', 'remaining_years', 'lifespan_estimate', 'years_in_use', 'disposal_flag']
+    bands = quantile_fields(result)
+    rows = zip(
+        item_ids, columns['remaining_years'].tolist(), columns['lifespan_estimate'].tolist(),
+        columns['years_in_use'].tolist(), columns['disposal_flag'].tolist(),
+        *(columns[field].tolist() for field in bands)
+    )
+    if compact:
+        return [{k: v for k, v in zip(fields + bands, row) if v is not None} for row in rows]
+    
+    method = result['method']
+    if bands:
+        return [
+            {'item_id': i, 'remaining_years': r, 'lifespan_estimate': l, 'years_in_use': y, 'method': method,
+             'disposal_flag': d, **dict(zip(bands, band_values))}
+            for i, r, l, y, d, *band_values in rows
+        ]
+    return [
+        {'item_id': i, 'remaining_years': r, 'lifespan_estimate': l, 'years_in_use': y, 'method': method, 'disposal_flag': d}
+        for i, r, l, y, d in rows
+    ]
+
+def round_like_python(values, decimals=1):
+    """
+    Vectorized round() that matches Python's round() exactly: np.round is used for
+    the bulk and values close to a rounding tie are rounded one by one.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    rounded = np.round(values, decimals)
+    scaled = values * 10 ** decimals
+    near_tie = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    if near_tie.any():
+        rounded[near_tie] = [round(float(v), decimals) for v in values[near_tie]]
+    return rounded
+
+def prediction_columns(result):
+    """
+    Build the columnar form of the API predictions (one array per field) from
+    predict_lifespan() output, rounded the same way as prediction_records().
+    The method is the same for every item, so it is not repeated per item.
+    """
+    item_ids = np.asarray(result['item_ids'])
+    years_in_use = np.asarray(result['years_in_use'], dtype=np.float64)
+    if result['method'] == 'manual_calculation_fallback':
+        # The manual calculation has always rounded its NumPy results with NumPy's
+        # rounding (ties differ from round()); disposal items keep round(years_in_use)
+        disposal_flags = np.asarray(result['disposal_flag'], dtype=bool)
+        remaining_years = np.round(np.asarray(result['remaining_years'], dtype=np.float64), 1)
+        lifespan_estimate = np.where(disposal_flags, round_like_python(years_in_use),
+                                     np.round(years_in_use + remaining_years, 1))
+    else:
+        remaining_years = round_like_python(result['remaining_years'])
+        lifespan_estimate = round_like_python(years_in_use + remaining_years)
+    columns = {
+        'item_id': item_ids if item_ids.dtype.kind in 'iu' else list(result['item_ids']),
+        'remaining_years': remaining_years,
+        'lifespan_estimate': lifespan_estimate,
+        'years_in_use': round_like_python(years_in_use),
+        'disposal_flag': np.asarray(result['disposal_flag'], dtype=bool),
+    }
+    for field in quantile_fields(result):
+        columns[field] = round_like_python(result[field])
+    return columns
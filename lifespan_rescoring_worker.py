@@ -0,0 +1,260 @@
+"""
+Event-driven Lifespan Rescoring Worker
+
+CalculateLifespanJob and score_lifespan_items.py rescore the whole inventory, so an
+item's remaining_years stays stale until the next run after a maintenance record or
+condition change. This long-running worker rescores only the items that changed:
+
+- Changes are recorded as rows in item_change_events (item_id, reason, created_at).
+  Database triggers on items and maintenance_records insert them (see the Laravel
+  migration create_item_change_events_table); anything else may insert rows too.
+- Events are debounced per item: an item is picked up once it has had no new event
+  for --debounce seconds, or --max-wait seconds after its first event if it keeps
+  changing. All of an item's pending events are claimed together, so a burst of
+  edits leads to a single rescore.
+- Claimed items are read with the same feature query as score_lifespan_items.py,
+  scored in one predict_lifespan() call and written back with its set-based bulk
+  UPDATE. The claimed events are deleted in the same transaction, so a failed batch
+  leaves its events queued for the next attempt.
+- On PostgreSQL, events are claimed with FOR UPDATE SKIP LOCKED, so several workers
+  can run side by side without scoring the same item twice.
+
+A local SQLite database works as a stand-in for testing. The worker creates the
+queue table and the same triggers there.
+
+Usage:
+    python lifespan_rescoring_worker.py                        # PostgreSQL (DB_* env vars), run until stopped
+    python lifespan_rescoring_worker.py --sqlite local.db --seed-from db_new.sql --once
+                                                               # SQLite stand-in: drain the queue and exit
+    python lifespan_rescoring_worker.py --sqlite local.db --enqueue 12 15
+                                                               # queue events for items 12 and 15 by hand
+
+Options:
+    --model PATH          Score with a specific .cbm/.npz file instead of the server's active model
+    --batch-items N       Most items claimed and scored per batch (default 500)
+    --debounce SECONDS    Quiet period after an item's last event before it is rescored (default 2)
+    --max-wait SECONDS    Rescore an item this long after its first event even if it keeps changing (default 30)
+    --poll-interval SECS  Sleep between polls while the queue is empty (default 1)
+    --once                Process the events that are ready, then exit
+
+The model is loaded once at startup; restart the worker after retraining.
+"""
+
+import argparse
+import logging
+import signal
+import sqlite3
+import sys
+import threading
+import time
+
+from lifespan_db import connect_to_database
+from lifespan_predictor import load_lifespan_model, load_model_file
+from score_lifespan_items import read_items, score_items, seed_sqlite, write_back
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Item columns the feature query reads; changing any of them queues a rescore.
+# remaining_years / lifespan_estimate are not among them, so write-backs queue nothing.
+WATCHED_ITEM_COLUMNS = ('category_id', 'condition_id', 'condition_number_id', 'date_acquired',
+                        'maintenance_count', 'deleted_at')
+
+# Queue table and triggers for the SQLite stand-in (timestamps in UTC, millisecond precision)
+SQLITE_NOW = "strftime('%Y-%m-%d %H:%M:%f', 'now')"
+SQLITE_QUEUE_SCHEMA = [
+    f"""CREATE TABLE IF NOT EXISTS item_change_events (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        item_id INTEGER NOT NULL,
+        reason TEXT,
+        created_at TEXT NOT NULL DEFAULT ({SQLITE_NOW})
+    )""",
+    "CREATE INDEX IF NOT EXISTS item_change_events_item_id_index ON item_change_events (item_id)",
+    """CREATE TRIGGER IF NOT EXISTS items_queue_rescore_insert AFTER INSERT ON items
+    BEGIN INSERT INTO item_change_events (item_id, reason) VALUES (NEW.id, 'items'); END""",
+    f"""CREATE TRIGGER IF NOT EXISTS items_queue_rescore_update AFTER UPDATE OF {', '.join(WATCHED_ITEM_COLUMNS)} ON items
+    BEGIN INSERT INTO item_change_events (item_id, reason) VALUES (NEW.id, 'items'); END""",
+    """CREATE TRIGGER IF NOT EXISTS maintenance_records_queue_rescore_insert AFTER INSERT ON maintenance_records
+    BEGIN INSERT INTO item_change_events (item_id, reason) VALUES (NEW.item_id, 'maintenance_records'); END""",
+    """CREATE TRIGGER IF NOT EXISTS maintenance_records_queue_rescore_update AFTER UPDATE ON maintenance_records
+    BEGIN INSERT INTO item_change_events (item_id, reason) VALUES (NEW.item_id, 'maintenance_records'); END""",
+    """CREATE TRIGGER IF NOT EXISTS maintenance_records_queue_rescore_delete AFTER DELETE ON maintenance_records
+    BEGIN INSERT INTO item_change_events (item_id, reason) VALUES (OLD.item_id, 'maintenance_records'); END""",
+]
+
+
+def ensure_sqlite_queue(conn):
+    """Create the event queue table and change triggers in a SQLite stand-in."""
+    for statement in SQLITE_QUEUE_SCHEMA:
+        conn.execute(statement)
+    conn.commit()
+
+
+def enqueue_events(conn, dialect, item_ids, reason='manual'):
+    """Queue a change event for each item (committed immediately)."""
+    placeholder = '?' if dialect == 'sqlite' else '%s'
+    cur = conn.cursor()
+    cur.executemany(f"INSERT INTO item_change_events (item_id, reason) VALUES ({placeholder}, {placeholder})",
+                    [(int(item_id), reason) for item_id in item_ids])
+    conn.commit()
+
+
+def claim_ready_items(conn, dialect, batch_items, debounce, max_wait):
+    """
+    Delete the pending events of up to batch_items items that are ready (quiet for
+    debounce seconds, or first queued at least max_wait seconds ago) and return
+    their item_ids. Runs inside the caller's transaction, so the events come back
+    if it is rolled back.
+    """
+    cur = conn.cursor()
+    if dialect == 'sqlite':
+        cur.execute("""
+            DELETE FROM item_change_events
+            WHERE item_id IN (
+                SELECT item_id FROM item_change_events
+                GROUP BY item_id
+                HAVING MAX(created_at) <= strftime('%Y-%m-%d %H:%M:%f', 'now', ?)
+                    OR MIN(created_at) <= strftime('%Y-%m-%d %H:%M:%f', 'now', ?)
+                ORDER BY MIN(created_at)
+                LIMIT ?
+            )
+            RETURNING item_id
+        """, (f'-{debounce} seconds', f'-{max_wait} seconds', batch_items))
+    else:
+        # Rows another worker has locked are skipped; they are deleted (or released) by it
+        cur.execute("""
+            WITH ready AS (
+                SELECT item_id FROM item_change_events
+                GROUP BY item_id
+                HAVING MAX(created_at) <= NOW() - make_interval(secs => %s)
+                    OR MIN(created_at) <= NOW() - make_interval(secs => %s)
+                ORDER BY MIN(created_at)
+                LIMIT %s
+            )
+            DELETE FROM item_change_events
+            WHERE id IN (
+                SELECT id FROM item_change_events
+                WHERE item_id IN (SELECT item_id FROM ready)
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING item_id
+        """, (debounce, max_wait, batch_items))
+    return sorted({row[0] for row in cur.fetchall()})
+
+
+def process_batch(conn, dialect, model, batch_items, debounce, max_wait):
+    """
+    Claim, score and write back one batch in a single transaction.
+    Returns (items claimed, rows updated).
+    """
+    try:
+        if dialect == 'sqlite':
+            # Take the write lock up front so claiming and write-back see the same queue
+            conn.execute('BEGIN IMMEDIATE')
+        item_ids = claim_ready_items(conn, dialect, batch_items, debounce, max_wait)
+        if not item_ids:
+            conn.rollback()
+            return 0, 0
+        # Deleted or consumable items drop out of the feature query and are not written
+        df = read_items(conn, dialect, item_ids)
+        scores = score_items(df, model, max(1, len(df)))
+        updated = write_back(conn, scores, dialect, max(1, len(scores)))
+        conn.commit()
+        return len(item_ids), updated
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def run(conn, dialect, model, batch_items, debounce, max_wait, poll_interval, once=False, stop=None):
+    """
+    Process ready batches until stopped (or, with once, until none is ready).
+    A failed batch is logged and retried after poll_interval.
+    """
+    stop = stop or threading.Event()
+    total_items = total_updated = 0
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            claimed, updated = process_batch(conn, dialect, model, batch_items, debounce, max_wait)
+        except Exception as e:
+            logger.error(f"❌ Rescoring batch failed, events left queued: {e}")
+            if once:
+                raise
+            stop.wait(poll_interval)
+            continue
+        if claimed:
+            total_items += claimed
+            total_updated += updated
+            logger.info(f"✅ Rescored {claimed} items, updated {updated} rows ({(time.perf_counter() - start) * 1000:.0f} ms)")
+            # More may be ready: keep going without sleeping
+            continue
+        if once:
+            break
+        stop.wait(poll_interval)
+    return total_items, total_updated
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Rescore lifespan predictions for items with queued change events')
+    parser.add_argument('--sqlite', default=None, help='Use a local SQLite database instead of PostgreSQL')
+    parser.add_argument('--seed-from', default=None, help='Create the SQLite stand-in from this pg_dump file first')
+    parser.add_argument('--enqueue', type=int, nargs='+', metavar='ITEM_ID', help='Queue events for these items and exit')
+    parser.add_argument('--model', default=None, help='Model file (.cbm or .npz) to score with')
+    parser.add_argument('--batch-items', type=int, default=500, help='Most items claimed and scored per batch')
+    parser.add_argument('--debounce', type=float, default=2.0, help="Seconds without new events before an item is rescored")
+    parser.add_argument('--max-wait', type=float, default=30.0, help="Seconds after an item's first event before it is rescored anyway")
+    parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds between polls while the queue is empty')
+    parser.add_argument('--once', action='store_true', help='Process the events that are ready, then exit')
+    args = parser.parse_args()
+
+    if args.seed_from and not args.sqlite:
+        parser.error('--seed-from requires --sqlite')
+
+    if args.sqlite:
+        dialect = 'sqlite'
+        conn = sqlite3.connect(args.sqlite, timeout=30)
+        if args.seed_from:
+            logger.info(f"Seeding SQLite stand-in {args.sqlite} from {args.seed_from}...")
+            seed_sqlite(conn, args.seed_from)
+        ensure_sqlite_queue(conn)
+    else:
+        dialect = 'postgresql'
+        conn = connect_to_database()
+
+    if args.enqueue:
+        enqueue_events(conn, dialect, args.enqueue)
+        logger.info(f"✅ Queued {len(args.enqueue)} change events")
+        conn.close()
+        return
+
+    logger.info("=" * 60)
+    logger.info("🔄 Lifespan Rescoring Worker")
+    logger.info("=" * 60)
+
+    model = load_model_file(args.model) if args.model else load_lifespan_model()
+    if model is None:
+        logger.warning("⚠️ No model available - manual calculation will be used")
+
+    stop = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: stop.set())
+
+    logger.info(f"👂 Waiting for item change events (debounce {args.debounce:g}s, max wait {args.max_wait:g}s)")
+    try:
+        items, updated = run(conn, dialect, model, args.batch_items, args.debounce, args.max_wait,
+                             args.poll_interval, once=args.once, stop=stop)
+        logger.info(f"👋 Stopped after rescoring {items} items ({updated} rows updated)")
+    except Exception as e:
+        logger.error(f"❌ Worker failed: {e}")
+        sys.exit(1)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
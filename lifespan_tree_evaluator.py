@@ -0,0 +1,313 @@
+"""
+NumPy Evaluator for the CatBoost Lifespan Model
+
+CatBoost builds oblivious (symmetric) trees: every level of a tree uses the same
+split, so a tree of depth D is just D (feature, border) pairs plus 2^D leaf values.
+This module exports those arrays from a trained .cbm file into a small .npz file
+and evaluates them with vectorized NumPy bit operations, so API workers can serve
+lifespan predictions without importing the catboost library.
+
+Usage:
+    python lifespan_tree_evaluator.py                          # export catboost_lifespan_model.cbm
+    python lifespan_tree_evaluator.py path/to/model.cbm --out path/to/model.npz
+    python lifespan_tree_evaluator.py --verify                 # compare against CatBoostRegressor.predict
+
+Only float features are supported (the lifespan model is trained on numeric and
+one-hot encoded columns, so it has no categorical features or CTRs).
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Rows evaluated per chunk - keeps the (rows x trees) index matrix small for huge batches
+EVAL_CHUNK_ROWS = 65536
+
+
+def export_oblivious_trees(model, out_path, model_path=None):
+    """
+    Export a trained CatBoost model's oblivious trees to a compact .npz file.
+
+    Args:
+        model: CatBoostRegressor instance or path to a .cbm file
+        out_path: Destination .npz path
+        model_path: Path of the .cbm file the model was loaded from (optional,
+            recorded so stale exports can be detected)
+
+    Returns:
+        Path of the written file
+    """
+    if isinstance(model, (str, os.PathLike)):
+        from catboost import CatBoostRegressor
+        model_path = os.fspath(model)
+        model = CatBoostRegressor()
+        model.load_model(model_path)
+
+    arrays = _arrays_from_model_json(model_to_json(model))
+    if model_path is not None:
+        # Lets the server detect an export that is older than the .cbm it came from
+        arrays['source_sha256'] = np.array(file_sha256(model_path))
+    np.savez_compressed(out_path, **arrays)
+    return out_path
+
+
+def model_to_json(model):
+    """CatBoost's JSON dump of a model (the documented way to read the tree structure)."""
+    fd, json_path = tempfile.mkstemp(suffix='.json')
+    os.close(fd)
+    try:
+        model.save_model(json_path, format='json')
+        with open(json_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    finally:
+        os.remove(json_path)
+
+
+def split_borders_by_feature(model):
+    """
+    Sorted float32 borders the model's splits compare each feature against, keyed by
+    feature name (features no split uses are left out), for an ObliviousTreeEvaluator
+    or a CatBoost model. Rows that fall between the same borders on every feature get
+    exactly the same prediction.
+    """
+    if isinstance(model, ObliviousTreeEvaluator):
+        feature_names, split_features, split_borders = model.feature_names_, model.split_features, model.split_borders
+    else:
+        arrays = _arrays_from_model_json(model_to_json(model))
+        feature_names, split_features, split_borders = arrays['feature_names'], arrays['split_features'], arrays['split_borders']
+    # +inf borders only pad shallow trees
+    used = np.isfinite(split_borders)
+    features, borders = split_features[used], split_borders[used].astype(np.float32)
+    return {str(feature_names[f]): np.unique(borders[features == f]) for f in np.unique(features)}
+
+
+def file_sha256(path):
+    """Return the hex SHA-256 digest of a file."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 16), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _arrays_from_model_json(model_json):
+    """
+    Convert CatBoost's JSON model dump into padded NumPy arrays.
+
+    Trees shallower than the deepest tree are padded with splits whose border is
+    +inf, so the padded bits are always 0 and every tree can be evaluated together.
+    """
+    features_info = model_json.get('features_info', {})
+    if features_info.get('categorical_features') or features_info.get('text_features'):
+        raise ValueError("Only models with float features can be exported to the NumPy evaluator")
+
+    float_features = features_info.get('float_features', [])
+    feature_names = [
+        f.get('feature_id') or str(f['flat_feature_index'])
+        for f in sorted(float_features, key=lambda f: f['flat_feature_index'])
+    ]
+    # Split indices in the JSON refer to float features; map them to flat (column) positions
+    float_to_flat = {f['feature_index']: f['flat_feature_index'] for f in float_features}
+
+    trees = model_json['oblivious_trees']
+    tree_count = len(trees)
+    max_depth = max((len(t['splits']) for t in trees), default=0)
+
+    scale, bias = model_json.get('scale_and_bias', [1.0, [0.0]])
+    bias = np.atleast_1d(np.asarray(bias, dtype=np.float64))
+    dimension = len(bias)
+
+    split_features = np.zeros((tree_count, max_depth), dtype=np.int32)
+    split_borders = np.full((tree_count, max_depth), np.inf, dtype=np.float32)
+    tree_depths = np.zeros(tree_count, dtype=np.int32)
+    leaf_values = np.zeros((tree_count, 2 ** max_depth, dimension), dtype=np.float64)
+
+    for t, tree in enumerate(trees):
+        splits = tree['splits']
+        depth = len(splits)
+        tree_depths[t] = depth
+        for d, split in enumerate(splits):
+            if split.get('split_type', 'FloatFeature') != 'FloatFeature':
+                raise ValueError(f"Unsupported split type: {split.get('split_type')}")
+            split_features[t, d] = float_to_flat[split['float_feature_index']]
+            split_borders[t, d] = split['border']
+        values = np.asarray(tree['leaf_values'], dtype=np.float64)
+        leaf_values[t, :2 ** depth, :] = values.reshape(2 ** depth, dimension)
+
+    arrays = {
+        'feature_names': np.array(feature_names, dtype=np.str_),
+        'split_features': split_features,
+        'split_borders': split_borders,
+        'tree_depths': tree_depths,
+        'leaf_values': leaf_values,
+        'scale': np.float64(scale),
+        'bias': bias,
+    }
+    quantiles = quantile_levels(model_json.get('model_info', {}).get('params', {}).get('loss_function'))
+    if quantiles is not None:
+        arrays['quantiles'] = np.asarray(quantiles, dtype=np.float64)
+    return arrays
+
+
+def quantile_levels(loss_function):
+    """
+    Quantile levels of a MultiQuantile model, one per output dimension, or None.
+
+    Args:
+        loss_function: Loss as a string ('MultiQuantile:alpha=0.1,0.5,0.9') or as the
+            {'type': ..., 'params': {...}} dict of a JSON model dump
+    """
+    if isinstance(loss_function, dict):
+        loss_type, alpha = loss_function.get('type'), loss_function.get('params', {}).get('alpha')
+    elif isinstance(loss_function, str):
+        loss_type, _, params = loss_function.partition(':')
+        alpha = dict(p.split('=', 1) for p in params.split(';') if '=' in p).get('alpha')
+    else:
+        return None
+    if loss_type != 'MultiQuantile' or not alpha:
+        return None
+    return tuple(float(a) for a in str(alpha).split(','))
+
+
+class ObliviousTreeEvaluator:
+    """
+    Drop-in replacement for CatBoostRegressor.predict on exported oblivious trees.
+
+    Exposes feature_names_ and predict() so it can be used anywhere the server
+    expects a loaded CatBoost model.
+    """
+
+    def __init__(self, feature_names, split_features, split_borders, tree_depths,
+                 leaf_values, scale=1.0, bias=0.0, source_sha256=None, quantiles=None):
+        self.feature_names_ = [str(name) for name in feature_names]
+        self.split_features = np.asarray(split_features, dtype=np.int32)
+        self.split_borders = np.asarray(split_borders, dtype=np.float32)
+        self.tree_depths = np.asarray(tree_depths, dtype=np.int32)
+        self.leaf_values = np.asarray(leaf_values, dtype=np.float64)
+        self.scale = float(scale)
+        self.bias = np.atleast_1d(np.asarray(bias, dtype=np.float64))
+        self.source_sha256 = source_sha256
+        # Quantile level of each output column for MultiQuantile models
+        self.quantiles_ = tuple(float(q) for q in quantiles) if quantiles is not None else None
+        self.tree_count_ = len(self.tree_depths)
+        self._tree_index = np.arange(self.tree_count_)
+
+    @classmethod
+    def load(cls, path):
+        """Load an evaluator from a .npz file written by export_oblivious_trees()."""
+        with np.load(path, allow_pickle=False) as data:
+            return cls(
+                feature_names=data['feature_names'],
+                split_features=data['split_features'],
+                split_borders=data['split_borders'],
+                tree_depths=data['tree_depths'],
+                leaf_values=data['leaf_values'],
+                scale=data['scale'],
+                bias=data['bias'],
+                source_sha256=str(data['source_sha256']) if 'source_sha256' in data.files else None,
+                quantiles=data['quantiles'] if 'quantiles' in data.files else None,
+            )
+
+    def predict(self, X, thread_count=None):
+        """
+        Predict for a batch of rows.
+
+        Args:
+            X: DataFrame or 2D array with columns in feature_names_ order
+            thread_count: Threads evaluating row chunks in parallel (None, 1 or -1 = one thread)
+
+        Returns:
+            1D array of predictions (2D for multi-dimensional models)
+        """
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if X.shape[1] != len(self.feature_names_):
+            raise ValueError(f"Expected {len(self.feature_names_)} features, got {X.shape[1]}")
+
+        result = np.empty((X.shape[0], len(self.bias)), dtype=np.float64)
+        threads = max(1, thread_count or 1)
+        # Enough chunks for every thread, but never larger than EVAL_CHUNK_ROWS
+        chunk_rows = max(1, min(EVAL_CHUNK_ROWS, -(-X.shape[0] // threads)))
+        starts = range(0, X.shape[0], chunk_rows)
+
+        def evaluate(start):
+            result[start:start + chunk_rows] = self._predict_chunk(X[start:start + chunk_rows])
+
+        if threads > 1 and len(starts) > 1:
+            # NumPy releases the GIL in the comparisons and gathers, so chunks run in parallel
+            with ThreadPoolExecutor(max_workers=threads) as executor:
+                list(executor.map(evaluate, starts))
+        else:
+            for start in starts:
+                evaluate(start)
+
+        result = self.scale * result + self.bias
+        return result[:, 0] if result.shape[1] == 1 else result
+
+    def _predict_chunk(self, X):
+        # Build each row's leaf index per tree: bit d is set when the level-d split fires
+        leaf_index = np.zeros((X.shape[0], self.tree_count_), dtype=np.int32)
+        for d in range(self.split_features.shape[1]):
+            fired = X[:, self.split_features[:, d]] > self.split_borders[:, d]
+            leaf_index |= fired.astype(np.int32) << d
+        # (rows, trees, dimension) -> sum over trees
+        return self.leaf_values[self._tree_index, leaf_index].sum(axis=1)
+
+
+def main():
+    """
+    Export a .cbm model to the NumPy format and optionally verify it.
+    """
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description='Export CatBoost oblivious trees for NumPy inference')
+    parser.add_argument('model', nargs='?', default='catboost_lifespan_model.cbm', help='Path to the .cbm model')
+    parser.add_argument('--out', default=None, help='Output .npz path (default: next to the model)')
+    parser.add_argument('--verify', action='store_true', help='Compare against CatBoostRegressor.predict on random rows')
+    parser.add_argument('--rows', type=int, default=10000, help='Number of random rows used by --verify')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.model):
+        logger.error(f"❌ Model file not found: {args.model}")
+        sys.exit(1)
+
+    from catboost import CatBoostRegressor
+    model = CatBoostRegressor()
+    model.load_model(args.model)
+
+    out_path = args.out or os.path.splitext(args.model)[0] + '.npz'
+    export_oblivious_trees(model, out_path, model_path=args.model)
+    logger.info(f"✅ Exported {model.tree_count_} trees to {out_path} ({os.path.getsize(out_path) / 1024:.2f} KB)")
+
+    if args.verify:
+        evaluator = ObliviousTreeEvaluator.load(out_path)
+        rng = np.random.default_rng(42)
+        n_features = len(evaluator.feature_names_)
+        # Mix of small integers (counts, one-hot flags) and continuous values
+        X = np.where(
+            rng.random((args.rows, n_features)) < 0.5,
+            rng.integers(0, 2, (args.rows, n_features)),
+            rng.uniform(0, 10, (args.rows, n_features)),
+        )
+        expected = model.predict(X)
+        actual = evaluator.predict(X)
+        max_error = float(np.max(np.abs(expected - actual)))
+        if np.allclose(expected, actual, rtol=1e-6, atol=1e-6):
+            logger.info(f"✅ NumPy evaluator matches CatBoost (max abs error: {max_error:.2e})")
+        else:
+            logger.error(f"❌ NumPy evaluator mismatch (max abs error: {max_error:.2e})")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
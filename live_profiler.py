@@ -0,0 +1,177 @@
+"""
+Live Profiling for a Running API Worker
+
+A time-boxed sampling profiler: the calling thread snapshots the Python stack of
+every other thread (sys._current_frames) at a fixed interval. The samples become
+
+- collapsed stacks ("frame;frame;frame count" lines) for flamegraph.pl / speedscope
+- top functions by cumulative and self time (samples x measured sampling interval)
+
+and, optionally, the top allocation sites recorded by tracemalloc during the session.
+Only one session runs at a time. Sampling adds no overhead to the profiled threads
+beyond the GIL time taken by the sampler itself.
+
+Usage:
+    profile = profile_process(duration_s=10, interval_ms=5, track_allocations=True)
+"""
+
+import collections
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+# Longest session the API allows
+MAX_PROFILE_SECONDS = float(os.getenv('ML_API_PROFILE_MAX_SECONDS', '60'))
+
+# Leaf frames of threads that are blocked waiting for work; skipped unless include_idle
+IDLE_LEAVES = {
+    ('threading.py', 'wait'),
+    ('selectors.py', 'select'),
+    ('socket.py', 'accept'),
+    ('socket.py', 'readinto'),
+    ('queue.py', 'get'),
+    ('handlers.py', 'dequeue'),
+    ('thread.py', '_worker'),
+    ('base_events.py', '_run_once'),
+}
+
+_session_lock = threading.Lock()
+
+
+class ProfilerBusy(RuntimeError):
+    """Another profiling session is already running in this process."""
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}:{code.co_firstlineno}"
+
+
+def _stack(frame):
+    """Root-first list of frame labels."""
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    labels.reverse()
+    return labels
+
+
+def _is_idle(frame):
+    code = frame.f_code
+    return (os.path.basename(code.co_filename), code.co_name) in IDLE_LEAVES
+
+
+def sample_stacks(duration_s, interval_ms=5.0, include_idle=False, exclude_threads=()):
+    """
+    Sample all thread stacks for duration_s seconds.
+
+    Returns:
+        Tuple of (Counter of root-first stack tuples -> sample count, number of sampling rounds)
+    """
+    interval = interval_ms / 1000.0
+    skip = set(exclude_threads) | {threading.get_ident()}
+    names = {}
+    stacks = collections.Counter()
+    rounds = 0
+    deadline = time.perf_counter() + duration_s
+    while time.perf_counter() < deadline:
+        rounds += 1
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id in skip or (not include_idle and _is_idle(frame)):
+                continue
+            if thread_id not in names:
+                names = {t.ident: t.name for t in threading.enumerate()}
+            thread_name = names.get(thread_id, str(thread_id))
+            stacks[(f'thread:{thread_name}', *_stack(frame))] += 1
+        time.sleep(interval)
+    return stacks, rounds
+
+
+def collapsed_stacks(stacks):
+    """Render stacks in the collapsed format used by flamegraph.pl and speedscope."""
+    return '\n'.join(f"{';'.join(stack)} {count}" for stack, count in stacks.most_common())
+
+
+def top_functions(stacks, interval_ms, limit=30):
+    """
+    Functions ranked by cumulative time (samples with the function anywhere on the
+    stack, counted once per sample) with their self time (samples as the leaf).
+    """
+    cumulative = collections.Counter()
+    own = collections.Counter()
+    for stack, count in stacks.items():
+        frames = stack[1:]
+        for label in set(frames):
+            cumulative[label] += count
+        if frames:
+            own[frames[-1]] += count
+    return [
+        {
+            'function': label,
+            'samples': count,
+            'cumulative_ms': round(count * interval_ms, 1),
+            'self_ms': round(own[label] * interval_ms, 1),
+        }
+        for label, count in cumulative.most_common(limit)
+    ]
+
+
+def top_allocations(snapshot, limit=30):
+    """Largest allocation sites (by line) still alive at the end of the session."""
+    return [
+        {
+            'location': f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+            'size_kb': round(stat.size / 1024, 1),
+            'count': stat.count,
+        }
+        for stat in snapshot.statistics('lineno')[:limit]
+    ]
+
+
+def profile_process(duration_s=10.0, interval_ms=5.0, track_allocations=False, include_idle=False, limit=30):
+    """
+    Run one profiling session in this process and return its results.
+
+    Raises:
+        ProfilerBusy: if a session is already running
+    """
+    duration_s = max(0.1, min(float(duration_s), MAX_PROFILE_SECONDS))
+    interval_ms = max(1.0, float(interval_ms))
+    if not _session_lock.acquire(blocking=False):
+        raise ProfilerBusy('A profiling session is already running')
+
+    started_tracing = False
+    try:
+        if track_allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            started_tracing = True
+
+        started = time.perf_counter()
+        stacks, rounds = sample_stacks(duration_s, interval_ms, include_idle)
+        elapsed = time.perf_counter() - started
+
+        # Each round takes a little longer than the requested interval
+        ms_per_round = elapsed * 1000 / max(rounds, 1)
+        result = {
+            'duration_s': round(elapsed, 3),
+            'interval_ms': round(ms_per_round, 3),
+            'sampling_rounds': rounds,
+            'samples': sum(stacks.values()),
+            'collapsed': collapsed_stacks(stacks),
+            'top_cumulative': top_functions(stacks, ms_per_round, limit),
+        }
+        if track_allocations:
+            current, peak = tracemalloc.get_traced_memory()
+            result['allocations'] = {
+                'current_kb': round(current / 1024, 1),
+                'peak_kb': round(peak / 1024, 1),
+                'top': top_allocations(tracemalloc.take_snapshot(), limit),
+            }
+        return result
+    finally:
+        if started_tracing:
+            tracemalloc.stop()
+        _session_lock.release()
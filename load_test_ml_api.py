@@ -0,0 +1,402 @@
+"""
+HTTP Load Test for the ML API
+
+Replays production-shaped traffic against a running (or locally started) ML API and
+reports throughput, latency percentiles and error rates per endpoint. Unlike
+benchmark_ml_api.py this goes through the full stack: HTTP, Flask, JSON and the
+server's worker/admission layers.
+
+Request bodies are built from the bundled database dumps:
+
+- lifespan: the item features score_lifespan_items.py reads (category, age,
+  maintenance count, condition, last maintenance reason), sampled with replacement
+- consumables: quarterly usage histories from supply_usages, with current stock from
+  items.quantity. The dumps hold only a handful of histories, so the pool is widened
+  with scaled and truncated copies of them.
+
+Dumps that cannot be read (IrrigTrack.sql is damaged) are skipped with a warning.
+
+Arrivals are open-loop (Poisson at --rate requests/s): requests are sent on schedule
+whether or not earlier ones have finished, at most --concurrency at a time. Latency is
+measured from each request's scheduled time, so time spent waiting for a free client
+slot counts, as it would for a real caller. --rate 0 sends back-to-back instead
+(closed loop, one request per slot at a time).
+
+Usage:
+    python load_test_ml_api.py --start-server --duration 30 --rate 50 --concurrency 16
+    python load_test_ml_api.py --start-server --server asgi --rate 200 --concurrency 64
+    python load_test_ml_api.py --url http://localhost:5000 --mix lifespan=1 --batch-sizes 1,50,500
+"""
+
+import argparse
+import http.client
+import json
+import logging
+import os
+import random
+import re
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from sql_dump_reader import read_dump_tables
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DUMPS = ['nia_db.sql', 'db_new.sql', 'IrrigTrack.sql']
+
+ENDPOINTS = {
+    'lifespan': '/predict/items/lifespan',
+    'consumables': '/predict/consumables/linear',
+}
+
+SERVER_SCRIPTS = {
+    'flask': 'ml_api_server.py',
+    'asgi': 'ml_api_asgi.py',
+}
+
+PERIOD_PATTERN = re.compile(r'Q([1-4])\s+(\d{4})')
+
+
+def load_lifespan_pool(dumps):
+    """Item feature records (the lifespan endpoint's input) from every readable dump."""
+    # Imported here: score_lifespan_items configures logging on import, which would
+    # override this script's plain report format
+    from score_lifespan_items import read_items, seed_sqlite
+
+    pool = []
+    for path in dumps:
+        conn = sqlite3.connect(':memory:')
+        try:
+            seed_sqlite(conn, path)
+            pool.extend(read_items(conn, 'sqlite').to_dict(orient='records'))
+        except (OSError, ValueError) as e:
+            logger.warning(f"⚠️  Skipping {path} for lifespan items: {e}")
+        finally:
+            conn.close()
+    return pool
+
+
+def load_consumable_histories(dumps):
+    """
+    Consumable items with their quarterly usage, oldest quarter first, from every
+    readable dump that has a supply_usages table.
+    """
+    histories = []
+    for path in dumps:
+        try:
+            tables = read_dump_tables(path, ['supply_usages', 'items'])
+        except (OSError, ValueError) as e:
+            logger.warning(f"⚠️  Skipping {path} for consumables: {e}")
+            continue
+        if 'supply_usages' not in tables:
+            continue
+
+        item_columns, item_rows = tables.get('items', ([], []))
+        items = {row[item_columns.index('id')]: dict(zip(item_columns, row)) for row in item_rows}
+
+        usage_columns, usage_rows = tables['supply_usages']
+        by_item = defaultdict(list)
+        for row in usage_rows:
+            record = dict(zip(usage_columns, row))
+            match = PERIOD_PATTERN.match(record['period'] or '')
+            if match:
+                quarter, year = int(match.group(1)), int(match.group(2))
+                by_item[record['item_id']].append(((year, quarter), record['period'], int(record['usage'] or 0)))
+
+        for item_id, points in by_item.items():
+            points.sort()
+            item = items.get(item_id, {})
+            histories.append({
+                'name': item.get('description') or f'Item {item_id}',
+                'current_stock': int(item.get('quantity') or 0),
+                'history': [
+                    {'period': period, 'timestamp': f"{year}-{(quarter - 1) * 3 + 1:02d}-01", 'usage': usage}
+                    for (year, quarter), period, usage in points
+                ],
+            })
+    return histories
+
+
+def widen_consumables(histories, size, seed=0):
+    """
+    Build `size` consumable request items from the real histories: each copy is
+    scaled by a random factor and keeps a random number of its most recent quarters.
+    """
+    rng = random.Random(seed)
+    items = []
+    for item_id in range(1, size + 1):
+        source = histories[(item_id - 1) % len(histories)]
+        scale = rng.lognormvariate(0, 0.5)
+        keep = rng.randint(1, len(source['history']))
+        history = [dict(point, usage=int(round(point['usage'] * scale))) for point in source['history'][-keep:]]
+        usage = [point['usage'] for point in history]
+        items.append({
+            'item_id': item_id,
+            'name': source['name'],
+            'historical_data': history,
+            'forecast_features': {'avg_usage_per_quarter': sum(usage) / len(usage)},
+            'current_stock': int(round(source['current_stock'] * scale)),
+        })
+    return items
+
+
+def build_request_bodies(lifespan_pool, consumable_pool, batch_sizes, variants, seed=0):
+    """
+    Pre-encode `variants` JSON bodies per endpoint and batch size, so the client spends
+    its time sending requests rather than building them.
+
+    Returns:
+        Dict of endpoint name -> list of (item count, body bytes)
+    """
+    rng = random.Random(seed)
+    bodies = defaultdict(list)
+    for name, pool in (('lifespan', lifespan_pool), ('consumables', consumable_pool)):
+        if not pool:
+            continue
+        for size in batch_sizes:
+            for _ in range(variants):
+                items = rng.choices(pool, k=size)
+                if name == 'consumables':
+                    # Distinct ids, so identical bodies are rare (the server coalesces those)
+                    items = [dict(item, item_id=rng.randrange(1, 10 ** 9)) for item in items]
+                bodies[name].append((size, json.dumps({'items': items}, default=str).encode('utf-8')))
+    return bodies
+
+
+class Client:
+    """One persistent HTTP connection per thread, reopened after errors."""
+
+    def __init__(self, url, timeout):
+        parsed = urllib.parse.urlsplit(url)
+        self.host = parsed.hostname
+        self.port = parsed.port or 80
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def post(self, path, body):
+        """POST a JSON body; returns the status code (0 for connection errors/timeouts)."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        try:
+            conn.request('POST', path, body=body, headers={
+                'Content-Type': 'application/json',
+                'Accept-Encoding': 'gzip',
+            })
+            response = conn.getresponse()
+            response.read()
+            if response.will_close:
+                conn.close()
+            return response.status
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            self._local.conn = None
+            return 0
+
+
+def run_load(client, bodies, mix, duration_s, rate, concurrency, seed=0):
+    """
+    Send requests for duration_s seconds.
+
+    Returns:
+        Tuple of (list of (endpoint name, items, status, latency seconds, completed at),
+        elapsed seconds)
+    """
+    rng = random.Random(seed)
+    names = [name for name in mix if bodies.get(name)]
+    weights = [mix[name] for name in names]
+    results = []
+    results_lock = threading.Lock()
+    slots = threading.Semaphore(concurrency)
+
+    def send(name, items, body, scheduled):
+        try:
+            status = client.post(ENDPOINTS[name], body)
+            finished = time.perf_counter()
+            with results_lock:
+                results.append((name, items, status, finished - scheduled, finished))
+        finally:
+            slots.release()
+
+    started = time.perf_counter()
+    deadline = started + duration_s
+    scheduled = started
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        while True:
+            if rate > 0:
+                scheduled += rng.expovariate(rate)
+                if scheduled >= deadline:
+                    break
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                slots.acquire()
+            else:
+                slots.acquire()
+                scheduled = time.perf_counter()
+                if scheduled >= deadline:
+                    slots.release()
+                    break
+            name = rng.choices(names, weights)[0]
+            items, body = rng.choice(bodies[name])
+            executor.submit(send, name, items, body, scheduled)
+    return results, time.perf_counter() - started
+
+
+def summarize(results, elapsed_s):
+    """Per-endpoint and overall throughput, latency percentiles and error rates."""
+    groups = defaultdict(list)
+    for record in results:
+        groups[record[0]].append(record)
+    groups = dict(sorted(groups.items()))
+    groups['all'] = results
+
+    summary = {}
+    for name, records in groups.items():
+        latencies_ms = np.array([r[3] for r in records]) * 1000
+        statuses = defaultdict(int)
+        for r in records:
+            statuses[str(r[2]) if r[2] else 'connection_error'] += 1
+        ok = statuses.get('200', 0)
+        summary[name] = {
+            'requests': len(records),
+            'throughput_rps': round(len(records) / elapsed_s, 2),
+            'items_per_s': round(sum(r[1] for r in records if r[2] == 200) / elapsed_s, 1),
+            'error_rate': round(1 - ok / len(records), 4),
+            'statuses': dict(sorted(statuses.items())),
+            'latency_ms': {
+                'p50': round(float(np.percentile(latencies_ms, 50)), 2),
+                'p90': round(float(np.percentile(latencies_ms, 90)), 2),
+                'p99': round(float(np.percentile(latencies_ms, 99)), 2),
+                'max': round(float(latencies_ms.max()), 2),
+            },
+        }
+    return summary
+
+
+def start_server(kind, port):
+    """Start the API as a subprocess and wait until /health answers."""
+    env = dict(os.environ, PORT=str(port), ML_API_DEBUG='0')
+    process = subprocess.Popen([sys.executable, SERVER_SCRIPTS[kind]], env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{SERVER_SCRIPTS[kind]} exited with code {process.returncode}")
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            conn.request('GET', '/health')
+            if conn.getresponse().status == 200:
+                return process
+        except OSError:
+            pass
+        time.sleep(0.5)
+    process.terminate()
+    raise RuntimeError(f"{SERVER_SCRIPTS[kind]} did not become healthy within 60s")
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        if name not in ENDPOINTS:
+            raise argparse.ArgumentTypeError(f"Unknown endpoint '{name}' (choose from {', '.join(ENDPOINTS)})")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the ML API with traffic built from the database dumps')
+    parser.add_argument('--url', default='http://127.0.0.1:5000', help='Base URL of a running server')
+    parser.add_argument('--start-server', action='store_true', help='Start the server locally for the test')
+    parser.add_argument('--server', choices=list(SERVER_SCRIPTS), default='flask', help='Server to start')
+    parser.add_argument('--port', type=int, default=5055, help='Port for --start-server')
+    parser.add_argument('--dumps', default=','.join(DEFAULT_DUMPS), help='Comma-separated dump files to build payloads from')
+    parser.add_argument('--duration', type=float, default=30, help='Test length in seconds')
+    parser.add_argument('--rate', type=float, default=20, help='Mean arrival rate in requests/s (0 = closed loop)')
+    parser.add_argument('--concurrency', type=int, default=16, help='Most requests in flight at once')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix('lifespan=0.7,consumables=0.3'),
+                        help='Endpoint weights, e.g. lifespan=0.7,consumables=0.3')
+    parser.add_argument('--batch-sizes', default='1,10,100,1000',
+                        type=lambda s: [int(x) for x in s.split(',')], help='Items per request (picked uniformly)')
+    parser.add_argument('--variants', type=int, default=20, help='Distinct bodies per endpoint and batch size')
+    parser.add_argument('--timeout', type=float, default=60, help='Per-request timeout in seconds')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed for payloads and arrivals')
+    parser.add_argument('--output', default=None, help='Write the summary as JSON')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+    print("=" * 60)
+    print("ML API Load Test")
+    print("=" * 60)
+
+    dumps = args.dumps.split(',')
+    lifespan_pool = load_lifespan_pool(dumps)
+    histories = load_consumable_histories(dumps)
+    consumable_pool = widen_consumables(histories, 500, args.seed) if histories else []
+    print(f"📦 Payload pools: {len(lifespan_pool)} lifespan items, "
+          f"{len(consumable_pool)} consumables (from {len(histories)} real histories)")
+    bodies = build_request_bodies(lifespan_pool, consumable_pool, args.batch_sizes, args.variants, args.seed)
+    if not any(bodies.get(name) for name in args.mix):
+        print("❌ No payloads could be built for the selected endpoints")
+        sys.exit(1)
+
+    process = None
+    url = args.url
+    if args.start_server:
+        print(f"🚀 Starting {SERVER_SCRIPTS[args.server]} on port {args.port}...")
+        process = start_server(args.server, args.port)
+        url = f'http://127.0.0.1:{args.port}'
+
+    try:
+        mode = f"open loop at {args.rate:g} req/s" if args.rate > 0 else "closed loop"
+        print(f"🔥 {args.duration:g}s against {url}, {mode}, concurrency {args.concurrency}")
+        results, elapsed = run_load(Client(url, args.timeout), bodies, args.mix, args.duration,
+                                    args.rate, args.concurrency, args.seed)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=30)
+
+    if not results:
+        print("❌ No requests were sent")
+        sys.exit(1)
+
+    summary = summarize(results, elapsed)
+    print()
+    print(f"{'endpoint':<12} {'requests':>8} {'req/s':>8} {'items/s':>10} {'errors':>7} "
+          f"{'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for name, stats in summary.items():
+        latency = stats['latency_ms']
+        print(f"{name:<12} {stats['requests']:>8} {stats['throughput_rps']:>8.1f} {stats['items_per_s']:>10.0f} "
+              f"{stats['error_rate']:>6.1%} {latency['p50']:>9.1f} {latency['p90']:>9.1f} "
+              f"{latency['p99']:>9.1f} {latency['max']:>9.1f}")
+    for name, stats in summary.items():
+        if stats['error_rate'] > 0:
+            print(f"   ⚠️  {name} statuses: {stats['statuses']}")
+
+    if args.output:
+        report = {
+            'config': {
+                'url': url, 'server': args.server if args.start_server else None, 'duration_s': args.duration,
+                'rate': args.rate, 'concurrency': args.concurrency, 'mix': args.mix, 'batch_sizes': args.batch_sizes,
+            },
+            'elapsed_s': round(elapsed, 2),
+            'endpoints': summary,
+        }
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"\n💾 Summary written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""
+Logging Pipeline for the ML API
+
+Request threads only put log records on an in-memory queue; a background thread
+(QueueListener) formats and writes them, so slow stdout/stderr never blocks a
+prediction. Output is one JSON object per line by default, including any fields
+passed with `extra=`, which makes the per-request summary records easy to query.
+
+Environment:
+    ML_API_LOG_LEVEL    Root log level (default INFO; DEBUG enables per-item messages)
+    ML_API_LOG_FORMAT   'json' (default) or 'text'
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+from datetime import datetime, timezone
+
+LOG_LEVEL = os.getenv('ML_API_LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.getenv('ML_API_LOG_FORMAT', 'json').lower()
+
+# Attributes every LogRecord has; anything else was passed with extra= and becomes a JSON field
+STANDARD_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime', 'taskName'}
+
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Format a record as a single-line JSON object."""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        entry.update({k: v for k, v in vars(record).items() if k not in STANDARD_RECORD_ATTRS})
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+def configure_logging(level=LOG_LEVEL, log_format=LOG_FORMAT, stream=None):
+    """
+    Route all logging through a queue to a background writer thread.
+    Safe to call more than once; only the first call installs the pipeline.
+
+    Returns:
+        The running QueueListener
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    handler = logging.StreamHandler(stream)
+    if log_format == 'json':
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(name)s - %(message)s'))
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, handler)
+    _listener.start()
+    atexit.register(_listener.stop)
+    return _listener
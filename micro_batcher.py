@@ -0,0 +1,107 @@
+"""
+Micro-batching for Concurrent Prediction Requests
+
+Collects items from concurrent requests for a short wait window (or until a maximum
+batch size is reached), runs one combined inference call and hands each caller back
+its own slice of the result. Many tiny requests then share one DataFrame build and
+one model.predict call instead of paying for their own.
+
+Usage:
+    batcher = MicroBatcher(process_batch, split_result, max_wait_ms=5, max_batch_items=1024)
+    result = batcher.submit(items)   # blocks until this caller's slice is ready
+"""
+
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from api_metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """
+    Combine concurrent submit() calls into batched process_batch() calls.
+
+    Args:
+        process_batch: Callable taking a list of items and returning a batch result
+        split_result: Callable (result, start, stop) -> the result for items[start:stop]
+        max_wait_ms: How long the first request of a batch waits for others to join
+        max_batch_items: Flush as soon as this many items are queued; a single request
+            at least this large skips the queue and runs in the caller's thread
+        name: Metric name prefix
+    """
+
+    def __init__(self, process_batch, split_result, max_wait_ms=5.0, max_batch_items=1024, name='microbatch'):
+        self.process_batch = process_batch
+        self.split_result = split_result
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_batch_items = max_batch_items
+        self.name = name
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name=f'{name}-worker', daemon=True)
+        self._worker.start()
+
+    def submit(self, items):
+        """
+        Run items through the next batch and return this caller's part of the result.
+        Exceptions raised by process_batch are re-raised in every caller of that batch.
+        """
+        if len(items) >= self.max_batch_items:
+            metrics.inc(f'{self.name}.bypassed_requests')
+            return self.process_batch(items)
+
+        future = Future()
+        self._queue.put((items, future, time.perf_counter()))
+        metrics.set_gauge(f'{self.name}.queue_depth', self._queue.qsize())
+        return future.result()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            batch_items = len(batch[0][0])
+            deadline = time.perf_counter() + self.max_wait
+
+            # Keep collecting until the window closes or the batch is full
+            while batch_items < self.max_batch_items:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    request = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                batch.append(request)
+                batch_items += len(request[0])
+
+            metrics.set_gauge(f'{self.name}.queue_depth', self._queue.qsize())
+            self._process(batch)
+
+    def _process(self, batch):
+        started = time.perf_counter()
+        combined = []
+        offsets = []
+        for items, _, submitted in batch:
+            offsets.append((len(combined), len(combined) + len(items)))
+            combined.extend(items)
+            metrics.observe(f'{self.name}.queue_delay_ms', (started - submitted) * 1000)
+
+        metrics.observe(f'{self.name}.batch_items', len(combined))
+        metrics.observe(f'{self.name}.batch_requests', len(batch))
+
+        try:
+            result = self.process_batch(combined)
+        except Exception as e:
+            logger.error(f"Micro-batch of {len(batch)} requests failed: {e}")
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+
+        for (start, stop), (_, future, _) in zip(offsets, batch):
+            try:
+                future.set_result(self.split_result(result, start, stop))
+            except Exception as e:
+                future.set_exception(e)
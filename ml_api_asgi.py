@@ -0,0 +1,206 @@
+"""
+ASGI Entry Point for the ML API
+
+Serves the same endpoints as ml_api_server.py (/health, /metrics,
+/predict/consumables/linear, /predict/items/lifespan) from an asyncio event loop.
+Receiving request bodies, decoding them (JSON, columnar JSON, MessagePack) and
+sending responses happen on the loop, so slow or idle connections cost no threads;
+the prediction handlers (featurization, inference) run on a bounded thread pool.
+Requests beyond the pool and its backlog are answered with 503 right away.
+
+The Flask routes are reused as-is through a minimal WSGI bridge, so both entry points
+share one implementation of every contract (wire formats, admission control,
+latency budgets, compression).
+
+Usage:
+    uvicorn ml_api_asgi:app --host 0.0.0.0 --port 5000
+    python ml_api_asgi.py
+
+Environment:
+    ML_API_ASGI_WORKERS       Inference threads (default 8)
+    ML_API_ASGI_MAX_PENDING   Requests running or waiting for a thread (default 256)
+    ML_API_ASGI_MAX_BODY_MB   Largest accepted request body (default 64)
+"""
+
+import asyncio
+import io
+import logging
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+# Before anything imports NumPy (see thread_budget.py)
+from thread_budget import apply_thread_limits
+apply_thread_limits()
+
+from api_metrics import metrics
+from lifespan_predictor import load_lifespan_model
+from ml_api_server import CORS_ORIGINS, app as flask_app
+from wire_formats import DECODED_BODY_KEY, predecode_body
+
+logger = logging.getLogger(__name__)
+
+EXECUTOR_WORKERS = int(os.getenv('ML_API_ASGI_WORKERS', '8'))
+MAX_PENDING = int(os.getenv('ML_API_ASGI_MAX_PENDING', '256'))
+MAX_BODY_BYTES = int(os.getenv('ML_API_ASGI_MAX_BODY_MB', '64')) * 1024 * 1024
+
+# Cheap endpoints answered directly on the event loop
+INLINE_PATHS = ('/health', '/metrics')
+
+
+class MLApiASGI:
+    """
+    ASGI application running a WSGI app's handlers on a bounded executor.
+
+    Args:
+        wsgi_app: The WSGI callable (the Flask app)
+        workers: Size of the thread pool for request handlers
+        max_pending: Requests allowed to be running or queued for the pool
+        max_body_bytes: Requests with larger bodies get 413
+    """
+
+    def __init__(self, wsgi_app, workers=EXECUTOR_WORKERS, max_pending=MAX_PENDING, max_body_bytes=MAX_BODY_BYTES):
+        self.wsgi_app = wsgi_app
+        self.max_pending = max_pending
+        self.max_body_bytes = max_body_bytes
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ml-api-worker')
+        self._pending = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._http(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                # Load the model before the first request instead of during it
+                await asyncio.get_running_loop().run_in_executor(self.executor, load_lifespan_model)
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _http(self, scope, receive, send):
+        body = await self._read_body(receive)
+        if body is None:
+            await self._send_error(scope, send, 413, 'Request body too large')
+            return
+
+        if scope['path'] in INLINE_PATHS or scope['method'] == 'OPTIONS':
+            status, headers, chunks = self._call_wsgi(scope, body)
+        elif self._pending >= self.max_pending:
+            metrics.inc('asgi.rejected')
+            await self._send_error(scope, send, 503, 'Server is at capacity, retry later', retry_after=1)
+            return
+        else:
+            # Parse on the loop; the handler gets the decoded payload and only runs inference
+            decoded = predecode_body(body, dict(scope.get('headers', [])).get(b'content-type', b'').decode('latin-1'))
+            self._pending += 1
+            metrics.set_gauge('asgi.pending', self._pending)
+            try:
+                loop = asyncio.get_running_loop()
+                status, headers, chunks = await loop.run_in_executor(self.executor, self._call_wsgi, scope, body, decoded)
+            finally:
+                self._pending -= 1
+                metrics.set_gauge('asgi.pending', self._pending)
+
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': b''.join(chunks)})
+
+    async def _read_body(self, receive):
+        """Receive the full request body on the event loop; None if it is too large."""
+        parts = []
+        size = 0
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                break
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if size > self.max_body_bytes:
+                return None
+            parts.append(chunk)
+            if not message.get('more_body', False):
+                break
+        return b''.join(parts)
+
+    async def _send_error(self, scope, send, status, message, retry_after=None):
+        body = ('{"error":"%s","success":false}' % message).encode('utf-8')
+        headers = [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]
+        if retry_after is not None:
+            headers.append((b'retry-after', str(retry_after).encode()))
+        # These never reach Flask, so add the CORS headers browsers need to read them
+        origin = dict(scope.get('headers', [])).get(b'origin', b'').decode('latin-1')
+        if origin in CORS_ORIGINS:
+            headers += [(b'access-control-allow-origin', origin.encode('latin-1')),
+                        (b'access-control-allow-credentials', b'true'),
+                        (b'access-control-expose-headers', b'Retry-After'),
+                        (b'vary', b'Origin')]
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': body})
+
+    def _call_wsgi(self, scope, body, decoded=None):
+        """Run the WSGI app for one request and collect its response."""
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+
+        environ = wsgi_environ(scope, body)
+        if decoded is not None:
+            environ[DECODED_BODY_KEY] = decoded
+        result = self.wsgi_app(environ, start_response)
+        try:
+            chunks = list(result)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        return response['status'], response['headers'], chunks
+
+
+def wsgi_environ(scope, body):
+    """Build a PEP 3333 environ for an ASGI HTTP scope and its complete body."""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        'PATH_INFO': scope['path'],
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': str(server[0]),
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_LENGTH':
+            continue
+        if name == 'CONTENT_TYPE':
+            environ['CONTENT_TYPE'] = value
+            continue
+        key = f'HTTP_{name}'
+        environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+app = MLApiASGI(flask_app)
+
+if __name__ == '__main__':
+    import uvicorn
+
+    uvicorn.run(app, host='0.0.0.0', port=int(os.getenv('PORT', '5000')))
@@ -3,263 +3,160 @@ Python ML API Server for Usage Forecasting
 Provides Linear Regression forecasting for next quarter usage predictions
 """
 
-from flask import Flask, request, jsonify
+# Cap BLAS/OpenMP thread pools before NumPy (imported by the predictors) starts them
+from thread_budget import apply_thread_limits, budget_info
+apply_thread_limits()
+
+from flask import Flask, Response, after_this_request, request, jsonify, g
 from flask_cors import CORS
-from sklearn.linear_model import LinearRegression
-import pandas as pd
-import numpy as np
-from datetime import datetime, timedelta
+import hmac
 import logging
 import os
-from catboost import CatBoostRegressor
+import time
+from consumables_forecaster import FORECAST_METHODS, forecast_consumables
+from lifespan_predictor import (active_model_sha256, load_lifespan_model, predict_lifespan, predict_manual, prediction_columns,
+                                prediction_records, slice_prediction_result)
+from micro_batcher import MicroBatcher
+from single_flight import SingleFlight, canonical_hash
+from api_metrics import metrics
+from admission_control import AdmissionController, AdmissionRejected
+from latency_budget import DEADLINE_HEADER, LATENCY_BUDGET_HEADER, latency_budget_ms, lifespan_model_cost
+from logging_pipeline import configure_logging
+from live_profiler import ProfilerBusy, profile_process
+from lifespan_explainer import ExplainerUnavailable, get_explainer
+from drift_monitor import get_drift_monitor
+from forecast_snapshot import merge_live, split_by_snapshot
+from forecast_rollups import GROUP_BY, consumables_rollup, lifespan_rollup
+from shadow_scoring import get_shadow_scorer
+from lifespan_delta_store import delta_rescore, get_delta_store
+from stockout_simulator import DEFAULT_HORIZONS_DAYS, DEFAULT_SEED, MAX_PATHS, simulate_stockout_risk
+from wire_formats import (WireFormatError, columns_to_frame, columns_to_rows, compact_records, compress_response,
+                          decode_request, encode_response, negotiate_response_format, rows_to_columns, wants_compact)
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# Configure logging: queued, structured JSON (see logging_pipeline.py)
+configure_logging()
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
+# Frontend origins allowed to call the API from a browser
+CORS_ORIGINS = ["http://localhost:5174", "http://localhost:5173", "http://127.0.0.1:5174", "http://127.0.0.1:5173"]
+# Request headers browsers may send: the latency budget headers come from interactive views
+CORS_ALLOW_HEADERS = ["Content-Type", "Authorization", LATENCY_BUDGET_HEADER, DEADLINE_HEADER]
 # Enable CORS with specific configuration for frontend requests
 CORS(app, 
-     origins=["http://localhost:5174", "http://localhost:5173", "http://127.0.0.1:5174", "http://127.0.0.1:5173"],
+     origins=CORS_ORIGINS,
      methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-     allow_headers=["Content-Type", "Authorization"],
+     allow_headers=CORS_ALLOW_HEADERS,
+     # 429/503 responses say when to retry; browsers hide non-safelisted headers otherwise
+     expose_headers=["Retry-After"],
      supports_credentials=True)
 
+# Per-request summary: endpoints add fields to g.log_fields, one record is logged
+# when the response is ready
+@app.before_request
+def start_request_log():
+    g.request_started = time.perf_counter()
+    g.log_fields = {}
+
 # Handle OPTIONS requests explicitly
 @app.before_request
 def handle_preflight():
     if request.method == "OPTIONS":
         response = jsonify({})
         response.headers.add("Access-Control-Allow-Origin", request.headers.get("Origin", "*"))
-        response.headers.add('Access-Control-Allow-Headers', "Content-Type,Authorization")
+        response.headers.add('Access-Control-Allow-Headers', ",".join(CORS_ALLOW_HEADERS))
         response.headers.add('Access-Control-Allow-Methods', "GET,PUT,POST,DELETE,OPTIONS")
         response.headers.add('Access-Control-Allow-Credentials', "true")
         return response
 
-# Global variable to store the CatBoost model
-lifespan_model = None
-MODEL_PATH = os.getenv('LIFESPAN_MODEL_PATH', None)
+@app.after_request
+def log_request_summary(response):
+    started = g.get('request_started')
+    logger.info('request completed', extra={
+        'endpoint': request.path,
+        'http_method': request.method,
+        'status': response.status_code,
+        'duration_ms': round((time.perf_counter() - started) * 1000, 2) if started is not None else None,
+        'response_bytes': response.calculate_content_length(),
+        **g.get('log_fields', {}),
+    })
+    return response
 
-def load_lifespan_model():
-    """
-    Load the CatBoost lifespan prediction model.
-    Checks multiple locations for the model file.
-    """
-    global lifespan_model
-    
-    if lifespan_model is not None:
-        return lifespan_model
-    
-    # Get current working directory and script directory
-    current_dir = os.getcwd()
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    parent_dir = os.path.dirname(script_dir)
-    
-    # Possible model file locations (check multiple locations)
-    # Priority: Same directory as script (most likely location)
-    possible_paths = [
-        os.path.join(script_dir, 'catboost_lifespan_model.cbm'),  # Same dir as script (HIGHEST PRIORITY)
-        MODEL_PATH,  # Environment variable path
-        os.path.join(current_dir, 'catboost_lifespan_model.cbm'),  # Current working directory
-        'catboost_lifespan_model.cbm',  # Relative to current dir
-        os.path.join(parent_dir, 'catboost_lifespan_model.cbm'),  # Parent directory
-        os.path.join(script_dir, 'models', 'catboost_lifespan_model.cbm'),
-        os.path.join(current_dir, 'models', 'catboost_lifespan_model.cbm'),
-        'models/catboost_lifespan_model.cbm',
-        'fastapi_lifespan_api/ml/models/catboost_lifespan_model.cbm',
-    ]
-    
-    # Remove None values and duplicates
-    possible_paths = [p for p in possible_paths if p]
-    possible_paths = list(dict.fromkeys(possible_paths))  # Remove duplicates
-    
-    logger.info(f"🔍 Searching for CatBoost model file...")
-    logger.info(f"   Current directory: {current_dir}")
-    logger.info(f"   Script directory: {script_dir}")
-    logger.info(f"   Parent directory: {parent_dir}")
-    
-    model_path = None
-    checked_paths = []
-    for path in possible_paths:
-        checked_paths.append(path)
-        if os.path.exists(path):
-            model_path = os.path.abspath(path)  # Use absolute path
-            logger.info(f"✅ Found model file at: {model_path}")
-            break
-    
-    if model_path is None:
-        logger.warning("⚠️ CatBoost model file not found. Falling back to manual calculation method.")
-        logger.info(f"   Checked {len(checked_paths)} paths:")
-        for i, path in enumerate(checked_paths, 1):
-            exists = "✅" if os.path.exists(path) else "❌"
-            logger.info(f"   {i}. {exists} {path}")
-        return None
-    
-    try:
-        logger.info(f"🐱 Loading CatBoost model from: {model_path}")
-        logger.info(f"   File exists: {os.path.exists(model_path)}")
-        logger.info(f"   File size: {os.path.getsize(model_path) / (1024*1024):.2f} MB")
-        
-        lifespan_model = CatBoostRegressor()
-        lifespan_model.load_model(model_path)
-        logger.info("✅ CatBoost model loaded successfully!")
-        logger.info("✅ CatBoost IS RUNNING - Using ML predictions")
-        return lifespan_model
-    except ImportError as e:
-        logger.error(f"❌ CatBoost library not installed: {str(e)}")
-        logger.error("   Install with: pip install catboost")
-        logger.warning("⚠️ Falling back to manual calculation method")
-        return None
-    except Exception as e:
-        logger.error(f"❌ Failed to load CatBoost model: {str(e)}")
-        logger.error(f"   Error type: {type(e).__name__}")
-        import traceback
-        logger.error(f"   Traceback: {traceback.format_exc()}")
-        logger.warning("⚠️ Falling back to manual calculation method")
-        return None
+# Compress large responses (gzip, or zstd when installed) if the client accepts it
+@app.after_request
+def compress(response):
+    return compress_response(response, request.headers.get('Accept-Encoding', ''))
+
+# Micro-batching for /predict/items/lifespan: concurrent requests arriving within
+# LIFESPAN_MICROBATCH_WAIT_MS share one inference call (0 disables batching)
+MICROBATCH_WAIT_MS = float(os.getenv('LIFESPAN_MICROBATCH_WAIT_MS', '0'))
+MICROBATCH_MAX_ITEMS = int(os.getenv('LIFESPAN_MICROBATCH_MAX_ITEMS', '1024'))
+
+def predict_lifespan_batch(items):
+    """Predict a (possibly combined) batch of items with the current model."""
+    return predict_lifespan(items, load_lifespan_model())
 
-# Load model on module import (lazy loading - will load on first prediction request)
-# Model will be loaded when first prediction is requested
+lifespan_batcher = None
+if MICROBATCH_WAIT_MS > 0:
+    lifespan_batcher = MicroBatcher(
+        predict_lifespan_batch, slice_prediction_result,
+        max_wait_ms=MICROBATCH_WAIT_MS, max_batch_items=MICROBATCH_MAX_ITEMS,
+        name='lifespan.microbatch'
+    )
 
-def prepare_features_for_prediction(items):
+# Identical consumables forecasts requested at the same time (several dashboards or
+# browser tabs) are computed once and shared by every waiting request
+consumables_flight = SingleFlight('consumables')
+
+# Admission control: bounded concurrency, a bounded wait queue and a per-request item
+# limit for each prediction endpoint (overridable with ML_API_<ENDPOINT>_* env vars).
+# Micro-batched requests mostly wait for their batch, so they get more slots.
+lifespan_admission = AdmissionController.from_env(
+    'lifespan', max_in_flight=64 if lifespan_batcher is not None else 4,
+    max_queued=32, queue_timeout_ms=5000, max_items=100000
+)
+consumables_admission = AdmissionController.from_env(
+    'consumables', max_in_flight=4, max_queued=32, queue_timeout_ms=5000, max_items=20000
+)
+explain_admission = AdmissionController.from_env(
+    'explain', max_in_flight=2, max_queued=16, queue_timeout_ms=10000, max_items=100000
+)
+stockout_admission = AdmissionController.from_env(
+    'stockout', max_in_flight=2, max_queued=16, queue_timeout_ms=10000, max_items=20000
+)
+
+def forecast_with_snapshot(items, method='linear'):
     """
-    Convert JSON items to DataFrame with proper feature engineering.
-    One-hot encodes category and last_reason to match training data.
-    
-    Args:
-        items: List of item dictionaries with fields:
-            - item_id
-            - category
-            - years_in_use
-            - maintenance_count
-            - condition_number
-            - condition_status (optional): Good, Less Reliable, Un-operational, Disposal
-            - condition (optional): Serviceable, Non-Serviceable, On Maintenance
-            - last_reason
+    Consumables forecasts for request items: answered from a fresh snapshot where the
+    inputs are unchanged, the rest computed live (under admission control).
+    The snapshot holds linear forecasts, so other methods are always computed live.
     
     Returns:
-        DataFrame with all features ready for model prediction
+        Tuple of (forecasts in request order, snapshot freshness info or None)
     """
-    if not items:
-        return pd.DataFrame()
-    
-    # Create base DataFrame from items
-    df = pd.DataFrame(items)
-    
-    # Ensure required numeric columns exist and are properly typed
-    numeric_cols = ['years_in_use', 'maintenance_count', 'condition_number']
-    for col in numeric_cols:
-        if col not in df.columns:
-            df[col] = 0
-        df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
-    
-    # Handle category one-hot encoding
-    # Get unique categories from data and create one-hot encoded columns
-    if 'category' in df.columns:
-        # Normalize category values (strip whitespace, handle case)
-        df['category'] = df['category'].astype(str).str.strip()
-        df['category'] = df['category'].fillna('Unknown')
-        # Create one-hot encoded columns: category_Desktop, category_ICT, etc.
-        category_dummies = pd.get_dummies(df['category'], prefix='category')
-        # Drop original category column
-        df = pd.concat([df.drop('category', axis=1), category_dummies], axis=1)
-    else:
-        df['category'] = 'Unknown'
-        category_dummies = pd.get_dummies(df['category'], prefix='category')
-        df = pd.concat([df.drop('category', axis=1), category_dummies], axis=1)
-    
-    # Handle last_reason one-hot encoding
-    # Normalize last_reason values
-    if 'last_reason' in df.columns:
-        df['last_reason'] = df['last_reason'].astype(str).str.strip().str.lower()
-        df['last_reason'] = df['last_reason'].fillna('other')
-        # Replace empty strings with 'other'
-        df['last_reason'] = df['last_reason'].replace('', 'other')
-        # Create one-hot encoded columns: last_reason_Wet, last_reason_Electrical, etc.
-        reason_dummies = pd.get_dummies(df['last_reason'], prefix='last_reason')
-        # Drop original last_reason column
-        df = pd.concat([df.drop('last_reason', axis=1), reason_dummies], axis=1)
+    if method == 'linear':
+        forecasts, live_indices, snapshot_info = split_by_snapshot('consumables', items)
     else:
-        df['last_reason'] = 'other'
-        reason_dummies = pd.get_dummies(df['last_reason'], prefix='last_reason')
-        df = pd.concat([df.drop('last_reason', axis=1), reason_dummies], axis=1)
-    
-    # Handle condition_status one-hot encoding
-    if 'condition_status' in df.columns:
-        df['condition_status'] = df['condition_status'].astype(str).str.strip()
-        df['condition_status'] = df['condition_status'].fillna('Unknown')
-        condition_status_dummies = pd.get_dummies(df['condition_status'], prefix='condition_status')
-        df = pd.concat([df.drop('condition_status', axis=1), condition_status_dummies], axis=1)
-    else:
-        df['condition_status'] = 'Unknown'
-        condition_status_dummies = pd.get_dummies(df['condition_status'], prefix='condition_status')
-        df = pd.concat([df.drop('condition_status', axis=1), condition_status_dummies], axis=1)
-    
-    # Handle condition one-hot encoding (Serviceable, Non-Serviceable, etc.)
-    if 'condition' in df.columns:
-        df['condition'] = df['condition'].astype(str).str.strip()
-        df['condition'] = df['condition'].fillna('Unknown')
-        condition_dummies = pd.get_dummies(df['condition'], prefix='condition')
-        df = pd.concat([df.drop('condition', axis=1), condition_dummies], axis=1)
-    else:
-        df['condition'] = 'Unknown'
-        condition_dummies = pd.get_dummies(df['condition'], prefix='condition')
-        df = pd.concat([df.drop('condition', axis=1), condition_dummies], axis=1)
-    
-    # Remove item_id if present (not a feature)
-    if 'item_id' in df.columns:
-        item_ids = df['item_id'].copy()
-        df = df.drop('item_id', axis=1)
-    else:
-        item_ids = None
-    
-    return df, item_ids
+        forecasts = snapshot_info = None
+    live_items = items if forecasts is None else [items[i] for i in live_indices]
+    
+    consumables_admission.check_items(len(live_items))
+    live_forecasts = []
+    if len(live_items):
+        flight_key = canonical_hash(live_items) if method == 'linear' else canonical_hash([method, live_items])
+        with consumables_admission.slot():
+            live_forecasts = consumables_flight.do(flight_key, lambda: forecast_consumables(live_items, method))
+    if forecasts is None:
+        return live_forecasts, None
+    return merge_live(forecasts, live_indices, live_forecasts), snapshot_info
 
-def align_features_with_model(df, model):
-    """
-    Ensure DataFrame has all features expected by the model.
-    Fill missing columns with 0 and reorder columns to match model.
-    
-    Args:
-        df: DataFrame with features
-        model: CatBoost model
-    
-    Returns:
-        DataFrame with all model features in correct order
-    """
-    if model is None:
-        return df
-    
-    try:
-        # Get feature names from model
-        model_features = model.feature_names_
-        if model_features is None:
-            # Try to get from model attributes
-            model_features = getattr(model, 'feature_names_', None)
-    except:
-        # If we can't get feature names, return df as-is
-        logger.warning("Could not retrieve feature names from model")
-        return df
-    
-    if model_features is None:
-        logger.warning("Model feature names not available, using DataFrame as-is")
-        return df
-    
-    # Create a new DataFrame with all model features
-    aligned_df = pd.DataFrame(index=df.index)
-    
-    # Add all model features, filling with 0 if missing
-    for feature in model_features:
-        if feature in df.columns:
-            aligned_df[feature] = df[feature]
-        else:
-            aligned_df[feature] = 0
-            logger.debug(f"Missing feature '{feature}' in input data, filled with 0")
-    
-    # Ensure columns are in the same order as model expects
-    aligned_df = aligned_df[model_features]
-    
-    return aligned_df
+def admission_rejected_response(error):
+    """JSON error for a rejected request, with Retry-After when the client should retry."""
+    response = jsonify({'success': False, 'error': str(error)})
+    response.status_code = error.status
+    if error.retry_after is not None:
+        response.headers['Retry-After'] = str(error.retry_after)
+    return response
 
 @app.route('/health', methods=['GET'])
 def health_check():
@@ -271,10 +168,70 @@ def health_check():
         'endpoints': {
             'predict_consumables': '/predict/consumables/linear',
             'predict_lifespan': '/predict/items/lifespan',
-            'health': '/health'
-        }
+            'predict_lifespan_delta': '/predict/items/lifespan/delta',
+            'explain_lifespan': '/explain/items/lifespan',
+            'drift_lifespan': '/drift/lifespan',
+            'rollup_consumables': '/rollups/consumables/linear',
+            'rollup_lifespan': '/rollups/items/lifespan',
+            'simulate_stockout': '/simulate/consumables/stockout',
+            'health': '/health',
+            'metrics': '/metrics'
+        },
+        'thread_budget': budget_info()
     })
 
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Operational metrics (counters, gauges, histograms)"""
+    return jsonify(metrics.snapshot())
+
+# Admin endpoints are disabled unless a token is configured
+ADMIN_TOKEN = os.getenv('ML_API_ADMIN_TOKEN')
+
+def admin_authorized():
+    """Check the admin token from 'Authorization: Bearer <token>' or X-Admin-Token."""
+    supplied = request.headers.get('X-Admin-Token', '')
+    authorization = request.headers.get('Authorization', '')
+    if authorization.startswith('Bearer '):
+        supplied = authorization[len('Bearer '):]
+    return bool(supplied) and hmac.compare_digest(supplied.encode(), ADMIN_TOKEN.encode())
+
+@app.route('/admin/profile', methods=['POST'])
+def admin_profile():
+    """
+    Profile this worker for a few seconds while it serves real traffic.
+    
+    Query parameters:
+        seconds: Session length (default 10, capped by ML_API_PROFILE_MAX_SECONDS)
+        interval_ms: Sampling interval (default 5)
+        tracemalloc: 1 to include the top allocation sites
+        include_idle: 1 to keep threads that are blocked waiting for work
+        format: 'json' (default) or 'collapsed' for a flame graph input file
+    """
+    if not ADMIN_TOKEN:
+        return jsonify({'success': False, 'error': 'Profiling is disabled (ML_API_ADMIN_TOKEN is not set)'}), 404
+    if not admin_authorized():
+        return jsonify({'success': False, 'error': 'Invalid or missing admin token'}), 401
+    
+    try:
+        seconds = float(request.args.get('seconds', 10))
+        interval_ms = float(request.args.get('interval_ms', 5))
+    except ValueError:
+        return jsonify({'success': False, 'error': 'seconds and interval_ms must be numbers'}), 400
+    
+    try:
+        profile = profile_process(
+            duration_s=seconds, interval_ms=interval_ms,
+            track_allocations=request.args.get('tracemalloc') in ('1', 'true'),
+            include_idle=request.args.get('include_idle') in ('1', 'true')
+        )
+    except ProfilerBusy as e:
+        return jsonify({'success': False, 'error': str(e)}), 409
+    
+    if request.args.get('format') == 'collapsed':
+        return Response(profile['collapsed'] + '\n', mimetype='text/plain')
+    return jsonify({'success': True, **profile})
+
 @app.route('/predict/consumables/linear', methods=['POST'])
 def predict_consumables():
     """
@@ -299,139 +256,71 @@ def predict_consumables():
             }
         ]
     }
+    
+    Columnar and MessagePack bodies are also accepted (see wire_formats.py).
+    Add ?compact=1 to leave out notes, null fields and per-item methods that match
+    the top-level method.
+    
+    "method": "holt_winters" (or ?method=holt_winters) forecasts with exponential
+    smoothing (seasonal for items with two years of history) instead of the linear
+    trend; short histories still use the linear rules.
     """
     try:
-        data = request.json
+        try:
+            data, request_format = decode_request(request)
+        except WireFormatError as e:
+            return jsonify({'success': False, 'error': str(e)}), e.status
         if not data or 'items' not in data:
             return jsonify({
                 'success': False,
                 'error': 'Invalid request format. Expected "items" array.'
             }), 400
         
+        method = request.args.get('method', data.get('method', 'linear'))
+        if method not in FORECAST_METHODS:
+            return jsonify({
+                'success': False,
+                'error': f"method must be one of: {', '.join(FORECAST_METHODS)}"
+            }), 400
+        
         items = data.get('items', [])
-        logger.info(f"Received forecast request for {len(items)} items")
+        if request_format != 'json':
+            items = columns_to_rows(items)
+        g.log_fields.update(items=len(items), request_format=request_format, forecast_method=method)
         
-        forecasts = []
+        forecasts, snapshot_info = forecast_with_snapshot(items, method)
         
-        for item in items:
-            item_id = item.get('item_id')
-            name = item.get('name', f'Item {item_id}')
-            historical_data = item.get('historical_data', [])
-            forecast_features = item.get('forecast_features', {})
-            current_stock = item.get('current_stock', 0)
-            
-            if not historical_data:
-                avg_usage = forecast_features.get('avg_usage_per_quarter', 0)
-                logger.warning(f"No historical data for item {item_id} ({name}). Using average fallback: {round(avg_usage) if avg_usage else 0} units")
-                logger.info(f"💡 To enable Linear Regression predictions: Add usage records (ItemUsage entries) for this item across multiple quarters")
-                forecasts.append({
-                    'item_id': item_id,
-                    'name': name,
-                    'predicted_usage': round(avg_usage) if avg_usage else 0,
-                    'confidence': 0.3,
-                    'method': 'average_fallback',
-                    'note': 'No historical usage data available - using average fallback method'
-                })
-                continue
-            
-            # Extract usage values from historical data
-            usage_values = []
-            periods = []
-            
-            for idx, data_point in enumerate(historical_data):
-                usage = data_point.get('usage', 0)
-                if usage > 0:  # Only include non-zero usage
-                    usage_values.append(usage)
-                    periods.append(idx)
-            
-            # Need at least 2 data points for linear regression
-            if len(usage_values) < 2:
-                avg_usage = np.mean(usage_values) if usage_values else forecast_features.get('avg_usage_per_quarter', 0)
-                logger.warning(f"Insufficient data points ({len(usage_values)}) for item {item_id} ({name}). Need at least 2 quarters of usage data for Linear Regression. Using average method: {round(avg_usage)} units")
-                logger.info(f"💡 To get better predictions: Add usage records for at least 2 quarters (Q1-Q4) for item {item_id}")
-                forecasts.append({
-                    'item_id': item_id,
-                    'name': name,
-                    'predicted_usage': round(avg_usage),
-                    'confidence': 0.3,
-                    'method': 'average',
-                    'note': f'Using average method (only {len(usage_values)} data point(s) available, need 2+ for Linear Regression)'
-                })
-                continue
-            
-            # Prepare data for Linear Regression
-            X = np.array(periods).reshape(-1, 1)  # Time periods (independent variable)
-            y = np.array(usage_values)  # Usage values (dependent variable)
-            
-            # Train Linear Regression model
-            model = LinearRegression()
-            model.fit(X, y)
-            
-            # Predict next quarter (next period)
-            next_period = len(periods)
-            predicted_usage = model.predict([[next_period]])[0]
-            predicted_usage = max(0, round(predicted_usage))  # Ensure non-negative
-            
-            # Calculate R-squared (coefficient of determination) for confidence
-            y_pred = model.predict(X)
-            ss_residual = np.sum((y - y_pred) ** 2)
-            ss_total = np.sum((y - np.mean(y)) ** 2)
-            
-            if ss_total > 0:
-                r_squared = 1 - (ss_residual / ss_total)
-            else:
-                r_squared = 0
-            
-            # Convert R-squared to confidence (clamp between 0.3 and 0.95)
-            confidence = max(0.3, min(0.95, abs(r_squared)))
-            
-            # Calculate potential shortage date (optional)
-            shortage_date = None
-            if predicted_usage > 0 and current_stock > 0:
-                # Estimate days until stock runs out
-                # Assumes usage is distributed evenly over 90 days (1 quarter)
-                daily_usage_rate = predicted_usage / 90
-                if daily_usage_rate > 0:
-                    days_until_shortage = current_stock / daily_usage_rate
-                    if days_until_shortage < 180:  # Only show if within 6 months
-                        shortage_date_obj = datetime.now() + timedelta(days=int(days_until_shortage))
-                        shortage_date = shortage_date_obj.strftime('%B %Y')
-            
-            # Get model parameters
-            slope = model.coef_[0] if len(model.coef_) > 0 else 0
-            intercept = model.intercept_ if hasattr(model, 'intercept_') else 0
-            
-            forecasts.append({
-                'item_id': item_id,
-                'name': name,
-                'predicted_usage': int(predicted_usage),
-                'shortage_date': shortage_date,
-                'confidence': round(confidence, 2),
-                'r_squared': round(r_squared, 4),
-                'slope': round(slope, 2),
-                'intercept': round(intercept, 2),
-                'data_points': len(usage_values),
-                'method': 'linear_regression'
-            })
-            
-            # Enhanced logging for consumables predictions
-            confidence_pct = f"{confidence:.1%}"
-            shortage_info = f", potential shortage: {shortage_date}" if shortage_date else ""
-            logger.info(f"Forecast for item {item_id} ({name}): {predicted_usage} units (confidence: {confidence_pct}, R²: {r_squared:.3f}, data points: {len(usage_values)}{shortage_info})")
-        
-        # Summary logging
-        successful_forecasts = len([f for f in forecasts if f.get('method') == 'linear_regression'])
-        fallback_forecasts = len([f for f in forecasts if f.get('method') in ['average', 'average_fallback']])
-        logger.info(f"✅ Successfully generated forecasts for {len(forecasts)} items: {successful_forecasts} Linear Regression, {fallback_forecasts} Average-based")
+        total_items = len(forecasts)
+        methods = [f.get('method') for f in forecasts]
+        g.log_fields.update(
+            linear_regression=methods.count('linear_regression'),
+            average=methods.count('average') + methods.count('average_fallback')
+        )
+        if method == 'holt_winters':
+            g.log_fields.update(smoothing=methods.count('holt_winters') + methods.count('holt'))
+        top_method = 'linear_regression' if method == 'linear' else method
+        response_format = negotiate_response_format(request, request_format)
+        if response_format != 'json':
+            forecasts = rows_to_columns(forecasts)
+        elif wants_compact(request):
+            forecasts = compact_records(forecasts, method=top_method)
         
-        return jsonify({
+        payload = {
             'success': True,
             'forecast': forecasts,
-            'total_items': len(forecasts),
-            'method': 'linear_regression'
-        })
-    
+            'total_items': total_items,
+            'method': top_method
+        }
+        if snapshot_info is not None:
+            g.log_fields.update(snapshot_hits=snapshot_info['hits'])
+            payload['snapshot'] = snapshot_info
+        return encode_response(payload, response_format)
+    
+    except AdmissionRejected as e:
+        g.log_fields['error'] = str(e)
+        return admission_rejected_response(e)
     except Exception as e:
+        g.log_fields['error'] = str(e)
         logger.error(f"Error generating forecasts: {str(e)}", exc_info=True)
         return jsonify({
             'success': False,
@@ -439,6 +328,90 @@ def predict_consumables():
             'message': 'Failed to generate forecasts'
         }), 500
 
+@app.route('/simulate/consumables/stockout', methods=['POST'])
+def simulate_consumables_stockout():
+    """
+    Monte Carlo stock-out risk for consumables, most at-risk items first
+    
+    Expected request format: the same items as /predict/consumables/linear, plus
+    optional "horizons_days" (default [30, 90, 180]), "paths" (default: as many as fit
+    ML_API_STOCKOUT_TARGET_MS) and "seed"
+    
+    Returns:
+    {
+        "success": true,
+        "risks": [
+            {
+                "item_id": 1,
+                "stockout_probability": {"30d": 0.12, "90d": 0.64, "180d": 0.97},
+                "expected_stockout_days": 74.5,
+                "expected_stockout_date": "2026-01-02",
+                "risk_rank": 1,
+                ...
+            }
+        ],
+        "paths": 2400,
+        "seed": 42
+    }
+    
+    expected_stockout_date is the mean over the simulated paths that run out within
+    the longest horizon's quarters.
+    """
+    try:
+        try:
+            data, request_format = decode_request(request)
+        except WireFormatError as e:
+            return jsonify({'success': False, 'error': str(e)}), e.status
+        if not data or 'items' not in data:
+            return jsonify({
+                'success': False,
+                'error': 'Invalid request format. Expected "items" array.'
+            }), 400
+        try:
+            horizons = [int(h) for h in data.get('horizons_days') or DEFAULT_HORIZONS_DAYS]
+            paths = data.get('paths')
+            paths = int(paths) if paths is not None else None
+            seed = int(data.get('seed', DEFAULT_SEED))
+        except (TypeError, ValueError):
+            return jsonify({'success': False, 'error': 'horizons_days, paths and seed must be integers'}), 400
+        if not horizons or min(horizons) <= 0 or (paths is not None and not 0 < paths <= MAX_PATHS):
+            return jsonify({
+                'success': False,
+                'error': f'horizons_days must be positive and paths between 1 and {MAX_PATHS}'
+            }), 400
+        
+        items = data['items']
+        if request_format != 'json':
+            items = columns_to_rows(items)
+        g.log_fields.update(items=len(items), request_format=request_format)
+        
+        stockout_admission.check_items(len(items))
+        with stockout_admission.slot():
+            simulation = simulate_stockout_risk(items, horizons_days=horizons, paths=paths, seed=seed)
+        g.log_fields.update(paths=simulation['paths'], simulation_ms=simulation['elapsed_ms'])
+        
+        response_format = negotiate_response_format(request, request_format)
+        risks = simulation.pop('risks')
+        return encode_response({
+            'success': True,
+            'risks': risks,
+            'total_items': len(risks),
+            'method': 'monte_carlo_residual_bootstrap',
+            **simulation
+        }, response_format)
+    
+    except AdmissionRejected as e:
+        g.log_fields['error'] = str(e)
+        return admission_rejected_response(e)
+    except Exception as e:
+        g.log_fields['error'] = str(e)
+        logger.error(f"Error simulating stock-out risk: {str(e)}", exc_info=True)
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'message': 'Failed to simulate stock-out risk'
+        }), 500
+
 @app.route('/predict/items/lifespan', methods=['POST'])
 def predict_items_lifespan():
     """
@@ -471,9 +444,24 @@ def predict_items_lifespan():
             }
         ]
     }
+    
+    Columnar and MessagePack bodies are also accepted, and the response format is
+    negotiated with the Accept header (see wire_formats.py). Add ?compact=1 to leave
+    out the per-item method.
+    
+    Send X-Latency-Budget-Ms (or an X-Request-Deadline Unix timestamp) to get the
+    deterministic rules instead of the model when the model would not answer in time;
+    the response's "method" says which one ran.
+    
+    A quantile model (train_lifespan_model.py --quantiles 0.1,0.5,0.9) adds
+    remaining_years_p10 / _p50 / _p90 to every prediction; remaining_years is the p50.
     """
+    received_at = time.perf_counter()
     try:
-        data = request.json
+        try:
+            data, request_format = decode_request(request)
+        except WireFormatError as e:
+            return jsonify({'success': False, 'error': str(e)}), e.status
         if not data or 'items' not in data:
             return jsonify({
                 'success': False,
@@ -481,212 +469,104 @@ def predict_items_lifespan():
             }), 400
         
         items = data.get('items', [])
-        logger.info(f"📊 Received lifespan prediction request for {len(items)} items")
+        if request_format != 'json':
+            items = columns_to_frame(items)
+        g.log_fields.update(items=len(items), request_format=request_format)
         
-        # Load model if not already loaded
-        logger.info("=" * 60)
-        logger.info("🐱 ATTEMPTING TO LOAD CATBOOST MODEL")
-        logger.info("=" * 60)
+        # Items in a fresh snapshot built with the active model are answered from it
         model = load_lifespan_model()
+        snapshot_records, live_indices, snapshot_info = split_by_snapshot('lifespan', items, active_model_sha256(), model)
+        if snapshot_records is not None:
+            items = [items[i] for i in live_indices]
         
-        # Try to use CatBoost model if available
-        if model is not None:
-            logger.info("=" * 60)
-            logger.info("✅ CATBOOST MODEL LOADED - USING ML PREDICTIONS")
-            logger.info("=" * 60)
-            try:
-                # Prepare features from items
-                df, item_ids = prepare_features_for_prediction(items)
-                
-                if df.empty:
-                    return jsonify({
-                        'success': False,
-                        'error': 'No valid items to process'
-                    }), 400
-                
-                # Align features with model expectations
-                df_aligned = align_features_with_model(df, model)
+        result = None
+        budget_ms = estimated_ms = None
+        degraded = False
+        lifespan_admission.check_items(len(items))
+        if snapshot_records is None or len(items):
+            with lifespan_admission.slot():
+                # Columnar requests come from bulk callers and skip micro-batching
+                use_batcher = lifespan_batcher is not None and isinstance(items, list)
                 
-                # Make predictions
-                remaining_years_predictions = model.predict(df_aligned)
+                # Latency budget: skip the model when its estimated cost does not fit
+                budget_ms = latency_budget_ms(request.headers, received_at)
+                if budget_ms is not None and model is not None:
+                    estimated_ms = lifespan_model_cost.estimate_ms(len(items))
+                    if estimated_ms is not None and use_batcher:
+                        estimated_ms += MICROBATCH_WAIT_MS
+                    degraded = estimated_ms is not None and estimated_ms > budget_ms
                 
-                # Ensure predictions are in reasonable bounds (0.0 to 8 years)
-                # Allow values below 0.5 to show items ending soon (≤30 days = 0.082 years)
-                remaining_years_predictions = np.clip(remaining_years_predictions, 0.0, 8.0)
-                
-                # Build predictions response
-                predictions = []
-                for idx, item in enumerate(items):
-                    item_id = item.get('item_id')
-                    years_in_use = float(item.get('years_in_use', 0))
-                    condition_number = item.get('condition_number', 0)
-                    condition_number_str = str(condition_number).upper() if condition_number else ''
-                    condition_status = item.get('condition_status', '')
-                    condition = item.get('condition', '')
-                    
-                    # Check if item should be disposed (R condition number, Disposal status, or Non-Serviceable)
-                    should_dispose = (
-                        condition_number_str == 'R' or  # R = Disposal
-                        condition_status == 'Disposal' or
-                        'Non-Serviceable' in str(condition) or
-                        'Non - Serviceable' in str(condition)
-                    )
-                    
-                    if should_dispose:
-                        # Item should be disposed - set remaining_years to 0
-                        remaining_years = 0.0
-                        logger.info(f"🗑️ Item {item_id} marked for DISPOSAL (R/Disposal/Non-Serviceable) - setting remaining_years to 0")
-                    else:
-                        remaining_years = float(remaining_years_predictions[idx])
-                    
-                    remaining_years = round(remaining_years, 1)
-                    lifespan_estimate = round(years_in_use + remaining_years, 1)
-                    
-                    predictions.append({
-                        'item_id': item_id,
-                        'remaining_years': remaining_years,
-                        'lifespan_estimate': lifespan_estimate,
-                        'years_in_use': round(years_in_use, 1),
-                        'method': 'catboost_model',
-                        'disposal_flag': should_dispose
-                    })
-                
-                logger.info(f"✅ Successfully generated {len(predictions)} predictions using CatBoost model")
-                
-                return jsonify({
-                    'success': True,
-                    'predictions': predictions,
-                    'total_items': len(predictions),
-                    'method': 'catboost_model'
-                })
-                
-            except Exception as model_error:
-                logger.error(f"CatBoost model prediction failed: {str(model_error)}", exc_info=True)
-                logger.warning("Falling back to manual calculation method")
-                # Fall through to manual calculation fallback
-        
-        # Using previous prediction method: Manual calculation (deterministic)
-        logger.info("Using previous prediction method: Manual calculation (deterministic)")
-        logger.info("Method: Base lifespan calculation with penalties based on maintenance and condition")
-        predictions = []
-        
-        for item in items:
-            item_id = item.get('item_id')
-            category = item.get('category', 'Unknown')
-            years_in_use = float(item.get('years_in_use', 0))
-            maintenance_count = int(item.get('maintenance_count', 0))
-            condition_number = item.get('condition_number', 0)
-            condition_number_str = str(condition_number).upper() if condition_number else ''
-            condition_status = item.get('condition_status', '')
-            condition = item.get('condition', '')
-            last_reason = item.get('last_reason', '').lower()
-            
-            # Check if item should be disposed (R condition number, Disposal status, or Non-Serviceable)
-            should_dispose = (
-                condition_number_str == 'R' or  # R = Disposal
-                condition_status == 'Disposal' or
-                'Non-Serviceable' in str(condition) or
-                'Non - Serviceable' in str(condition)
-            )
+                if degraded:
+                    metrics.inc('lifespan.latency_budget.degraded')
+                    result = predict_manual(items)
+                elif use_batcher:
+                    result = lifespan_batcher.submit(items)
+                else:
+                    result = predict_lifespan(items, model)
             
-            if should_dispose:
-                # Item should be disposed - set remaining_years to 0
-                remaining_years = 0.0
-                lifespan_estimate = round(years_in_use, 1)
-                logger.info(f"🗑️ Item {item_id} marked for DISPOSAL (R/Disposal/Non-Serviceable) - setting remaining_years to 0")
-                
-                predictions.append({
-                    'item_id': item_id,
-                    'remaining_years': remaining_years,
-                    'lifespan_estimate': lifespan_estimate,
-                    'years_in_use': round(years_in_use, 1),
-                    'method': 'manual_calculation_fallback',
-                    'disposal_flag': True
-                })
-                continue
-            
-            # Calculate base remaining lifespan: 8 years max minus years in use
-            base_lifespan = max(0.0, 8.0 - years_in_use)
+            # Live input/prediction histograms for drift detection (model predictions only)
+            drift_monitor = get_drift_monitor()
+            if drift_monitor is not None:
+                drift_monitor.observe(items, result['remaining_years'] if result['method'] == 'catboost_model' else None)
             
-            # Determine penalty based on maintenance_count, condition_number, and last_reason
-            # Using deterministic calculations instead of random values for consistency
-            penalty = 0.0
-            
-            # Base penalty calculation (deterministic based on item characteristics)
-            if maintenance_count >= 2 or condition_number >= 4:
-                # Deterministic base penalty: scales with maintenance count and condition
-                # Base: 1.0 year for maintenance_count=2 or condition_number=4
-                base_penalty = 1.0
-                
-                # Scale based on maintenance count (more maintenance = higher penalty)
-                if maintenance_count >= 4:
-                    base_penalty = 1.5  # Severe degradation
-                elif maintenance_count >= 3:
-                    base_penalty = 1.25  # Moderate-severe degradation
-                elif maintenance_count >= 2:
-                    base_penalty = 1.0  # Moderate degradation
-                
-                # Scale based on condition number (higher condition number = worse condition)
-                condition_factor = max(0.0, (condition_number - 3) * 0.25) if condition_number >= 4 else 0.0
-                base_penalty += condition_factor
-                
-                # Additional penalty multiplier based on maintenance reason severity
-                reason_multiplier = 1.0
-                if last_reason:
-                    if 'wet' in last_reason or 'water' in last_reason:
-                        reason_multiplier = 1.5  # Water damage is severe
-                    elif 'electrical' in last_reason or 'short' in last_reason or 'circuit' in last_reason:
-                        reason_multiplier = 1.4  # Electrical issues are serious
-                    elif 'overheat' in last_reason or 'over heat' in last_reason or 'thermal' in last_reason:
-                        reason_multiplier = 1.3  # Thermal stress is significant
-                    elif 'wear' in last_reason or 'worn' in last_reason:
-                        reason_multiplier = 1.1  # Normal wear is minor
-                
-                penalty = base_penalty * reason_multiplier
+            # Candidate model comparison (sampled), queued once the response has been sent
+            shadow_scorer = get_shadow_scorer()
+            if shadow_scorer is not None and result['method'] == 'catboost_model':
+                shadow_items, shadow_result = items, result
                 
-                # Additional cumulative penalties for multiple maintenance issues
-                if maintenance_count >= 4:
-                    penalty += 0.5  # Heavy maintenance history
-                elif maintenance_count >= 3:
-                    penalty += 0.3  # Moderate maintenance history
-            
-            # Calculate remaining lifespan with penalty
-            remaining_years = base_lifespan - penalty
-            # Allow values below 0.5 to show items ending soon (≤30 days = 0.082 years)
-            remaining_years = np.clip(remaining_years, 0.0, 8.0)
-            remaining_years = round(remaining_years, 1)
-            lifespan_estimate = round(years_in_use + remaining_years, 1)
-            
-            predictions.append({
-                'item_id': item_id,
-                'remaining_years': remaining_years,
-                'lifespan_estimate': lifespan_estimate,
-                'years_in_use': round(years_in_use, 1),
-                'method': 'manual_calculation_fallback',
-                'disposal_flag': False
-            })
-            
-            # Enhanced logging with prediction details
-            status_indicator = ""
-            if remaining_years <= 0.082:
-                status_indicator = " [URGENT]"
-            elif remaining_years <= 0.164:
-                status_indicator = " [SOON]"
-            elif remaining_years <= 0.5:
-                status_indicator = " [MONITOR]"
-            
-            logger.info(f"Lifespan prediction for item {item_id}: {remaining_years} years remaining (method: manual, years_in_use: {years_in_use:.1f}, maintenance: {maintenance_count}, condition: {condition_number}){status_indicator}")
+                @after_this_request
+                def queue_shadow_scoring(response):
+                    response.call_on_close(lambda: shadow_scorer.submit(shadow_items, shadow_result))
+                    return response
         
-        logger.info(f"Successfully generated lifespan predictions for {len(predictions)} items")
+        response_format = negotiate_response_format(request, request_format)
+        if snapshot_records is None:
+            method = result['method']
+            if response_format == 'json':
+                predictions = prediction_records(result, compact=wants_compact(request))
+            else:
+                predictions = prediction_columns(result)
+            total_items = len(result['item_ids'])
+            disposal_items = int(result['disposal_flag'].sum())
+        else:
+            predictions = merge_live(snapshot_records, live_indices, prediction_records(result) if result else [])
+            method = result['method'] if result else predictions[0]['method']
+            total_items = len(predictions)
+            disposal_items = sum(1 for p in predictions if p['disposal_flag'])
+            if response_format != 'json':
+                # Same columns as prediction_columns(): the method is reported once
+                predictions = rows_to_columns([{k: v for k, v in p.items() if k != 'method'} for p in predictions])
+            elif wants_compact(request):
+                predictions = compact_records(predictions, method=method)
+            g.log_fields.update(snapshot_hits=snapshot_info['hits'])
+        g.log_fields.update(
+            method=method,
+            disposal_items=disposal_items,
+            response_format=response_format
+        )
         
-        return jsonify({
+        payload = {
             'success': True,
             'predictions': predictions,
-            'total_items': len(predictions),
-            'method': 'manual_calculation_fallback'
-        })
+            'total_items': total_items,
+            'method': method
+        }
+        if snapshot_info is not None:
+            payload['snapshot'] = snapshot_info
+        if budget_ms is not None:
+            g.log_fields.update(budget_ms=round(budget_ms, 1), degraded=degraded)
+            payload['latency_budget'] = {
+                'budget_ms': round(budget_ms, 1),
+                'estimated_model_ms': round(estimated_ms, 1) if estimated_ms is not None else None,
+                'degraded': degraded
+            }
+        return encode_response(payload, response_format)
     
+    except AdmissionRejected as e:
+        g.log_fields['error'] = str(e)
+        return admission_rejected_response(e)
     except Exception as e:
+        g.log_fields['error'] = str(e)
         logger.error(f"Error generating lifespan predictions: {str(e)}", exc_info=True)
         return jsonify({
             'success': False,
@@ -694,6 +574,314 @@ def predict_items_lifespan():
             'message': 'Failed to generate lifespan predictions'
         }), 500
 
+def rollup_request():
+    """
+    Decode a rollup request body and its group_by (body field or ?group_by=).
+    
+    Returns:
+        Tuple of (items, group_by, error response or None)
+    """
+    try:
+        data, request_format = decode_request(request)
+    except WireFormatError as e:
+        return None, None, (jsonify({'success': False, 'error': str(e)}), e.status)
+    if not data or 'items' not in data:
+        return None, None, (jsonify({
+            'success': False,
+            'error': 'Invalid request format. Expected "items" array.'
+        }), 400)
+    group_by = request.args.get('group_by', data.get('group_by', 'category'))
+    if group_by not in GROUP_BY:
+        return None, None, (jsonify({
+            'success': False,
+            'error': f"group_by must be one of: {', '.join(GROUP_BY)}"
+        }), 400)
+    items = data['items']
+    if request_format != 'json':
+        items = columns_to_rows(items)
+    g.log_fields.update(items=len(items), request_format=request_format, group_by=group_by)
+    return items, group_by, None
+
+@app.route('/predict/items/lifespan/delta', methods=['POST'])
+def predict_items_lifespan_delta():
+    """
+    Delta rescoring for nightly jobs: only predictions that changed since the last
+    delta request are returned (see lifespan_delta_store.py)
+    
+    Expected request format: the same items as /predict/items/lifespan. Each item may
+    carry a "fingerprint" (any string that changes when its inputs change); items sent
+    with only item_id and fingerprint are not scored, and are listed in needs_features
+    when their fingerprint is new or changed. Send "force": true (or ?force=1) to
+    rescore and return everything, e.g. after a failed write-back.
+    
+    Returns:
+    {
+        "success": true,
+        "predictions": [...],          # changed items only, same fields as /predict/items/lifespan
+        "total_items": 5000,
+        "unchanged_inputs": 4870,
+        "rescored": 130,
+        "changed": 12,
+        "needs_features": [],
+        "model_version": "3f1c...",
+        "method": "catboost_model"
+    }
+    """
+    try:
+        try:
+            data, request_format = decode_request(request)
+        except WireFormatError as e:
+            return jsonify({'success': False, 'error': str(e)}), e.status
+        if not data or 'items' not in data:
+            return jsonify({
+                'success': False,
+                'error': 'Invalid request format. Expected "items" array.'
+            }), 400
+        
+        items = data['items']
+        if request_format != 'json':
+            items = columns_to_rows(items)
+        force = request.args.get('force') in ('1', 'true') or data.get('force') is True
+        g.log_fields.update(items=len(items), request_format=request_format, force=force)
+        
+        lifespan_admission.check_items(len(items))
+        with lifespan_admission.slot():
+            outcome = delta_rescore(items, load_lifespan_model(), get_delta_store(), force=force)
+        metrics.inc('lifespan.delta.items', len(items))
+        metrics.inc('lifespan.delta.rescored', outcome['rescored'])
+        metrics.inc('lifespan.delta.changed', outcome['changed'])
+        g.log_fields.update(rescored=outcome['rescored'], changed=outcome['changed'])
+        
+        response_format = negotiate_response_format(request, request_format)
+        predictions = outcome.pop('predictions')
+        if response_format != 'json':
+            predictions = rows_to_columns([{k: v for k, v in p.items() if k != 'method'} for p in predictions])
+        elif wants_compact(request):
+            predictions = compact_records(predictions, method=outcome['method'])
+        return encode_response({
+            'success': True,
+            'predictions': predictions,
+            'total_items': len(items),
+            **outcome
+        }, response_format)
+    
+    except AdmissionRejected as e:
+        g.log_fields['error'] = str(e)
+        return admission_rejected_response(e)
+    except Exception as e:
+        g.log_fields['error'] = str(e)
+        logger.error(f"Error in delta lifespan rescoring: {str(e)}", exc_info=True)
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'message': 'Failed to rescore lifespan predictions'
+        }), 500
+
+@app.route('/rollups/consumables/linear', methods=['POST'])
+def rollup_consumables():
+    """
+    Consumables forecasts reduced per group instead of per item
+    
+    Expected request format: the same items as /predict/consumables/linear (each may
+    carry "category" and "location"), plus "group_by": "category" (default),
+    "location" or "quarter" (expected stock-out quarter; also accepted as ?group_by=)
+    
+    Returns:
+    {
+        "success": true,
+        "group_by": "category",
+        "groups": [
+            {"key": "Office Supplies", "items": 12, "total_predicted_usage": 840.0,
+             "total_current_stock": 1200.0, "mean_confidence": 0.71,
+             "at_risk_items": 3, "linear_regression_items": 9}
+        ],
+        "total_items": 12
+    }
+    """
+    try:
+        items, group_by, error = rollup_request()
+        if error is not None:
+            return error
+        forecasts, snapshot_info = forecast_with_snapshot(items)
+        payload = {
+            'success': True,
+            'group_by': group_by,
+            'groups': consumables_rollup(items, forecasts, group_by),
+            'total_items': len(forecasts)
+        }
+        if snapshot_info is not None:
+            payload['snapshot'] = snapshot_info
+        return encode_response(payload, negotiate_response_format(request, 'json'))
+    
+    except AdmissionRejected as e:
+        g.log_fields['error'] = str(e)
+        return admission_rejected_response(e)
+    except Exception as e:
+        g.log_fields['error'] = str(e)
+        logger.error(f"Error building consumables rollup: {str(e)}", exc_info=True)
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'message': 'Failed to build consumables rollup'
+        }), 500
+
+@app.route('/rollups/items/lifespan', methods=['POST'])
+def rollup_lifespan():
+    """
+    Lifespan predictions reduced per group instead of per item
+    
+    Expected request format: the same items as /predict/items/lifespan (each may carry
+    "location"), plus "group_by": "category" (default), "location" or "quarter"
+    (end-of-life quarter; also accepted as ?group_by=)
+    
+    Returns:
+    {
+        "success": true,
+        "group_by": "quarter",
+        "groups": [
+            {"key": "2026-Q4", "items": 7, "total_remaining_years": 1.4,
+             "mean_remaining_years": 0.2, "mean_lifespan_estimate": 5.1,
+             "at_risk_items": 7, "disposal_items": 2}
+        ],
+        "total_items": 7,
+        "method": "catboost_model"
+    }
+    
+    Items with at most ML_API_AT_RISK_YEARS (default 1.0) remaining years, or flagged
+    for disposal, are counted as at risk.
+    """
+    try:
+        items, group_by, error = rollup_request()
+        if error is not None:
+            return error
+        lifespan_admission.check_items(len(items))
+        with lifespan_admission.slot():
+            result = predict_lifespan(items, load_lifespan_model())
+        g.log_fields.update(method=result['method'])
+        return encode_response({
+            'success': True,
+            'group_by': group_by,
+            'groups': lifespan_rollup(items, result, group_by),
+            'total_items': len(result['item_ids']),
+            'method': result['method']
+        }, negotiate_response_format(request, 'json'))
+    
+    except AdmissionRejected as e:
+        g.log_fields['error'] = str(e)
+        return admission_rejected_response(e)
+    except Exception as e:
+        g.log_fields['error'] = str(e)
+        logger.error(f"Error building lifespan rollup: {str(e)}", exc_info=True)
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'message': 'Failed to build lifespan rollup'
+        }), 500
+
+@app.route('/drift/lifespan', methods=['GET'])
+def drift_lifespan():
+    """
+    Drift of live lifespan inputs and predictions from the model's training data:
+    PSI per field (and binned KS for numeric fields) with a stable / moderate /
+    significant status, over the most recent one to two windows of items
+    """
+    load_lifespan_model()
+    monitor = get_drift_monitor()
+    if monitor is None:
+        return jsonify({
+            'success': False,
+            'error': 'No drift reference profile for the active model. Retrain with train_lifespan_model.py '
+                     'or build one with: python drift_monitor.py --seed-from db_new.sql'
+        }), 404
+    
+    scores = monitor.scores()
+    return jsonify({
+        'success': True,
+        'status': scores['status'],
+        'fields': scores['fields'],
+        'reference': {
+            'created_at': monitor.profile.get('created_at'),
+            'rows': monitor.profile.get('rows')
+        },
+        'window_items': monitor.window_items
+    })
+
+@app.route('/explain/items/lifespan', methods=['POST'])
+def explain_items_lifespan():
+    """
+    Explain lifespan predictions: the fields that moved each item's remaining_years
+    most, with their SHAP contributions in years (negative = shorter lifespan)
+    
+    Expected request format: the same items as /predict/items/lifespan, plus an
+    optional "top_k" (default 3, also accepted as ?top_k=)
+    
+    Returns:
+    {
+        "success": true,
+        "base_value": 4.1,
+        "explanations": [
+            {
+                "item_id": 1,
+                "top_features": [
+                    {"field": "years_in_use", "value": 2.5, "contribution": -1.2},
+                    {"field": "last_reason", "value": "Overheat", "contribution": -0.4}
+                ]
+            }
+        ]
+    }
+    
+    base_value plus all contributions gives the raw model output, before clipping
+    and the disposal rule. Needs the CatBoost model file; returns 503 without it.
+    """
+    try:
+        try:
+            data, request_format = decode_request(request)
+        except WireFormatError as e:
+            return jsonify({'success': False, 'error': str(e)}), e.status
+        if not data or not data.get('items'):
+            return jsonify({
+                'success': False,
+                'error': 'Invalid request format. Expected "items" array.'
+            }), 400
+        
+        try:
+            top_k = int(request.args.get('top_k', data.get('top_k', 3)))
+        except (TypeError, ValueError):
+            return jsonify({'success': False, 'error': 'top_k must be an integer'}), 400
+        
+        items = data['items']
+        if request_format != 'json':
+            items = columns_to_frame(items)
+        g.log_fields.update(items=len(items), request_format=request_format, top_k=top_k)
+        
+        explain_admission.check_items(len(items))
+        with explain_admission.slot():
+            explainer = get_explainer()
+            result = explainer.explain(items, top_k=top_k)
+        
+        return encode_response({
+            'success': True,
+            'base_value': result['base_value'],
+            'explanations': result['explanations'],
+            'total_items': len(result['explanations']),
+            'model_version': explainer.model_version[:12]
+        }, negotiate_response_format(request, 'json'))
+    
+    except ExplainerUnavailable as e:
+        g.log_fields['error'] = str(e)
+        return jsonify({'success': False, 'error': str(e)}), 503
+    except AdmissionRejected as e:
+        g.log_fields['error'] = str(e)
+        return admission_rejected_response(e)
+    except Exception as e:
+        g.log_fields['error'] = str(e)
+        logger.error(f"Error explaining lifespan predictions: {str(e)}", exc_info=True)
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'message': 'Failed to explain lifespan predictions'
+        }), 500
+
 if __name__ == '__main__':
     # Pre-check CatBoost model availability on startup
     print("=" * 60)
@@ -712,7 +900,9 @@ if __name__ == '__main__':
     print("=" * 60)
     
     host = '0.0.0.0'
-    port = 5000
+    port = int(os.getenv('PORT', '5000'))
+    # The debugger and reloader slow every request; load tests turn them off
+    debug = os.getenv('ML_API_DEBUG', '1') == '1'
     
     print('=' * 60)
     print('🚀 Starting ML Forecast API Server')
@@ -726,5 +916,5 @@ if __name__ == '__main__':
     print('Press Ctrl+C to stop the server')
     print()
     
-    app.run(host=host, port=port, debug=True)
+    app.run(host=host, port=port, debug=debug)
 
@@ -0,0 +1,220 @@
+"""
+Batch Lifespan Scoring for the Whole Inventory
+
+Offline alternative to CalculateLifespanJob: reads every active, non-consumable item
+with the same feature query train_lifespan_model.py uses, scores them in chunks with
+the active lifespan model, and writes remaining_years and lifespan_estimate back with
+set-based bulk UPDATEs inside a single transaction.
+
+Usage:
+    python score_lifespan_items.py                         # score PostgreSQL (DB_* env vars) and commit
+    python score_lifespan_items.py --dry-run               # score and write, then roll back
+    python score_lifespan_items.py --sqlite local.db --seed-from db_new.sql --dry-run
+                                                           # local SQLite stand-in built from a dump
+
+Options:
+    --model PATH        Score with a specific .cbm/.npz file instead of the server's active model
+    --chunk-size N      Items per prediction call and per UPDATE statement (default 5000)
+"""
+
+import argparse
+import logging
+import sqlite3
+import sys
+import time
+
+import pandas as pd
+
+from lifespan_db import connect_to_database, item_feature_columns, ITEM_FEATURE_JOINS, NON_CONSUMABLE_ITEMS_FILTER
+from lifespan_predictor import load_lifespan_model, load_model_file, predict_lifespan, prediction_records
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Tables (and the columns the feature query needs) for the SQLite stand-in
+SQLITE_SCHEMA = {
+    'categories': ['id INTEGER PRIMARY KEY', 'category TEXT'],
+    'conditions': ['id INTEGER PRIMARY KEY', 'condition TEXT'],
+    'condition_numbers': ['id INTEGER PRIMARY KEY', 'condition_number TEXT', 'condition_status TEXT'],
+    'items': [
+        'id INTEGER PRIMARY KEY', 'category_id INTEGER', 'condition_id INTEGER', 'condition_number_id INTEGER',
+        'date_acquired TEXT', 'maintenance_count INTEGER', 'remaining_years REAL', 'lifespan_estimate REAL',
+        'maintenance_reason TEXT', 'deleted_at TEXT', 'updated_at TEXT',
+    ],
+    'maintenance_records': ['id INTEGER PRIMARY KEY', 'item_id INTEGER', 'maintenance_date TEXT', 'reason TEXT',
+                            'technician_notes TEXT'],
+}
+
+
+def read_items(conn, dialect, item_ids=None):
+    """
+    Read the model's raw input fields for every active, non-consumable item
+    (or only those in item_ids).
+
+    The raw condition number is selected as well: the feature query maps 'R' to 0,
+    but the disposal rule needs to see it.
+    """
+    # Ids are inlined as integers: the filter's LIKE patterns clash with DB-API placeholders
+    id_filter = ''
+    if item_ids is not None:
+        id_filter = f"AND i.id IN ({', '.join(str(int(i)) for i in item_ids) or 'NULL'})"
+    query = f"""
+    SELECT
+        {item_feature_columns(dialect)},
+        cn.condition_number as raw_condition_number
+    {ITEM_FEATURE_JOINS}
+    WHERE {NON_CONSUMABLE_ITEMS_FILTER}
+        {id_filter}
+    ORDER BY i.id
+    """
+    df = pd.read_sql_query(query, conn)
+    is_r = df['raw_condition_number'].fillna('').astype(str).str.strip().str.upper() == 'R'
+    df['condition_number'] = df['condition_number'].astype(object).where(~is_r, 'R')
+    return df.drop(columns=['raw_condition_number'])
+
+
+def score_items(df, model, chunk_size):
+    """
+    Score items in chunks. Returns a DataFrame of item_id, remaining_years, lifespan_estimate.
+    """
+    records = df.to_dict(orient='records')
+    scores = []
+    methods = set()
+    for start in range(0, len(records), chunk_size):
+        result = predict_lifespan(records[start:start + chunk_size], model)
+        methods.add(result['method'])
+        scores.extend(prediction_records(result))
+    logger.info(f"   Methods used: {', '.join(sorted(methods)) or 'none'}")
+    return pd.DataFrame(scores, columns=['item_id', 'remaining_years', 'lifespan_estimate'])
+
+
+def write_back(conn, scores, dialect, chunk_size):
+    """
+    Write predictions back with set-based UPDATEs (one statement per chunk).
+    Runs inside the caller's transaction; returns the number of rows updated.
+    """
+    rows = list(scores.itertuples(index=False, name=None))
+    if not rows:
+        return 0
+
+    cur = conn.cursor()
+    if dialect == 'sqlite':
+        # Stage the scores, then join them in one UPDATE ... FROM (SQLite 3.33+)
+        cur.execute("CREATE TEMP TABLE IF NOT EXISTS lifespan_scores "
+                    "(item_id INTEGER PRIMARY KEY, remaining_years REAL, lifespan_estimate REAL)")
+        cur.execute("DELETE FROM lifespan_scores")
+        cur.executemany("INSERT INTO lifespan_scores VALUES (?, ?, ?)", rows)
+        cur.execute("""
+            UPDATE items
+            SET remaining_years = s.remaining_years,
+                lifespan_estimate = s.lifespan_estimate,
+                updated_at = CURRENT_TIMESTAMP
+            FROM lifespan_scores s
+            WHERE items.id = s.item_id
+        """)
+        return cur.rowcount
+
+    from psycopg2.extras import execute_values
+    updated = 0
+    for start in range(0, len(rows), chunk_size):
+        execute_values(cur, """
+            UPDATE items AS i
+            SET remaining_years = v.remaining_years,
+                lifespan_estimate = v.lifespan_estimate,
+                updated_at = NOW()
+            FROM (VALUES %s) AS v(item_id, remaining_years, lifespan_estimate)
+            WHERE i.id = v.item_id
+        """, rows[start:start + chunk_size], template='(%s::bigint, %s::float8, %s::float8)', page_size=chunk_size)
+        updated += cur.rowcount
+    return updated
+
+
+def seed_sqlite(conn, dump_path):
+    """
+    Create the stand-in schema and load the relevant tables from a PostgreSQL dump.
+    Columns missing from the dump are left NULL.
+    """
+    from sql_dump_reader import read_dump_tables
+
+    tables = read_dump_tables(dump_path, list(SQLITE_SCHEMA))
+    for table, column_defs in SQLITE_SCHEMA.items():
+        conn.execute(f"DROP TABLE IF EXISTS {table}")
+        conn.execute(f"CREATE TABLE {table} ({', '.join(column_defs)})")
+        if table not in tables:
+            continue
+        dump_columns, rows = tables[table]
+        wanted = [d.split()[0] for d in column_defs]
+        positions = [dump_columns.index(c) if c in dump_columns else None for c in wanted]
+        conn.executemany(
+            f"INSERT INTO {table} ({', '.join(wanted)}) VALUES ({', '.join('?' * len(wanted))})",
+            [[row[p] if p is not None else None for p in positions] for row in rows]
+        )
+        logger.info(f"   Seeded {table}: {len(rows)} rows")
+    conn.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Score all items and bulk-write lifespan predictions')
+    parser.add_argument('--sqlite', default=None, help='Use a local SQLite database instead of PostgreSQL')
+    parser.add_argument('--seed-from', default=None, help='Create the SQLite stand-in from this pg_dump file first')
+    parser.add_argument('--dry-run', action='store_true', help='Roll back instead of committing')
+    parser.add_argument('--model', default=None, help='Model file (.cbm or .npz) to score with')
+    parser.add_argument('--chunk-size', type=int, default=5000, help='Items per prediction call / UPDATE statement')
+    args = parser.parse_args()
+
+    logger.info("=" * 60)
+    logger.info("📦 Batch Lifespan Scoring")
+    logger.info("=" * 60)
+
+    if args.seed_from and not args.sqlite:
+        parser.error('--seed-from requires --sqlite')
+
+    model = load_model_file(args.model) if args.model else load_lifespan_model()
+    if model is None:
+        logger.warning("⚠️ No model available - manual calculation will be used")
+
+    if args.sqlite:
+        dialect = 'sqlite'
+        conn = sqlite3.connect(args.sqlite)
+        if args.seed_from:
+            logger.info(f"Seeding SQLite stand-in {args.sqlite} from {args.seed_from}...")
+            seed_sqlite(conn, args.seed_from)
+    else:
+        dialect = 'postgresql'
+        conn = connect_to_database()
+
+    try:
+        start = time.perf_counter()
+        df = read_items(conn, dialect)
+        logger.info(f"✅ Loaded {len(df)} items ({time.perf_counter() - start:.2f}s)")
+
+        start = time.perf_counter()
+        scores = score_items(df, model, args.chunk_size)
+        logger.info(f"✅ Scored {len(scores)} items ({time.perf_counter() - start:.2f}s)")
+
+        start = time.perf_counter()
+        updated = write_back(conn, scores, dialect, args.chunk_size)
+        logger.info(f"✅ Updated {updated} rows ({time.perf_counter() - start:.2f}s)")
+
+        if args.dry_run:
+            conn.rollback()
+            logger.info("🔁 Dry run - transaction rolled back, no changes saved")
+            if len(scores):
+                logger.info(f"   Sample predictions:\n{scores.head(10).to_string(index=False)}")
+        else:
+            conn.commit()
+            logger.info("💾 Changes committed")
+    except Exception as e:
+        conn.rollback()
+        logger.error(f"❌ Scoring failed, transaction rolled back: {e}")
+        sys.exit(1)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,203 @@
+"""
+Shadow Scoring of a Candidate Lifespan Model
+
+Before a retrained catboost_lifespan_model.cbm replaces the active one, the server
+can score real traffic with it alongside the active model:
+
+- The candidate (a .cbm file or its NumPy .npz export) is loaded next to the active
+  model from LIFESPAN_SHADOW_MODEL_PATH.
+- A sampled fraction of the batches the active model answered is queued only after
+  the response has been sent, so clients never wait for the candidate.
+- One background thread, running at a lower OS priority, scores queued batches. When
+  it falls behind, new batches are dropped (and counted) instead of queued.
+- Deltas (candidate - active remaining_years, disposal items excluded) and timings
+  are recorded under shadow.lifespan.* in /metrics.
+
+Timings compare the candidate's measured time with the active model's cost curve
+for the same batch size (see latency_budget.py).
+
+Metrics:
+    shadow.lifespan.batches / items / dropped_batches / errors     counters
+    shadow.lifespan.items_changed        items whose prediction moved >= ML_API_SHADOW_CHANGE_YEARS
+    shadow.lifespan.mean_abs_delta_years running mean |candidate - active| (gauge)
+    shadow.lifespan.mean_delta_years     running mean candidate - active, i.e. bias (gauge)
+    shadow.lifespan.max_abs_delta_years  largest |delta| seen (gauge)
+    shadow.lifespan.candidate_ms / active_ms   per-batch timings (histograms)
+    shadow.lifespan.latency_ratio        candidate time / active time over all batches (gauge)
+
+Environment:
+    LIFESPAN_SHADOW_MODEL_PATH    Candidate model (.cbm or .npz); shadow scoring is off when unset
+    ML_API_SHADOW_SAMPLE_RATE     Fraction of lifespan batches scored by the candidate (default 0.1)
+    ML_API_SHADOW_QUEUE_BATCHES   Batches waiting for the shadow thread before new ones are dropped (default 8)
+    ML_API_SHADOW_CHANGE_YEARS    Delta counted as a changed prediction (default 0.5)
+    ML_API_SHADOW_NICE            Niceness added to the shadow thread (default 10, Linux only)
+"""
+
+import logging
+import os
+import queue
+import random
+import threading
+import time
+
+import numpy as np
+
+from api_metrics import metrics
+from latency_budget import lifespan_model_cost
+from lifespan_predictor import load_model_file, predict_with_model
+
+logger = logging.getLogger(__name__)
+
+SHADOW_MODEL_PATH = os.getenv('LIFESPAN_SHADOW_MODEL_PATH')
+SAMPLE_RATE = float(os.getenv('ML_API_SHADOW_SAMPLE_RATE', '0.1'))
+QUEUE_BATCHES = int(os.getenv('ML_API_SHADOW_QUEUE_BATCHES', '8'))
+CHANGE_YEARS = float(os.getenv('ML_API_SHADOW_CHANGE_YEARS', '0.5'))
+SHADOW_NICE = int(os.getenv('ML_API_SHADOW_NICE', '10'))
+
+PREFIX = 'shadow.lifespan'
+
+
+class ShadowScorer:
+    """
+    Score sampled lifespan batches with a candidate model on a background thread.
+
+    Args:
+        model: Loaded candidate model (CatBoostRegressor or ObliviousTreeEvaluator)
+        sample_rate: Fraction of submitted batches that are scored
+        queue_batches: Queue capacity; batches submitted while it is full are dropped
+        change_years: Absolute delta counted as a changed prediction
+        name: Label used in logs (usually the candidate's file name)
+    """
+
+    def __init__(self, model, sample_rate=SAMPLE_RATE, queue_batches=QUEUE_BATCHES,
+                 change_years=CHANGE_YEARS, name='candidate'):
+        self.model = model
+        self.sample_rate = sample_rate
+        self.change_years = change_years
+        self.name = name
+        self._queue = queue.Queue(maxsize=max(1, queue_batches))
+        self._random = random.Random()
+        self._lock = threading.Lock()
+        self._items = 0
+        self._sum_delta = 0.0
+        self._sum_abs_delta = 0.0
+        self._max_abs_delta = 0.0
+        self._candidate_ms = 0.0
+        self._active_ms = 0.0
+        self._worker = threading.Thread(target=self._run, name='lifespan-shadow', daemon=True)
+        self._worker.start()
+
+    def submit(self, items, result):
+        """
+        Offer a batch the active model answered (items and its predict_lifespan()
+        result). Never blocks: unsampled batches are ignored and a full queue drops the batch.
+        """
+        if result.get('method') != 'catboost_model' or not len(items):
+            return False
+        if self._random.random() >= self.sample_rate:
+            return False
+        try:
+            self._queue.put_nowait((items, result))
+        except queue.Full:
+            metrics.inc(f'{PREFIX}.dropped_batches')
+            return False
+        return True
+
+    def _run(self):
+        lower_thread_priority()
+        while True:
+            items, result = self._queue.get()
+            try:
+                self._score(items, result)
+            except Exception as e:
+                metrics.inc(f'{PREFIX}.errors')
+                logger.error(f"❌ Shadow scoring with {self.name} failed: {e}", exc_info=True)
+            finally:
+                self._queue.task_done()
+
+    def _score(self, items, result):
+        started = time.perf_counter()
+        candidate = predict_with_model(items, self.model)
+        candidate_ms = (time.perf_counter() - started) * 1000
+        active_ms = lifespan_model_cost.estimate_ms(len(items))
+
+        # Disposal items are 0 under both models, so they would only dilute the deltas
+        scored = ~np.asarray(result['disposal_flag'], dtype=bool)
+        delta = (np.asarray(candidate['remaining_years'], dtype=np.float64)[scored]
+                 - np.asarray(result['remaining_years'], dtype=np.float64)[scored])
+        abs_delta = np.abs(delta)
+
+        with self._lock:
+            self._items += len(delta)
+            self._sum_delta += float(delta.sum())
+            self._sum_abs_delta += float(abs_delta.sum())
+            if len(abs_delta):
+                self._max_abs_delta = max(self._max_abs_delta, float(abs_delta.max()))
+            self._candidate_ms += candidate_ms
+            if active_ms is not None:
+                self._active_ms += active_ms
+            compared = self._items
+            mean_delta = self._sum_delta / compared if compared else None
+            mean_abs_delta = self._sum_abs_delta / compared if compared else None
+            max_abs_delta = self._max_abs_delta
+            latency_ratio = self._candidate_ms / self._active_ms if self._active_ms else None
+
+        metrics.inc(f'{PREFIX}.batches')
+        metrics.inc(f'{PREFIX}.items', len(items))
+        metrics.inc(f'{PREFIX}.items_changed', int((abs_delta >= self.change_years).sum()))
+        metrics.observe(f'{PREFIX}.candidate_ms', candidate_ms)
+        if active_ms is not None:
+            metrics.observe(f'{PREFIX}.active_ms', active_ms)
+        if mean_delta is not None:
+            metrics.set_gauge(f'{PREFIX}.mean_delta_years', round(mean_delta, 4))
+            metrics.set_gauge(f'{PREFIX}.mean_abs_delta_years', round(mean_abs_delta, 4))
+            metrics.set_gauge(f'{PREFIX}.max_abs_delta_years', round(max_abs_delta, 4))
+        if latency_ratio is not None:
+            metrics.set_gauge(f'{PREFIX}.latency_ratio', round(latency_ratio, 3))
+
+    def wait_idle(self, timeout=None):
+        """Block until every queued batch has been scored (offline tools and tests)."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+
+def lower_thread_priority(nice=SHADOW_NICE):
+    """
+    Raise the calling thread's niceness so the shadow model yields the CPU to request
+    handlers. Linux applies setpriority() to a single thread id; elsewhere this is a no-op.
+    """
+    if nice <= 0 or not hasattr(os, 'setpriority') or not hasattr(threading, 'get_native_id'):
+        return
+    try:
+        tid = threading.get_native_id()
+        os.setpriority(os.PRIO_PROCESS, tid, os.getpriority(os.PRIO_PROCESS, tid) + nice)
+    except OSError as e:
+        logger.debug("Could not lower shadow thread priority: %s", e)
+
+
+_scorer = None
+_scorer_loaded = False
+_scorer_lock = threading.Lock()
+
+
+def get_shadow_scorer():
+    """
+    Shadow scorer for LIFESPAN_SHADOW_MODEL_PATH, created on first use; None when no
+    candidate is configured or it fails to load.
+    """
+    global _scorer, _scorer_loaded
+    if SHADOW_MODEL_PATH is None:
+        return None
+    with _scorer_lock:
+        if not _scorer_loaded:
+            _scorer_loaded = True
+            try:
+                _scorer = ShadowScorer(load_model_file(SHADOW_MODEL_PATH), name=os.path.basename(SHADOW_MODEL_PATH))
+                logger.info(f"✅ Shadow scoring {SAMPLE_RATE:.0%} of lifespan batches with {SHADOW_MODEL_PATH}")
+            except Exception as e:
+                logger.error(f"❌ Failed to load shadow model {SHADOW_MODEL_PATH}: {e}")
+        return _scorer
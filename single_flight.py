@@ -0,0 +1,71 @@
+"""
+Single-flight Request Coalescing
+
+When several callers ask for the same computation at the same time, only the first
+one (the leader) runs it; the others wait for the leader's result instead of
+repeating the work. Nothing is kept once the computation finishes, so there is no
+cache to invalidate - later requests always compute fresh results.
+
+Usage:
+    flight = SingleFlight('consumables')
+    forecasts = flight.do(canonical_hash(items), lambda: forecast_consumables(items))
+"""
+
+import hashlib
+import json
+import threading
+from concurrent.futures import Future
+
+from api_metrics import metrics
+
+
+def canonical_hash(payload):
+    """
+    Hash a JSON-compatible payload independently of key order and whitespace.
+    """
+    encoded = json.dumps(payload, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+
+class SingleFlight:
+    """
+    Deduplicate identical in-flight calls by key.
+
+    Results are shared between all callers of one flight, so they must be treated
+    as read-only.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self._flights = {}
+
+    def do(self, key, fn):
+        """
+        Return fn()'s result, joining an identical call already in progress if there is one.
+        Exceptions raised by the leader are re-raised in every waiting caller.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = Future()
+                metrics.set_gauge(f'{self.name}.singleflight.in_flight', len(self._flights))
+
+        if not leader:
+            metrics.inc(f'{self.name}.singleflight.coalesced')
+            return flight.result()
+
+        metrics.inc(f'{self.name}.singleflight.executed')
+        try:
+            result = fn()
+        except Exception as e:
+            flight.set_exception(e)
+            raise
+        else:
+            flight.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._flights[key]
+                metrics.set_gauge(f'{self.name}.singleflight.in_flight', len(self._flights))
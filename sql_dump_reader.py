@@ -0,0 +1,198 @@
+"""
+PostgreSQL Dump Reader
+
+Reads table data out of the bundled database dumps without a running PostgreSQL
+server. Supports both formats found in this repository:
+
+- plain SQL dumps (nia_db.sql) with COPY ... FROM stdin blocks
+- custom-format archives (db_new.sql, backup_nia_db.sql) written by pg_dump -Fc,
+  including zlib-compressed data blocks
+
+IrrigTrack.sql is also a custom archive, but it was re-encoded as text at some point
+(invalid bytes were replaced with U+FFFD), so its compressed blocks cannot be read;
+a ValueError is raised for archives damaged that way.
+
+Usage:
+    from sql_dump_reader import read_dump_tables
+    tables = read_dump_tables('db_new.sql', ['items', 'categories'])
+    columns, rows = tables['items']
+"""
+
+import re
+import struct
+import zlib
+
+CUSTOM_DUMP_MAGIC = b'PGDMP'
+COPY_HEADER = re.compile(r'^COPY\s+(?:"?(\w+)"?\.)?"?(\w+)"?\s*\((.*)\)\s+FROM\s+stdin;', re.IGNORECASE)
+
+# Custom archive constants (pg_backup_archiver.h / pg_backup_custom.c)
+OFFSET_POS_SET = 2
+BLOCK_DATA = 1
+
+
+def read_dump_tables(path, tables=None):
+    """
+    Read table rows from a plain or custom-format PostgreSQL dump.
+
+    Args:
+        path: Dump file path
+        tables: Table names to read (without schema); None reads every table
+
+    Returns:
+        Dict of table name -> (column names, list of row lists). Values are strings,
+        NULLs are None.
+    """
+    with open(path, 'rb') as f:
+        is_custom = f.read(len(CUSTOM_DUMP_MAGIC)) == CUSTOM_DUMP_MAGIC
+
+    wanted = set(tables) if tables is not None else None
+    if is_custom:
+        return _read_custom_dump(path, wanted)
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        return _read_copy_blocks(f, wanted)
+
+
+def _read_copy_blocks(lines, wanted):
+    """Parse COPY ... FROM stdin blocks from an iterable of text lines."""
+    result = {}
+    current = None
+    for line in lines:
+        if current is None:
+            match = COPY_HEADER.match(line)
+            if match and (wanted is None or match.group(2) in wanted):
+                columns = [c.strip().strip('"') for c in match.group(3).split(',')]
+                current = (match.group(2), columns, [])
+            continue
+        line = line.rstrip('\n')
+        if line == '\\.':
+            result[current[0]] = (current[1], current[2])
+            current = None
+            continue
+        current[2].append([_unescape_copy_value(v) for v in line.split('\t')])
+    return result
+
+
+def _unescape_copy_value(value):
+    """Decode one COPY text-format field."""
+    if value == '\\N':
+        return None
+    if '\\' not in value:
+        return value
+    escapes = {'t': '\t', 'n': '\n', 'r': '\r', 'b': '\b', 'f': '\f', 'v': '\v', '\\': '\\'}
+    return re.sub(r'\\(.)', lambda m: escapes.get(m.group(1), m.group(1)), value)
+
+
+class _ArchiveReader:
+    """Primitive readers for the pg_dump custom archive format."""
+
+    def __init__(self, f):
+        self.f = f
+        self.int_size = 4
+        self.off_size = 8
+
+    def byte(self):
+        data = self.f.read(1)
+        if not data:
+            raise ValueError("Unexpected end of archive (the dump may have been corrupted, e.g. re-encoded as text)")
+        return data[0]
+
+    def int(self):
+        sign = self.byte()
+        value = int.from_bytes(self.f.read(self.int_size), 'little')
+        return -value if sign else value
+
+    def str(self):
+        length = self.int()
+        if length < 0:
+            return None
+        data = self.f.read(length)
+        if len(data) != length:
+            raise ValueError("Unexpected end of archive (the dump may have been corrupted, e.g. re-encoded as text)")
+        return data.decode('utf-8', errors='replace')
+
+    def offset(self):
+        flag = self.byte()
+        value = int.from_bytes(self.f.read(self.off_size), 'little')
+        return flag, value
+
+
+def _read_custom_dump(path, wanted):
+    """Read COPY data blocks from a pg_dump -Fc archive."""
+    with open(path, 'rb') as f:
+        reader = _ArchiveReader(f)
+        f.read(len(CUSTOM_DUMP_MAGIC))
+        version = struct.unpack('BBB', f.read(3))
+        if version < (1, 14):
+            raise ValueError(f"Unsupported custom dump version {'.'.join(map(str, version))}")
+        reader.int_size = reader.byte()
+        reader.off_size = reader.byte()
+        if reader.byte() != 1:
+            raise ValueError("Not a custom-format (-Fc) archive")
+
+        # Compression: a single algorithm byte from 1.15, an int level before that
+        compressed = reader.byte() != 0 if version >= (1, 15) else reader.int() != 0
+        for _ in range(7):  # creation timestamp fields
+            reader.int()
+        reader.str()  # database name
+        reader.str()  # server version
+        reader.str()  # pg_dump version
+
+        entries = []
+        for _ in range(reader.int()):
+            entry = _read_toc_entry(reader, version)
+            if entry['desc'] == 'TABLE DATA' and (wanted is None or entry['tag'] in wanted):
+                entries.append(entry)
+
+        result = {}
+        for entry in entries:
+            if entry['data_state'] != OFFSET_POS_SET:
+                continue
+            f.seek(entry['data_pos'])
+            if reader.byte() != BLOCK_DATA or reader.int() != entry['dump_id']:
+                raise ValueError(f"Corrupt data block for table {entry['tag']}")
+            data = _read_data_chunks(reader, compressed)
+            lines = [entry['copy_stmt']] + data.decode('utf-8', errors='replace').splitlines(keepends=True)
+            if not data.endswith(b'\\.\n'):
+                lines.append('\\.\n')
+            result.update(_read_copy_blocks(lines, None))
+        return result
+
+
+def _read_toc_entry(reader, version):
+    """Read one table-of-contents entry (ReadToc in pg_backup_archiver.c)."""
+    entry = {'dump_id': reader.int()}
+    reader.int()  # hadDumper
+    reader.str()  # table oid
+    reader.str()  # oid
+    entry['tag'] = reader.str()
+    entry['desc'] = reader.str()
+    reader.int()  # section
+    reader.str()  # definition
+    reader.str()  # drop statement
+    entry['copy_stmt'] = reader.str() or ''
+    reader.str()  # namespace
+    reader.str()  # tablespace
+    reader.str()  # table access method
+    if version >= (1, 16):
+        reader.int()  # relkind
+    reader.str()  # owner
+    reader.str()  # "with oids" flag
+    while reader.str() is not None:  # dependencies
+        pass
+    entry['data_state'], entry['data_pos'] = reader.offset()
+    return entry
+
+
+def _read_data_chunks(reader, compressed):
+    """Concatenate (and inflate) the length-prefixed chunks of one data block."""
+    decompressor = zlib.decompressobj() if compressed else None
+    parts = []
+    while True:
+        length = reader.int()
+        if length == 0:
+            break
+        chunk = reader.f.read(length)
+        parts.append(decompressor.decompress(chunk) if decompressor else chunk)
+    if decompressor:
+        parts.append(decompressor.flush())
+    return b''.join(parts)
@@ -0,0 +1,239 @@
+"""
+Monte Carlo Stock-out Risk for Consumables
+
+shortage_date from forecast_consumables() is a single optimistic date: current stock
+divided by the predicted quarterly usage, spread over 90 days. This module simulates
+many future demand paths per item instead and reports how likely each item is to run
+out within a few horizons, so procurement can rank reorders by risk.
+
+- Each item's quarterly trend is fitted the same way as forecast_consumables() (OLS
+  over the non-zero quarters; the next period is the number of those quarters), for
+  all items at once on padded arrays.
+- A path's usage in each future quarter is the trend value plus a residual drawn,
+  with replacement, from that item's own fit residuals, floored at 0. Items with
+  fewer than two non-zero quarters have no residuals and follow their average.
+- Usage is spread evenly over the 90 days of a quarter (as for shortage_date), so a
+  path runs out on the day its cumulative usage reaches current_stock.
+- Items are simulated in chunks of (paths, items) NumPy arrays, one step per future
+  quarter, from a seeded generator. Each chunk is reduced to per-item counts before
+  the next one, so memory stays bounded whatever the number of items and paths.
+
+The number of paths is chosen so a run fits ML_API_STOCKOUT_TARGET_MS. Simulation
+cost per item-path-quarter is learned from earlier runs (see latency_budget.py).
+Pass "paths" explicitly to get bit-for-bit reproducible results for a seed.
+
+Environment:
+    ML_API_STOCKOUT_TARGET_MS   Latency target for one simulation request (default 1000)
+    ML_API_STOCKOUT_MIN_PATHS   Fewest paths per item, even when over the target (default 200)
+    ML_API_STOCKOUT_MAX_PATHS   Most paths per item (default 10000)
+    ML_API_STOCKOUT_SEED        Default random seed (default 42)
+"""
+
+import logging
+import math
+import os
+import time
+from datetime import date, timedelta
+
+import numpy as np
+
+from api_metrics import metrics
+from latency_budget import InferenceCostEstimator
+
+logger = logging.getLogger(__name__)
+
+TARGET_MS = float(os.getenv('ML_API_STOCKOUT_TARGET_MS', '1000'))
+MIN_PATHS = int(os.getenv('ML_API_STOCKOUT_MIN_PATHS', '200'))
+MAX_PATHS = int(os.getenv('ML_API_STOCKOUT_MAX_PATHS', '10000'))
+DEFAULT_SEED = int(os.getenv('ML_API_STOCKOUT_SEED', '42'))
+DEFAULT_HORIZONS_DAYS = (30, 90, 180)
+
+DAYS_PER_QUARTER = 90
+# Elements (item x path) per array in one chunk - about 8 MB of float64
+CHUNK_ELEMENTS = 1_000_000
+# Cost assumed before any run has been timed
+DEFAULT_NS_PER_ELEMENT = 60.0
+
+# Learned cost of a simulation: overhead_ms + per-element ms * (items x paths x quarters)
+simulation_cost = InferenceCostEstimator('stockout.simulation')
+
+
+def fit_usage_trends(items):
+    """
+    Fit every item's quarterly usage trend like forecast_consumables(), vectorized.
+
+    Returns:
+        Dict of per-item arrays: 'intercept', 'slope', 'next_period' (the trend is
+        intercept + slope * period), 'residuals' (items, max points; zero padded),
+        'residual_counts' (0 for items without a fitted trend) and 'current_stock'
+    """
+    n = len(items)
+    series = []
+    fallback = np.zeros(n)
+    stock = np.zeros(n)
+    for i, item in enumerate(items):
+        usage = [(idx, point.get('usage', 0)) for idx, point in enumerate(item.get('historical_data') or [])]
+        usage = [(idx, u) for idx, u in usage if u > 0]
+        series.append(usage)
+        if len(usage) < 2:
+            fallback[i] = (np.mean([u for _, u in usage]) if usage
+                           else (item.get('forecast_features') or {}).get('avg_usage_per_quarter', 0) or 0)
+        stock[i] = item.get('current_stock', 0) or 0
+
+    counts = np.array([len(s) for s in series], dtype=np.int64)
+    width = max(1, int(counts.max())) if n else 1
+    periods = np.zeros((n, width))
+    usage = np.zeros((n, width))
+    mask = np.arange(width)[None, :] < counts[:, None]
+    if n and counts.sum():
+        flat = [point for s in series for point in s]
+        periods[mask] = [p for p, _ in flat]
+        usage[mask] = [u for _, u in flat]
+
+    # Closed-form OLS per row over the masked points
+    fitted = counts >= 2
+    safe_counts = np.maximum(counts, 1)
+    x_mean = periods.sum(axis=1) / safe_counts
+    y_mean = usage.sum(axis=1) / safe_counts
+    dx = np.where(mask, periods - x_mean[:, None], 0.0)
+    dy = np.where(mask, usage - y_mean[:, None], 0.0)
+    sxx = (dx * dx).sum(axis=1)
+    slope = np.where(fitted & (sxx > 0), (dx * dy).sum(axis=1) / np.where(sxx > 0, sxx, 1.0), 0.0)
+    intercept = np.where(fitted, y_mean - slope * x_mean, fallback)
+
+    residuals = np.where(mask & fitted[:, None], usage - (intercept[:, None] + slope[:, None] * periods), 0.0)
+    return {
+        'intercept': intercept,
+        'slope': slope,
+        'next_period': np.where(fitted, counts, 0).astype(np.float64),
+        'residuals': residuals,
+        'residual_counts': np.where(fitted, counts, 0),
+        'current_stock': stock,
+    }
+
+
+def choose_paths(n_items, quarters, target_ms=TARGET_MS):
+    """Paths per item that keep a run of n_items x quarters within target_ms (bounded by MIN/MAX_PATHS)."""
+    elements_per_path = max(1, n_items * quarters)
+    overhead_ms = simulation_cost.estimate_ms(0)
+    if overhead_ms is None:
+        overhead_ms, per_element_ms = 0.0, DEFAULT_NS_PER_ELEMENT / 1e6
+    else:
+        per_element_ms = max((simulation_cost.estimate_ms(1_000_000) - overhead_ms) / 1_000_000, 1e-9)
+    paths = int((target_ms - overhead_ms) / (per_element_ms * elements_per_path))
+    return max(MIN_PATHS, min(MAX_PATHS, paths))
+
+
+def simulate_stockout_counts(trends, paths, quarters, horizons, rng):
+    """
+    Simulate every item's stock-out day over paths demand paths and reduce each item
+    chunk to per-item counts, so memory stays bounded by CHUNK_ELEMENTS.
+
+    Returns:
+        (by_horizon, hits, day_sums): paths out of stock by each horizon (items,
+        horizons), paths that run out within the simulated quarters (items,) and the
+        sum of their stock-out days (items,)
+    """
+    n = len(trends['intercept'])
+    horizon_days = np.asarray(horizons, dtype=np.float64)
+    by_horizon = np.zeros((n, len(horizons)), dtype=np.int64)
+    hits = np.zeros(n, dtype=np.int64)
+    day_sums = np.zeros(n)
+    width = trends['residuals'].shape[1]
+    chunk = max(1, CHUNK_ELEMENTS // paths)
+    for start in range(0, n, chunk):
+        rows = slice(start, start + chunk)
+        counts = trends['residual_counts'][rows]
+        stock = trends['current_stock'][rows]
+        flat_residuals = trends['residuals'][rows].ravel()
+        row_offsets = np.arange(len(counts)) * width
+        used = np.zeros((paths, len(counts)))
+        chunk_days = np.full((paths, len(counts)), np.inf)
+
+        # Quarters are few, so step through them with (paths, items) arrays
+        for q in range(quarters):
+            mean = trends['intercept'][rows] + trends['slope'][rows] * (trends['next_period'][rows] + q)
+            # Bootstrap residuals: uniform index into each item's own residuals (0 -> none)
+            draws = (rng.random((paths, len(counts)), dtype=np.float32) * counts).astype(np.int64)
+            demand = np.maximum(mean + flat_residuals.take(draws + row_offsets), 0.0)
+            crosses = np.isinf(chunk_days) & (used + demand >= stock)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                fraction = np.where(demand > 0, (stock - used) / demand, 0.0)
+            chunk_days[crosses] = (DAYS_PER_QUARTER * (q + np.clip(fraction, 0.0, 1.0)))[crosses]
+            used += demand
+
+        hit = np.isfinite(chunk_days)
+        hits[rows] = hit.sum(axis=0)
+        day_sums[rows] = np.where(hit, chunk_days, 0.0).sum(axis=0)
+        for k, h in enumerate(horizon_days):
+            by_horizon[rows, k] = np.count_nonzero(chunk_days <= h, axis=0)
+    return by_horizon, hits, day_sums
+
+
+def simulate_stockout_risk(items, horizons_days=DEFAULT_HORIZONS_DAYS, paths=None, seed=DEFAULT_SEED,
+                           target_ms=TARGET_MS, today=None):
+    """
+    Stock-out risk per item, most at-risk first.
+
+    Args:
+        items: Consumable items as sent to /predict/consumables/linear
+        horizons_days: Horizons (days from today) to report stock-out probabilities for
+        paths: Demand paths per item (None: as many as fit target_ms)
+        seed: Random seed
+        target_ms: Latency target used when paths is None
+
+    Returns:
+        Dict with 'risks' (one dict per item: stock-out probability per horizon,
+        expected stock-out day/date over the paths that run out, risk_rank),
+        'paths', 'quarters', 'seed', 'horizons_days' and 'elapsed_ms'
+    """
+    started = time.perf_counter()
+    horizons = sorted({int(h) for h in horizons_days})
+    quarters = max(1, math.ceil(horizons[-1] / DAYS_PER_QUARTER))
+    if paths is None:
+        paths = choose_paths(len(items), quarters, target_ms)
+    paths = max(1, min(MAX_PATHS, int(paths)))
+
+    trends = fit_usage_trends(items)
+    by_horizon, hits, day_sums = simulate_stockout_counts(trends, paths, quarters, horizons,
+                                                          np.random.default_rng(seed))
+
+    # (items, horizons) share of paths out of stock by each horizon
+    probabilities = by_horizon / paths
+    with np.errstate(invalid='ignore', divide='ignore'):
+        expected_days = np.where(hits > 0, day_sums / np.maximum(hits, 1), np.nan)
+
+    # Highest probability at the shortest horizon first, ties broken by longer horizons, then the earliest date
+    order = np.lexsort((np.nan_to_num(expected_days, nan=np.inf),) + tuple(-probabilities[:, k] for k in reversed(range(len(horizons)))))
+    start_date = today or date.today()
+    probability_rows = probabilities.round(4).tolist()
+    risks = []
+    for rank, i in enumerate(order.tolist(), 1):
+        item = items[i]
+        expected = None if np.isnan(expected_days[i]) else round(float(expected_days[i]), 1)
+        risks.append({
+            'item_id': item.get('item_id'),
+            'name': item.get('name', f"Item {item.get('item_id')}"),
+            'current_stock': item.get('current_stock', 0),
+            'stockout_probability': {f'{h}d': p for h, p in zip(horizons, probability_rows[i])},
+            'expected_stockout_days': expected,
+            'expected_stockout_date': (start_date + timedelta(days=int(expected))).isoformat() if expected is not None else None,
+            'simulated_paths_out_of_stock': round(float(hits[i]) / paths, 4),
+            'method': 'residual_bootstrap' if trends['residual_counts'][i] else 'average',
+            'risk_rank': rank,
+        })
+
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    elements = len(items) * paths * quarters
+    simulation_cost.observe(elements, elapsed_ms)
+    metrics.observe('stockout.simulation.ms', elapsed_ms)
+    metrics.observe('stockout.simulation.paths', paths)
+    logger.debug("Simulated %d paths x %d quarters for %d items in %.1f ms", paths, quarters, len(items), elapsed_ms)
+    return {
+        'risks': risks,
+        'paths': paths,
+        'quarters': quarters,
+        'seed': seed,
+        'horizons_days': horizons,
+        'elapsed_ms': round(elapsed_ms, 1),
+    }
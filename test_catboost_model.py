@@ -1,63 +1,282 @@
 """
-Quick test script to verify CatBoost model can be loaded
-Run this to check if the model file is valid
+Model validation gate for the CatBoost lifespan model
+
+Loads a candidate model and the current production model, scores both on a frozen
+golden dataset and compares accuracy (MAE, R²), inference latency and peak memory
+at several batch sizes. Exits with status 1 if the candidate cannot be loaded or
+regresses beyond the configured thresholds, so a worse or slower model is never
+swapped into the API.
+
+Usage:
+    python test_catboost_model.py                                  # validate catboost_lifespan_model.cbm
+    python test_catboost_model.py --candidate new_model.cbm        # gate new_model.cbm against production
+    python test_catboost_model.py --freeze-golden                  # snapshot the golden dataset from the database
+    python test_catboost_model.py --freeze-golden --seed-from db_new.sql
+                                                                   # ... or from a pg_dump file
+
+The golden dataset is a CSV of raw item fields (category, years_in_use,
+maintenance_count, condition_number, condition_status, condition, last_reason)
+plus a 'target' column, i.e. the same rows train_lifespan_model.py trains on.
+golden_lifespan_dataset.csv is committed (frozen from db_new.sql) and kept
+unchanged so every model is scored on the same data; re-freeze it only on purpose.
 """
 
+import argparse
+import json
 import os
 import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from lifespan_predictor import load_model_file, predict_with_model, quantile_fields
 
-print("=" * 60)
-print("Testing CatBoost Model Loading")
-print("=" * 60)
-print()
-
-# Check if catboost is installed
-try:
-    from catboost import CatBoostRegressor
-    print("✅ CatBoost library is installed")
-except ImportError as e:
-    print(f"❌ CatBoost library not installed: {e}")
-    print("   Install with: pip install catboost")
-    sys.exit(1)
-
-# Check model file location
 script_dir = os.path.dirname(os.path.abspath(__file__))
-model_path = os.path.join(script_dir, 'catboost_lifespan_model.cbm')
+DEFAULT_PRODUCTION_MODEL = os.path.join(script_dir, 'catboost_lifespan_model.cbm')
+DEFAULT_GOLDEN_DATASET = os.path.join(script_dir, 'golden_lifespan_dataset.csv')
+GOLDEN_COLUMNS = [
+    'item_id', 'category', 'years_in_use', 'maintenance_count', 'condition_number',
+    'condition_status', 'condition', 'last_reason', 'target'
+]
 
-print(f"📁 Script directory: {script_dir}")
-print(f"📁 Model file path: {model_path}")
-print(f"📁 File exists: {os.path.exists(model_path)}")
 
-if not os.path.exists(model_path):
-    print()
-    print("❌ Model file not found!")
-    print(f"   Expected location: {model_path}")
-    sys.exit(1)
-
-# Check file size
-file_size = os.path.getsize(model_path) / (1024 * 1024)
-print(f"📊 File size: {file_size:.2f} MB")
-
-# Try to load the model
-print()
-print("🔄 Attempting to load model...")
-try:
-    model = CatBoostRegressor()
-    model.load_model(model_path)
-    print("✅ Model loaded successfully!")
-    print("✅ CatBoost model is VALID and can be used!")
-    print()
+def freeze_golden_dataset(path, dump_path=None):
+    """
+    Snapshot the current training rows from the database (or a pg_dump file) into
+    the golden CSV.
+    """
+    from train_lifespan_model import load_training_data_from_database
+
+    if dump_path is not None:
+        import sqlite3
+
+        from score_lifespan_items import seed_sqlite
+
+        conn = sqlite3.connect(':memory:')
+        seed_sqlite(conn, dump_path)
+        df = load_training_data_from_database(conn, 'sqlite')
+    else:
+        df = load_training_data_from_database()
+    df['target'] = pd.to_numeric(df['target'], errors='coerce')
+    df = df[(df['target'] >= 0) & (df['target'] <= 8)]
+    df[GOLDEN_COLUMNS].to_csv(path, index=False)
+    print(f"✅ Golden dataset frozen: {len(df)} rows -> {path}")
+
+
+def load_golden_dataset(path):
+    """
+    Load the golden dataset as request-style item dicts plus the target array.
+    """
+    df = pd.read_csv(path, keep_default_na=False)
+    missing = [col for col in GOLDEN_COLUMNS if col not in df.columns]
+    if missing:
+        raise ValueError(f"Golden dataset is missing columns: {missing}")
+    targets = pd.to_numeric(df['target'], errors='coerce').to_numpy(dtype=np.float64)
+    items = df.drop(columns=['target']).to_dict(orient='records')
+    return items, targets
+
+
+def predict_items(model, items):
+    """
+    Predict through the API's model path (predict_with_model): featurization,
+    clipping and the disposal override included. Unlike the endpoint there is no
+    manual fallback - a model that fails to predict fails the gate.
+
+    Returns the predict_with_model() result; for a MultiQuantile model
+    'remaining_years' is the median band.
+    """
+    return predict_with_model(items, model)
+
+
+def score_accuracy(model, items, targets):
+    """
+    Return MAE and R² of the model's point estimates on the golden dataset. Quantile
+    models also report, per band, the share of targets at or below it ('coverage',
+    ideally close to the band's level).
+    """
+    result = predict_items(model, items)
+    predictions = np.asarray(result['remaining_years'], dtype=np.float64)
+    errors = predictions - targets
+    ss_total = np.sum((targets - targets.mean()) ** 2)
+    accuracy = {
+        'mae': float(np.mean(np.abs(errors))),
+        'r2': float(1 - np.sum(errors ** 2) / ss_total) if ss_total > 0 else 0.0,
+    }
+    bands = quantile_fields(result)
+    if bands:
+        accuracy['coverage'] = {
+            field: float(np.mean(targets <= np.asarray(result[field], dtype=np.float64) + 1e-9)) for field in bands
+        }
+    return accuracy
+
+
+def measure_performance(model, items, batch_sizes, repeats):
+    """
+    Measure median latency and peak traced memory for each batch size.
+
+    Batches are drawn (with replacement) from the golden rows so the feature mix
+    matches real traffic. Peak memory covers Python and NumPy allocations
+    (CatBoost's native allocations are not visible to tracemalloc).
+    """
+    rng = np.random.default_rng(42)
+    results = {}
+    for batch_size in batch_sizes:
+        batch = [items[i] for i in rng.integers(0, len(items), batch_size)]
+        predict_items(model, batch)  # warm-up
+
+        timings = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            predict_items(model, batch)
+            timings.append(time.perf_counter() - start)
+
+        tracemalloc.start()
+        predict_items(model, batch)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        results[batch_size] = {
+            'latency_ms': float(np.median(timings) * 1000),
+            'peak_memory_kb': peak / 1024,
+        }
+    return results
+
+
+def compare(candidate, production, args):
+    """
+    Compare candidate and production reports. Returns a list of failure messages.
+    """
+    failures = []
+    if candidate['accuracy']['mae'] > production['accuracy']['mae'] + args.max_mae_increase:
+        failures.append(
+            f"MAE regressed: {candidate['accuracy']['mae']:.3f} vs {production['accuracy']['mae']:.3f} "
+            f"(allowed +{args.max_mae_increase})"
+        )
+    if candidate['accuracy']['r2'] < production['accuracy']['r2'] - args.max_r2_drop:
+        failures.append(
+            f"R² regressed: {candidate['accuracy']['r2']:.3f} vs {production['accuracy']['r2']:.3f} "
+            f"(allowed -{args.max_r2_drop})"
+        )
+
+    for batch_size, cand in candidate['performance'].items():
+        prod = production['performance'][batch_size]
+        latency_limit = max(prod['latency_ms'] * (1 + args.max_latency_regression), args.latency_floor_ms)
+        if cand['latency_ms'] > latency_limit:
+            failures.append(
+                f"Latency regressed at batch {batch_size}: {cand['latency_ms']:.2f} ms vs "
+                f"{prod['latency_ms']:.2f} ms (limit {latency_limit:.2f} ms)"
+            )
+        memory_limit = max(prod['peak_memory_kb'] * (1 + args.max_memory_regression), args.memory_floor_kb)
+        if cand['peak_memory_kb'] > memory_limit:
+            failures.append(
+                f"Peak memory regressed at batch {batch_size}: {cand['peak_memory_kb']:.0f} KB vs "
+                f"{prod['peak_memory_kb']:.0f} KB (limit {memory_limit:.0f} KB)"
+            )
+    return failures
+
+
+def evaluate(label, path, items, targets, args):
+    """
+    Load a model and build its accuracy/performance report.
+    """
+    print(f"🔄 Loading {label} model: {path}")
+    try:
+        model = load_model_file(path)
+    except Exception as e:
+        print(f"❌ Failed to load {label} model!")
+        print(f"   Error: {e}")
+        print(f"   Error type: {type(e).__name__}")
+        sys.exit(1)
+    print(f"✅ {label.capitalize()} model loaded ({os.path.getsize(path) / 1024:.2f} KB)")
+
+    try:
+        report = {
+            'path': path,
+            'accuracy': score_accuracy(model, items, targets),
+            'performance': measure_performance(model, items, args.batch_sizes, args.repeats),
+        }
+    except Exception as e:
+        print(f"❌ {label.capitalize()} model failed to predict!")
+        print(f"   Error: {e}")
+        print(f"   Error type: {type(e).__name__}")
+        sys.exit(1)
+    print(f"   MAE: {report['accuracy']['mae']:.3f} years, R²: {report['accuracy']['r2']:.3f}")
+    for field, coverage in report['accuracy'].get('coverage', {}).items():
+        print(f"   {field}: {coverage * 100:.1f}% of targets at or below")
+    for batch_size, perf in report['performance'].items():
+        print(f"   batch {batch_size:>6}: {perf['latency_ms']:8.2f} ms, peak {perf['peak_memory_kb']:8.0f} KB")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Validate a lifespan model before deployment')
+    parser.add_argument('--candidate', default=DEFAULT_PRODUCTION_MODEL, help='Model to validate (.cbm or .npz)')
+    parser.add_argument('--production', default=DEFAULT_PRODUCTION_MODEL, help='Currently deployed model')
+    parser.add_argument('--golden', default=DEFAULT_GOLDEN_DATASET, help='Frozen golden dataset (CSV)')
+    parser.add_argument('--freeze-golden', action='store_true', help='Write the golden dataset from the database and exit')
+    parser.add_argument('--seed-from', default=None, help='With --freeze-golden: read the rows from this pg_dump file instead of PostgreSQL')
+    parser.add_argument('--batch-sizes', default='1,100,10000',
+                        type=lambda s: [int(x) for x in s.split(',')], help='Comma-separated batch sizes')
+    parser.add_argument('--repeats', type=int, default=5, help='Timed runs per batch size')
+    parser.add_argument('--max-mae-increase', type=float, default=0.05, help='Allowed MAE increase (years)')
+    parser.add_argument('--max-r2-drop', type=float, default=0.02, help='Allowed R² decrease')
+    parser.add_argument('--max-latency-regression', type=float, default=0.25, help='Allowed latency increase (fraction)')
+    parser.add_argument('--max-memory-regression', type=float, default=0.25, help='Allowed peak memory increase (fraction)')
+    parser.add_argument('--latency-floor-ms', type=float, default=2.0,
+                        help='Latencies below this are never treated as regressions (timer noise)')
+    parser.add_argument('--memory-floor-kb', type=float, default=1024,
+                        help='Peak memory below this is never treated as a regression')
+    parser.add_argument('--report', default=None, help='Write the full comparison as JSON to this path')
+    args = parser.parse_args()
+
     print("=" * 60)
-    print("SUCCESS: Model file is ready to use!")
+    print("CatBoost Lifespan Model Validation Gate")
     print("=" * 60)
-except Exception as e:
     print()
-    print("❌ Failed to load model!")
-    print(f"   Error: {e}")
-    print(f"   Error type: {type(e).__name__}")
-    import traceback
+
+    if args.freeze_golden:
+        freeze_golden_dataset(args.golden, args.seed_from)
+        return
+
+    if not os.path.exists(args.candidate):
+        print(f"❌ Candidate model not found: {args.candidate}")
+        sys.exit(1)
+    if not os.path.exists(args.golden):
+        print(f"❌ Golden dataset not found: {args.golden}")
+        print("   Freeze one with: python test_catboost_model.py --freeze-golden [--seed-from db_new.sql]")
+        sys.exit(1)
+
+    items, targets = load_golden_dataset(args.golden)
+    print(f"📊 Golden dataset: {len(items)} rows ({args.golden})")
+    print()
+
+    candidate = evaluate('candidate', args.candidate, items, targets, args)
+    failures = []
+    production = None
+    if os.path.exists(args.production) and os.path.abspath(args.production) != os.path.abspath(args.candidate):
+        print()
+        production = evaluate('production', args.production, items, targets, args)
+        failures = compare(candidate, production, args)
+    else:
+        print("ℹ️ No separate production model to compare against - load and scoring checks only")
+
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump({'candidate': candidate, 'production': production, 'failures': failures}, f, indent=2)
+
     print()
-    print("Full traceback:")
-    print(traceback.format_exc())
-    sys.exit(1)
+    print("=" * 60)
+    if failures:
+        print("FAILED: Candidate model must not be deployed")
+        for failure in failures:
+            print(f"   ❌ {failure}")
+        print("=" * 60)
+        sys.exit(1)
+    print("SUCCESS: Candidate model passed the validation gate")
+    print("=" * 60)
+
 
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+CPU Thread Budget for the ML API
+
+CatBoost, OpenMP and the BLAS behind NumPy each size their thread pools to every
+core on the host. With several API workers on one machine that oversubscribes the
+CPU: threads fight over cores and both latency and throughput get worse. This
+module splits a host-wide CPU budget between the workers and decides how many
+threads each inference call may use:
+
+- BLAS/OpenMP pools are capped at startup (the server's BLAS work is tiny per-item
+  regressions, so one thread each is the right default)
+- model inference runs single-threaded for small requests, where thread start-up
+  and synchronisation cost more than they save, and fans out to the worker's full
+  share for whole-inventory batches
+
+apply_thread_limits() must run before NumPy is imported to affect BLAS pools sized
+from environment variables; threadpoolctl (if installed) also caps pools that are
+already loaded.
+
+Environment:
+    ML_API_CPU_BUDGET         Cores available to all API workers on this host (default: all)
+    ML_API_WORKERS            Worker processes sharing that budget (default 1)
+    ML_API_BLAS_THREADS       BLAS/OpenMP threads per worker (default 1)
+    ML_API_SMALL_BATCH_ITEMS  Requests up to this many items predict single-threaded (default 1000)
+    ML_API_ITEMS_PER_THREAD   Items per extra inference thread above that (default 10000)
+"""
+
+import math
+import os
+
+CPU_BUDGET = int(os.getenv('ML_API_CPU_BUDGET', str(os.cpu_count() or 1)))
+WORKERS = max(1, int(os.getenv('ML_API_WORKERS', '1')))
+BLAS_THREADS = max(1, int(os.getenv('ML_API_BLAS_THREADS', '1')))
+SMALL_BATCH_ITEMS = int(os.getenv('ML_API_SMALL_BATCH_ITEMS', '1000'))
+ITEMS_PER_THREAD = max(1, int(os.getenv('ML_API_ITEMS_PER_THREAD', '10000')))
+
+# Each worker's share of the budget
+THREADS_PER_WORKER = max(1, CPU_BUDGET // WORKERS)
+
+# Read by OpenBLAS, MKL, Accelerate, BLIS, numexpr and OpenMP runtimes when they load
+THREAD_ENV_VARS = (
+    'OMP_NUM_THREADS',
+    'OPENBLAS_NUM_THREADS',
+    'MKL_NUM_THREADS',
+    'VECLIB_MAXIMUM_THREADS',
+    'BLIS_NUM_THREADS',
+    'NUMEXPR_NUM_THREADS',
+)
+
+
+def apply_thread_limits(blas_threads=BLAS_THREADS):
+    """
+    Cap BLAS/OpenMP thread pools for this process. Variables already set in the
+    environment are left alone, so an operator can still override them.
+
+    Returns:
+        Dict describing the applied budget (also useful for /health)
+    """
+    for name in THREAD_ENV_VARS:
+        os.environ.setdefault(name, str(blas_threads))
+
+    try:
+        from threadpoolctl import threadpool_limits
+    except ImportError:
+        pass
+    else:
+        # Pools already loaded (e.g. NumPy imported first) ignore the variables above
+        threadpool_limits(limits=int(os.environ['OMP_NUM_THREADS']))
+
+    return budget_info()
+
+
+def inference_thread_count(items):
+    """
+    Threads one model prediction over `items` rows should use: 1 for small
+    requests, then one more per ITEMS_PER_THREAD items, up to the worker's share.
+    """
+    if items <= SMALL_BATCH_ITEMS:
+        return 1
+    return max(1, min(THREADS_PER_WORKER, math.ceil(items / ITEMS_PER_THREAD)))
+
+
+def budget_info():
+    return {
+        'cpu_budget': CPU_BUDGET,
+        'workers': WORKERS,
+        'threads_per_worker': THREADS_PER_WORKER,
+        'blas_threads': int(os.environ.get('OMP_NUM_THREADS', BLAS_THREADS)),
+    }
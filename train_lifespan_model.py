@@ -10,6 +10,8 @@ Prerequisites:
 Usage:
 1. Update database connection settings below if needed
 2. Run: python train_lifespan_model.py
+   (or: python train_lifespan_model.py --quantiles 0.1,0.5,0.9 for one MultiQuantile model
+   that also serves pessimistic/optimistic remaining-life bands)
 3. Place the generated catboost_lifespan_model.cbm file in the same directory as ml_api_server.py
 4. Restart your Python ML API server
 
@@ -21,9 +23,11 @@ import numpy as np
 from catboost import CatBoostRegressor
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
+import argparse
 import os
 import logging
 import sys
+from lifespan_db import connect_to_database, item_feature_columns, ITEM_FEATURE_JOINS, NON_CONSUMABLE_ITEMS_FILTER
 
 # Configure logging
 logging.basicConfig(
@@ -32,70 +36,32 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def load_training_data_from_database():
+def load_training_data_from_database(conn=None, dialect='postgresql'):
     """
     Load training data directly from PostgreSQL database.
     
     Uses existing lifespan predictions (lifespan_estimate or remaining_years) as training targets.
     As you collect more actual outcomes (items that reached end of life), retrain the model
     for better accuracy.
-    """
-    try:
-        import psycopg2
-    except ImportError:
-        logger.error("❌ psycopg2-binary not installed. Install with: pip install psycopg2-binary")
-        sys.exit(1)
     
-    # Database connection settings
-    # Update these if your database credentials are different
-    DB_HOST = os.getenv('DB_HOST', '127.0.0.1')
-    DB_PORT = os.getenv('DB_PORT', '5432')
-    DB_NAME = os.getenv('DB_DATABASE', 'nia_db')
-    DB_USER = os.getenv('DB_USERNAME', 'postgres')
-    DB_PASSWORD = os.getenv('DB_PASSWORD', '100676')
-    
-    logger.info("=" * 60)
-    logger.info("Connecting to database...")
-    logger.info(f"Host: {DB_HOST}, Database: {DB_NAME}")
+    Args:
+        conn: Open connection to read from (closed afterwards); default: connect with the DB_* env vars
+        dialect: 'postgresql' or 'sqlite' (local stand-in seeded from a dump)
+    """
+    if conn is None:
+        conn = connect_to_database()
     
-    try:
-        conn = psycopg2.connect(
-            host=DB_HOST,
-            port=DB_PORT,
-            database=DB_NAME,
-            user=DB_USER,
-            password=DB_PASSWORD
-        )
-    except Exception as e:
-        logger.error(f"❌ Failed to connect to database: {e}")
-        logger.info("\n💡 Check your database connection settings:")
-        logger.info(f"   DB_HOST={DB_HOST}")
-        logger.info(f"   DB_PORT={DB_PORT}")
-        logger.info(f"   DB_NAME={DB_NAME}")
-        logger.info(f"   DB_USER={DB_USER}")
-        sys.exit(1)
+    if dialect == 'sqlite':
+        whole_years = "CAST((julianday('now') - julianday(i.date_acquired)) / 365.25 AS INTEGER)"
+        greatest = 'MAX'
+    else:
+        whole_years = "EXTRACT(YEAR FROM AGE(CURRENT_DATE, i.date_acquired))"
+        greatest = 'GREATEST'
     
     # Query to get items with their features and targets
-    query = """
+    query = f"""
     SELECT 
-        i.id as item_id,
-        COALESCE(c.category, 'Unknown') as category,
-        EXTRACT(YEAR FROM AGE(CURRENT_DATE, i.date_acquired)) as years_in_use,
-        COALESCE(i.maintenance_count, 0) as maintenance_count,
-        CASE 
-            WHEN cn.condition_number ~ '^A([0-9]+)$' 
-            THEN CAST(SUBSTRING(cn.condition_number FROM 'A([0-9]+)') AS INTEGER)
-            ELSE 0
-        END as condition_number,
-        COALESCE(cn.condition_status, 'Unknown') as condition_status,
-        COALESCE(cond.condition, 'Unknown') as condition,
-        COALESCE((
-            SELECT reason 
-            FROM maintenance_records 
-            WHERE item_id = i.id 
-            ORDER BY maintenance_date DESC 
-            LIMIT 1
-        ), '') as last_reason,
+        {item_feature_columns(dialect)},
         -- Use remaining_years if available, otherwise calculate from lifespan_estimate
         -- If condition is R, Disposal, or Non-Serviceable, set target to 0 (dispose immediately)
         CASE 
@@ -105,17 +71,13 @@ def load_training_data_from_database():
             ELSE COALESCE(i.remaining_years, 
                 CASE 
                     WHEN i.lifespan_estimate IS NOT NULL AND i.lifespan_estimate > 0
-                    THEN GREATEST(0, i.lifespan_estimate - EXTRACT(YEAR FROM AGE(CURRENT_DATE, i.date_acquired)))
+                    THEN {greatest}(0, i.lifespan_estimate - {whole_years})
                     ELSE NULL
                 END
             )
         END as target
-    FROM items i
-    LEFT JOIN categories c ON i.category_id = c.id
-    LEFT JOIN condition_numbers cn ON i.condition_number_id = cn.id
-    LEFT JOIN conditions cond ON i.condition_id = cond.id
-    WHERE i.deleted_at IS NULL
-        AND (c.category IS NULL OR (LOWER(c.category) NOT LIKE '%supply%' AND LOWER(c.category) NOT LIKE '%consumable%'))
+    {ITEM_FEATURE_JOINS}
+    WHERE {NON_CONSUMABLE_ITEMS_FILTER}
         AND (
             i.remaining_years IS NOT NULL 
             OR (i.lifespan_estimate IS NOT NULL AND i.lifespan_estimate > 0)
@@ -216,9 +178,22 @@ def prepare_features(df):
     
     return feature_df, data
 
-def train_model(X, y, test_size=0.2, random_state=42):
+def parse_quantiles(value):
+    """Comma-separated quantile levels for --quantiles, sorted (e.g. '0.1,0.5,0.9')."""
+    try:
+        levels = sorted({float(v) for v in value.split(',') if v.strip()})
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid quantile levels: {value}")
+    if len(levels) < 2 or not all(0 < q < 1 for q in levels):
+        raise argparse.ArgumentTypeError("Give at least two quantile levels between 0 and 1, e.g. 0.1,0.5,0.9")
+    return levels
+
+def train_model(X, y, test_size=0.2, random_state=42, quantiles=None):
     """
     Train CatBoost model with cross-validation.
+    
+    With quantiles, a single MultiQuantile model is trained: one predict call returns
+    one column per level, and the level closest to 0.5 is the point estimate.
     """
     logger.info("=" * 60)
     logger.info(f"Training model on {len(X)} samples...")
@@ -238,13 +213,16 @@ def train_model(X, y, test_size=0.2, random_state=42):
     logger.info(f"   Std Dev: {np.std(y):.2f}")
     
     # Train CatBoost model with hyperparameters optimized for regression
-    logger.info(f"\n🚀 Training CatBoost model...")
+    loss_function = 'RMSE'
+    if quantiles:
+        loss_function = f"MultiQuantile:alpha={','.join(f'{q:g}' for q in quantiles)}"
+    logger.info(f"\n🚀 Training CatBoost model ({loss_function})...")
     model = CatBoostRegressor(
         iterations=1000,              # Maximum iterations
         learning_rate=0.1,           # Learning rate
         depth=6,                     # Tree depth
-        loss_function='RMSE',        # Root Mean Squared Error
-        eval_metric='RMSE',          # Evaluation metric
+        loss_function=loss_function, # RMSE, or MultiQuantile for uncertainty bands
+        eval_metric=loss_function,   # Evaluation metric
         random_seed=42,              # For reproducibility
         verbose=100,                 # Print progress every 100 iterations
         early_stopping_rounds=50,    # Stop if no improvement for 50 rounds
@@ -261,8 +239,12 @@ def train_model(X, y, test_size=0.2, random_state=42):
         plot=False
     )
     
-    # Evaluate model performance
+    # Evaluate model performance (the median column for quantile models)
     y_pred = model.predict(X_test)
+    bands = None
+    if quantiles:
+        bands = np.clip(np.sort(y_pred, axis=1), 0.0, 8.0)
+        y_pred = bands[:, int(np.argmin(np.abs(np.asarray(quantiles) - 0.5)))]
     
     mae = mean_absolute_error(y_test, y_pred)
     rmse = np.sqrt(mean_squared_error(y_test, y_pred))
@@ -274,6 +256,11 @@ def train_model(X, y, test_size=0.2, random_state=42):
     logger.info(f"   Mean Absolute Error (MAE): {mae:.2f} years")
     logger.info(f"   Root Mean Squared Error (RMSE): {rmse:.2f} years")
     logger.info(f"   R² Score: {r2:.3f} ({r2*100:.1f}% variance explained)")
+    if bands is not None:
+        # Calibration: share of test targets at or below each band should be close to its level
+        for j, q in enumerate(quantiles):
+            logger.info(f"   p{q * 100:g}: {np.mean(y_test <= bands[:, j] + 1e-9) * 100:.1f}% of targets at or below (expected {q * 100:g}%)")
+        logger.info(f"   Mean band width (p{quantiles[0] * 100:g}-p{quantiles[-1] * 100:g}): {np.mean(bands[:, -1] - bands[:, 0]):.2f} years")
     
     # Feature importance
     feature_importance = pd.DataFrame({
@@ -296,6 +283,12 @@ def main():
     """
     Main training function.
     """
+    parser = argparse.ArgumentParser(description='Train the CatBoost lifespan model')
+    parser.add_argument('--quantiles', type=parse_quantiles, default=None,
+                        help='Train one MultiQuantile model for these levels, e.g. 0.1,0.5,0.9 (default: RMSE point estimate)')
+    parser.add_argument('--output', default='catboost_lifespan_model.cbm', help='Model file to write')
+    args = parser.parse_args()
+    
     logger.info("=" * 60)
     logger.info("🤖 CatBoost Lifespan Model Training")
     logger.info("=" * 60)
@@ -371,7 +364,7 @@ def main():
     
     # Train model
     try:
-        model, metrics = train_model(X, y)
+        model, metrics = train_model(X, y, quantiles=args.quantiles)
     except Exception as e:
         logger.error(f"❌ Training failed: {e}")
         import traceback
@@ -379,16 +372,31 @@ def main():
         return
     
     # Save model
-    model_path = 'catboost_lifespan_model.cbm'
+    model_path = args.output
     try:
         model.save_model(model_path)
         logger.info("=" * 60)
         logger.info(f"✅ Model saved successfully!")
         logger.info(f"   File: {model_path}")
         logger.info(f"   File size: {os.path.getsize(model_path) / 1024:.2f} KB")
+        
+        # Export the trees for catboost-free serving (see lifespan_tree_evaluator.py)
+        from lifespan_tree_evaluator import export_oblivious_trees
+        npz_path = export_oblivious_trees(model, os.path.splitext(model_path)[0] + '.npz', model_path=model_path)
+        logger.info(f"   NumPy export: {npz_path} ({os.path.getsize(npz_path) / 1024:.2f} KB)")
+        
+        # Training distribution the API compares live traffic against (see drift_monitor.py)
+        from drift_monitor import build_reference_profile, reference_path, save_reference_profile
+        from lifespan_predictor import predict_with_model
+        from lifespan_tree_evaluator import file_sha256
+        predictions = predict_with_model(df, model)['remaining_years']
+        profile_path = save_reference_profile(
+            build_reference_profile(df, predictions, file_sha256(model_path)), reference_path(model_path)
+        )
+        logger.info(f"   Drift reference profile: {profile_path}")
         logger.info("=" * 60)
         logger.info("\n📁 Next Steps:")
-        logger.info(f"   1. Copy {model_path} to the directory containing ml_api_server.py")
+        logger.info(f"   1. Copy {model_path} (and the .npz / .drift.json files next to it) to the directory containing ml_api_server.py")
         logger.info(f"   2. Or place it in one of these locations:")
         logger.info(f"      - {os.path.abspath(model_path)}")
         logger.info(f"      - models/{model_path}")
@@ -0,0 +1,284 @@
+"""
+Wire Formats for the Prediction Endpoints
+
+Content negotiation between the default object-per-item JSON and two bulk formats:
+
+- Columnar JSON (Content-Type / Accept: application/vnd.irrigtrack.columnar+json):
+  "items" is an object with one array per field instead of an array of objects.
+- MessagePack (application/msgpack, requires the optional `msgpack` package): the same
+  columnar layout, where numeric columns may be sent as typed binary arrays
+  {"dtype": "<f8", "data": <bytes>} that decode straight into NumPy arrays.
+
+Requests are decoded by Content-Type; responses follow the Accept header and mirror
+the request format when no specific type is asked for. JSON responses are written
+with orjson when it is installed (falling back to the standard library), and large
+responses are compressed with zstd or gzip according to Accept-Encoding.
+
+Usage:
+    data, request_format = decode_request(request)
+    response_format = negotiate_response_format(request, request_format)
+    return encode_response(payload, response_format)
+"""
+
+import gzip
+import json
+import os
+
+import numpy as np
+import pandas as pd
+from flask import Response
+from werkzeug.http import parse_accept_header, parse_options_header
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+JSON = 'application/json'
+COLUMNAR_JSON = 'application/vnd.irrigtrack.columnar+json'
+MSGPACK = 'application/msgpack'
+MSGPACK_TYPES = (MSGPACK, 'application/x-msgpack', 'application/vnd.msgpack')
+
+# Accept header media type -> format name
+RESPONSE_FORMATS = {JSON: 'json', COLUMNAR_JSON: 'columnar', **{t: 'msgpack' for t in MSGPACK_TYPES}}
+
+# Responses smaller than this are sent uncompressed
+COMPRESS_MIN_BYTES = int(os.getenv('ML_API_COMPRESS_MIN_BYTES', '1024'))
+GZIP_LEVEL = int(os.getenv('ML_API_GZIP_LEVEL', '5'))
+ZSTD_LEVEL = int(os.getenv('ML_API_ZSTD_LEVEL', '3'))
+
+# WSGI environ key for a body decoded before the request reached Flask
+DECODED_BODY_KEY = 'irrigtrack.decoded_body'
+
+# Per-item fields left out of compact responses (besides nulls and a method that
+# repeats the top-level one)
+COMPACT_DROP_FIELDS = ('note',)
+
+
+class WireFormatError(ValueError):
+    """Request body could not be decoded; carries the HTTP status to return."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def decode_request(req):
+    """
+    Decode a request body according to its Content-Type.
+
+    Returns:
+        Tuple of (decoded body dict or None, format name). For 'columnar' and
+        'msgpack' bodies, data['items'] is a dict of equal-length columns.
+    """
+    # Already decoded by the ASGI entry point on its event loop
+    decoded = req.environ.get(DECODED_BODY_KEY)
+    if decoded is not None:
+        return decoded
+
+    mimetype = req.mimetype
+    if mimetype == COLUMNAR_JSON or mimetype in MSGPACK_TYPES:
+        return decode_body(req.get_data(), mimetype)
+
+    # Default: object-per-item JSON, parsed exactly as before
+    return req.json, 'json'
+
+
+def decode_body(body, mimetype):
+    """
+    Decode raw body bytes of the given mimetype without a request object.
+
+    Returns:
+        Tuple of (decoded body, format name), as decode_request(). Invalid bulk
+        bodies raise WireFormatError, invalid JSON raises ValueError.
+    """
+    if mimetype == COLUMNAR_JSON:
+        try:
+            data = json.loads(body)
+        except ValueError as e:
+            raise WireFormatError(f'Invalid columnar JSON body: {e}')
+        return _check_columns(data), 'columnar'
+
+    if mimetype in MSGPACK_TYPES:
+        if msgpack is None:
+            raise WireFormatError('MessagePack is not available on this server (pip install msgpack)', status=415)
+        try:
+            data = msgpack.unpackb(body, raw=False)
+        except Exception as e:
+            raise WireFormatError(f'Invalid MessagePack body: {e}')
+        return _check_columns(data), 'msgpack'
+
+    return json.loads(body), 'json'
+
+
+def predecode_body(body, content_type):
+    """
+    Decode a body ahead of the request handler (see ml_api_asgi.py). Returns None
+    for bodies the handler should decode itself - other content types, and invalid
+    bodies, so the handler answers with its usual error.
+    """
+    mimetype = parse_options_header(content_type)[0].lower()
+    is_json = mimetype == JSON or (mimetype.startswith('application/') and mimetype.endswith('+json'))
+    if not body or not (is_json or mimetype in MSGPACK_TYPES):
+        return None
+    try:
+        return decode_body(body, mimetype)
+    except Exception:
+        return None
+
+
+def _check_columns(data):
+    if not isinstance(data, dict) or 'items' not in data:
+        return data
+    columns = data['items']
+    if not isinstance(columns, dict):
+        raise WireFormatError('Columnar "items" must be an object with one array per field')
+
+    decoded = {name: decode_column(values) for name, values in columns.items()}
+    lengths = {len(values) for values in decoded.values()}
+    if len(lengths) > 1:
+        raise WireFormatError('All columns in "items" must have the same length')
+    data['items'] = decoded
+    return data
+
+
+def decode_column(values):
+    """Turn a typed binary column into a NumPy array; other columns are returned as-is."""
+    if isinstance(values, dict) and 'dtype' in values and 'data' in values:
+        try:
+            return np.frombuffer(values['data'], dtype=np.dtype(values['dtype']))
+        except (TypeError, ValueError) as e:
+            raise WireFormatError(f'Invalid typed column: {e}')
+    if not isinstance(values, (list, np.ndarray)):
+        raise WireFormatError('Each column in "items" must be an array')
+    return values
+
+
+def columns_to_frame(columns):
+    """DataFrame with one column per field (no per-item dicts are built)."""
+    return pd.DataFrame(columns)
+
+
+def columns_to_rows(columns):
+    """Convert columns back to a list of per-item dicts for row-oriented code."""
+    names = list(columns)
+    values = [v.tolist() if isinstance(v, np.ndarray) else v for v in columns.values()]
+    return [dict(zip(names, row)) for row in zip(*values)]
+
+
+def rows_to_columns(rows):
+    """Convert a list of dicts to columns (fields missing from a row become None)."""
+    names = list(dict.fromkeys(name for row in rows for name in row))
+    return {name: [row.get(name) for row in rows] for name in names}
+
+
+def negotiate_response_format(req, request_format):
+    """
+    Pick the response format from the Accept header. Without a specific preference
+    the response mirrors the request format; unknown types get the default JSON.
+    """
+    accept = req.accept_mimetypes
+    if not accept.provided or accept.best == '*/*':
+        return request_format
+    best = accept.best_match(list(RESPONSE_FORMATS))
+    if best is None:
+        return 'json'
+    if RESPONSE_FORMATS[best] == 'msgpack' and msgpack is None:
+        return 'columnar'
+    return RESPONSE_FORMATS[best]
+
+
+def encode_response(payload, response_format):
+    """
+    Encode a response payload. For the columnar formats the caller passes columns
+    (lists or NumPy arrays) in place of lists of per-item dicts.
+    """
+    if response_format == 'columnar':
+        return Response(dumps_json(payload), mimetype=COLUMNAR_JSON)
+    if response_format == 'msgpack':
+        return Response(msgpack.packb(payload, default=_msgpack_default, use_bin_type=True), mimetype=MSGPACK)
+    return Response(dumps_json(payload), mimetype=JSON)
+
+
+def dumps_json(payload):
+    """
+    Serialize to compact JSON bytes with sorted keys (the same layout as jsonify).
+    NumPy arrays and scalars are written directly.
+    """
+    if orjson is not None:
+        return orjson.dumps(payload, default=_json_default, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_SORT_KEYS)
+    return json.dumps(payload, default=_json_default, sort_keys=True, separators=(',', ':')).encode('utf-8')
+
+
+def wants_compact(req):
+    """Compact responses are opt-in with ?compact=1 (or true/yes)."""
+    return req.args.get('compact', '').lower() in ('1', 'true', 'yes')
+
+
+def compact_records(records, method=None):
+    """
+    Drop fields that carry no information per item: nulls, notes, and a 'method'
+    equal to the method reported once at the top of the response.
+    """
+    return [
+        {k: v for k, v in record.items()
+         if v is not None and k not in COMPACT_DROP_FIELDS and not (k == 'method' and v == method)}
+        for record in records
+    ]
+
+
+def compress_response(response, accept_encoding):
+    """
+    Compress a response body with zstd (if zstandard is installed and accepted) or
+    gzip, as negotiated with the Accept-Encoding header: the coding with the higher
+    q-value wins (zstd on a tie), and codings with q=0 are never used.
+    """
+    if (response.direct_passthrough or response.status_code != 200
+            or 'Content-Encoding' in response.headers):
+        return response
+    body = response.get_data()
+    if len(body) < COMPRESS_MIN_BYTES:
+        return response
+
+    # q-values decide: "gzip;q=0" refuses gzip, "*" accepts any coding
+    accepted = parse_accept_header(accept_encoding)
+    zstd_q = accepted.quality('zstd') if zstandard is not None else 0
+    gzip_q = accepted.quality('gzip')
+    if zstd_q > 0 and zstd_q >= gzip_q:
+        encoding, compressed = 'zstd', zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body)
+    elif gzip_q > 0:
+        encoding, compressed = 'gzip', gzip.compress(body, compresslevel=GZIP_LEVEL)
+    else:
+        return response
+
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def _json_default(value):
+    if isinstance(value, (np.ndarray, np.generic)):
+        return value.tolist()
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+def _msgpack_default(value):
+    if isinstance(value, np.ndarray):
+        if value.dtype.kind in 'biuf':
+            array = np.ascontiguousarray(value)
+            return {'dtype': array.dtype.str, 'data': array.tobytes()}
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f'Object of type {type(value).__name__} is not MessagePack serializable')